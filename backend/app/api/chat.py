@@ -1,29 +1,45 @@
 from pydantic import BaseModel
-from fastapi import APIRouter, HTTPException, Path, Body
+from fastapi import APIRouter, HTTPException, Path, Body, Query, Header, Response
+from fastapi.responses import StreamingResponse
 from app.services.redis_service import redis_service
 from app.services.chat_service import chat_service
 from app.services.itinerary_service import itinerary_service
+from app.services.session_context import SessionContext
+from app.services.place_store_service import place_store_service
 from app.models.session import SessionState, Message, History, DailyItinerary
 import uuid
 from typing import Dict, Any, Optional
 from app.utils.prompts import PROMPT_FIRST_INPUT
-from app.db.mongodb import get_database
-from app.models.db_session import DbSession
 from typing import List
-from app.services.recommend_service import recommend_service
+from app.utils.metrics import metrics
+from app.utils.streaming import EventStream
+from datetime import datetime
+import asyncio
+import os
+
+# Sessions per page of /allSessions
+SESSION_PAGE_SIZE = int(os.getenv("SESSION_PAGE_SIZE", "50"))
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+# Keep streaming turns referenced until they finish
+_stream_tasks = set()
+
 class ChatRequest(BaseModel):
   user_id: str
   user_input: Optional[str] = None
   title: Optional[str] = None
   itinerary: Optional[List[DailyItinerary]] = None
   chat_idx: Optional[int] = None
+  cursor: Optional[str] = None # X-Next-Cursor of the previous page of /allSessions
+  limit: Optional[int] = None # Page size of /allSessions, or history entries returned by /{session_id}
+  before: Optional[int] = None # History page of /{session_id}: entries before this index
+  since_version: Optional[int] = None # Only what changed after this session version
 
 class AllSessionRes(BaseModel):
   session_id: str
   title: str
+  update_time: Optional[datetime] = None
 
 # New chat with or without prompt.
 # Suitable for both easy plan and chatting with ai
@@ -43,55 +59,101 @@ async def create_session(data: ChatRequest = Body(...)):
   return session_state
 
 # Get user's all sessions. Special routers must be placed ahead.
+# One page at a time, newest first, the cursor of the next page is sent in X-Next-Cursor.
 @router.post("/allSessions", response_model=List[AllSessionRes])
-async def get_session_with_userId(data: ChatRequest = Body(...)):
-  user_id = data.user_id
-  session_info = []
-  db = get_database()
-  sessions = await DbSession(db).get_sessions_by_user_id(user_id)
-  if len(sessions) == 0:
-    return session_info
-  for s in sessions:
-    session_info.append({"session_id": s.session_id, "title": s.title, "update_time": s.update_time, "short_term_profile": s.short_term_profile})
-  session_info.sort(key=lambda x: x["update_time"], reverse=True)
-  await recommend_service.update_longterm_profile(user_id, session_info)
-  return [AllSessionRes(**s) for s in session_info]
-
-# Get session when refresh or from history chats
+async def get_session_with_userId(response: Response, data: ChatRequest = Body(...)):
+  limit = min(max(data.limit or SESSION_PAGE_SIZE, 1), SESSION_PAGE_SIZE)
+  try:
+    sessions, next_cursor = await redis_service.list_sessions(data.user_id, limit, data.cursor)
+  except ValueError:
+    raise HTTPException(status_code=400, detail="Invalid cursor.")
+  if next_cursor:
+    response.headers["X-Next-Cursor"] = next_cursor
+  return [AllSessionRes(**s) for s in sessions]
+
+# Get session when refresh or from history chats.
+# With limit, only the newest history entries, older pages are read with before=history_start.
+# With since_version, only what changed after that version if the changelog still covers it.
+# The ETag is the session version, If-None-Match with the current one answers 304.
 @router.post("/{session_id}")
-async def get_session(session_id: str = Path(...), data: ChatRequest = Body(...)):
-  user_id = data.user_id
+async def get_session(
+  response: Response,
+  session_id: str = Path(...),
+  data: ChatRequest = Body(...),
+  if_none_match: Optional[str] = Header(None),
+):
+  return await _get_session(response, session_id, data.user_id, data.limit, data.before, data.since_version, if_none_match)
 
-  session_state = await redis_service.load_session_state(user_id, session_id)
-  history = await redis_service.get_history(user_id, session_id)
-  shortlist = await redis_service.get_shortlist(user_id, session_id)
-  
-  response = {
-    "messages": history,
-    "short_term_profile": session_state.short_term_profile,
-    "title": session_state.title,
+@router.get("/{session_id}")
+async def get_session_by_query(
+  response: Response,
+  session_id: str = Path(...),
+  user_id: str = Query(...),
+  limit: Optional[int] = Query(None, ge=1),
+  before: Optional[int] = Query(None, ge=0),
+  since_version: Optional[int] = Query(None, ge=0),
+  if_none_match: Optional[str] = Header(None),
+):
+  return await _get_session(response, session_id, user_id, limit, before, since_version, if_none_match)
+
+async def _get_session(response: Response, session_id: str, user_id: str, limit: Optional[int], before: Optional[int], since_version: Optional[int], if_none_match: Optional[str]):
+  if since_version is not None and before is None:
+    changes = await redis_service.load_session_changes(user_id, session_id, since_version)
+    if changes:
+      state, total, changed_history, changed_shortlist, fields = changes
+      etag = _session_etag(state)
+      if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+      response.headers["ETag"] = etag
+
+      indexes = list(changed_history)
+      messages, shortlist = await place_store_service.hydrate_session(list(changed_history.values()), changed_shortlist or [])
+      delta = {
+        "delta": True,
+        "version": state.version,
+        "history_total": total,
+        "history_changes": [{"index": idx, **message.model_dump()} for idx, message in zip(indexes, messages)],
+      }
+      if changed_shortlist is not None:
+        delta["shortlist"] = shortlist
+      if "title" in fields:
+        delta["title"] = state.title
+      if "short_term_profile" in fields:
+        delta["short_term_profile"] = state.short_term_profile
+      return delta
+
+  page = await redis_service.load_session_page(user_id, session_id, limit, before)
+  if not page:
+    raise HTTPException(status_code=404, detail="Session not found or expired. Please start a new session.")
+  state, history, start, total, shortlist = page
+  etag = _session_etag(state)
+  if if_none_match == etag and before is None:
+    return Response(status_code=304, headers={"ETag": etag})
+  response.headers["ETag"] = etag
+  messages, shortlist = await place_store_service.hydrate_session(history, shortlist)
+
+  return {
+    "messages": messages,
+    "short_term_profile": state.short_term_profile,
+    "title": state.title,
     "shortlist": shortlist,
+    "version": state.version,
+    "history_total": total,
+    "history_start": start,
   }
-  return response
+
+def _session_etag(state: SessionState) -> str:
+  return f'W/"{state.session_id}:{state.version}"'
 
 # Answer to user prompts, justify todo list, todo step, slots, update session info
 @router.post("/{session_id}/res", response_model=Dict[str, Any])
 async def chat_with_ai(session_id: str = Path(...), data: ChatRequest = Body(...)):
-  user_id = data.user_id
-  session_state = await redis_service.load_session_state(user_id, session_id)
-  if not session_state:
-    raise HTTPException(status_code=404, detail="Session not found or expired. Please start a new session.")
+  with metrics.timer("chat.res"):
+    return await _chat_with_ai(session_id, data)
 
+async def _chat_with_ai(session_id: str, data: ChatRequest):
+  ctx = await _start_turn(session_id, data)
   user_input = data.user_input
-  user_message_content = Message(
-    content=user_input
-  )
-  user_history_entry = History(
-    role="user",
-    message=user_message_content
-  )
-  # update session history with user prompts
-  await redis_service.append_history(session_state, user_history_entry)
 
   # todo_step = session_state.todo_step
   # first_prompt = None
@@ -105,9 +167,11 @@ async def chat_with_ai(session_id: str = Path(...), data: ChatRequest = Body(...
   #     session_state, user_input, first_prompt, session_state.todo[todo_step+1]
   #   )
   # else:
-  ai_response_text, session_state = await chat_service.orchestrate_planning_step(session_state, user_input)
-  
-  await redis_service.save_session_state(session_state)
+  try:
+    ai_response_text, session_state = await chat_service.orchestrate_planning_step(ctx, user_input)
+  finally:
+    # The user prompt is kept even if the turn fails
+    await ctx.commit()
   response = {
     "role": "ai",
     "message": ai_response_text,
@@ -116,6 +180,63 @@ async def chat_with_ai(session_id: str = Path(...), data: ChatRequest = Body(...
   
   return response
 
+# Same as /res, but answers as server-sent events: text tokens, then place cards as they resolve, then a done frame
+@router.post("/{session_id}/res/stream")
+async def chat_with_ai_stream(session_id: str = Path(...), data: ChatRequest = Body(...)):
+  ctx = await _start_turn(session_id, data)
+  stream = EventStream()
+
+  async def run_turn():
+    try:
+      with metrics.timer("chat.res.stream"):
+        try:
+          ai_response, state = await chat_service.orchestrate_planning_step(ctx, data.user_input, stream)
+        finally:
+          await ctx.commit()
+      # Carries the message as appended to history, with its places in full
+      await stream.emit("done", {
+        "role": "ai",
+        "message": ai_response,
+        "short_term_profile": state.short_term_profile
+      })
+    except Exception as e:
+      print(f"Error streaming response for {data.user_id}/{session_id}: {e}")
+      await stream.emit("error", {"detail": str(e)})
+    finally:
+      await stream.close()
+
+  # The turn runs to completion even if the client disconnects, so history stays consistent
+  task = asyncio.create_task(run_turn())
+  _stream_tasks.add(task)
+  task.add_done_callback(_stream_tasks.discard)
+
+  return StreamingResponse(
+    stream.events(),
+    media_type="text/event-stream",
+    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+  )
+
+async def _load_context(user_id: str, session_id: str) -> SessionContext:
+  ctx = await SessionContext.load(user_id, session_id)
+  if not ctx:
+    raise HTTPException(status_code=404, detail="Session not found or expired. Please start a new session.")
+  return ctx
+
+# Load session and store user prompt in history, committed together with the answer
+async def _start_turn(session_id: str, data: ChatRequest) -> SessionContext:
+  ctx = await _load_context(data.user_id, session_id)
+
+  user_message_content = Message(
+    content=data.user_input
+  )
+  user_history_entry = History(
+    role="user",
+    message=user_message_content
+  )
+  # update session history with user prompts
+  ctx.append_history(user_history_entry)
+  return ctx
+
 # Save title
 @router.post("/{session_id}/title")
 async def save_title(session_id: str = Path(...), data: ChatRequest = Body(...)):
@@ -137,12 +258,10 @@ async def save_itinerary(session_id: str = Path(...), data: ChatRequest = Body(.
   if not (itinerary and chat_idx):
     raise HTTPException(status_code=404, detail="No itinerary provided.")
   
-  session_state = await redis_service.load_session_state(user_id, session_id)
-
-  if not session_state:
-    raise HTTPException(status_code=404, detail="Session not found or expired. Please start a new session.")
+  ctx = await _load_context(user_id, session_id)
 
-  await redis_service.save_itinerary(session_state, itinerary, chat_idx)
+  if ctx.save_itinerary(itinerary, chat_idx):
+    await ctx.commit()
   return
 
 # Update routes when itinerary changes
@@ -155,13 +274,11 @@ async def update_itinerary(session_id: str = Path(...), data: ChatRequest = Body
   if not (itinerary and chat_idx):
     raise HTTPException(status_code=404, detail="No itinerary provided.")
   
-  session_state = await redis_service.load_session_state(user_id, session_id)
-
-  if not session_state:
-    raise HTTPException(status_code=404, detail="Session not found or expired. Please start a new session.")
+  ctx = await _load_context(user_id, session_id)
 
   new_itinerary = await itinerary_service.update_itinerary_time(itinerary)
-  await redis_service.save_itinerary(session_state, new_itinerary, chat_idx)
+  if ctx.save_itinerary(new_itinerary, chat_idx):
+    await ctx.commit()
 
   return new_itinerary
 
@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from app.utils.metrics import metrics
+from app.services.llm_cache_service import llm_cache_service
+from app.services.route_cache_service import route_cache_service
+from app.services.place_store_service import place_store_service
+from app.services.place_index_service import place_index_service
+from app.services.nearby_service import nearby_service
+from app.utils.intent_classifier import intent_classifier
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+# Counters, gauges and p50/p95/p99 latencies of the current worker
+@router.get("")
+async def get_metrics():
+  snapshot = metrics.snapshot()
+  snapshot["llm_cache"] = llm_cache_service.stats()
+  snapshot["route_cache"] = route_cache_service.stats()
+  snapshot["place_store"] = place_store_service.stats()
+  snapshot["place_index"] = place_index_service.stats()
+  snapshot["nearby"] = nearby_service.stats()
+  snapshot["intent"] = intent_classifier.stats()
+  return snapshot
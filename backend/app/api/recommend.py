@@ -1,10 +1,12 @@
 from fastapi import APIRouter, HTTPException, Body
 from app.services.redis_service import redis_service
 from app.models.recommend import LongTermProfile, UserBehavior
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from app.models.shortlist import ShortlistItem
 from app.services.recommend_service import recommend_service
+from app.services.place_store_service import place_store_service
+from app.services.nearby_service import nearby_service, NEARBY_MAX_RADIUS_KM
 
 class BehaviorTrack(BaseModel):
   userId:str
@@ -17,6 +19,18 @@ class PlaceReq(BaseModel):
 class TopicReq(BaseModel):
   user_id: str
 
+# Around a stored place, or around lat/lng
+class NearbyReq(BaseModel):
+  place_id: Optional[str] = None
+  lat: Optional[float] = Field(None, ge=-90, le=90)
+  lng: Optional[float] = Field(None, ge=-180, le=180)
+  radius_km: float = Field(2.0, gt=0, le=NEARBY_MAX_RADIUS_KM)
+  limit: int = Field(20, ge=1, le=100)
+
+class NearbyPlace(BaseModel):
+  place: ShortlistItem
+  distance_km: float
+
 router = APIRouter(prefix="/recommend", tags=["recommend"])
 
 # Store user behavior in redis
@@ -24,20 +38,18 @@ router = APIRouter(prefix="/recommend", tags=["recommend"])
 async def save_user_behavior(data: BehaviorTrack = Body(...)):
   session_id = data.sessionId
   user_id = data.userId
-  session_state = await redis_service.load_session_state(user_id, session_id)
+  updated = await redis_service.update_session_field(user_id, session_id, "current_user_behavior", data.events)
 
-  if not session_state:
+  if not updated:
     raise HTTPException(status_code=404, detail="Session not found or expired")
-  
-  session_state.current_user_behavior = data.events
-  await redis_service.save_session_state(session_state)
 
 # Fetch enriched place detail
 @router.post("/enrich")
 async def get_place_detail(req: PlaceReq = Body(...)) -> ShortlistItem:
   place_name = req.place_name
   
-  place = await recommend_service.enrich_place_detail(place_name)
+  # Queued ahead of background prefetch, joins the job if the place is already queued
+  place = await recommend_service.enrichment.enrich(place_name)
 
   return place
 
@@ -46,4 +58,22 @@ async def recommend_topics(req: TopicReq = Body(...)):
   user_id = req.user_id
   topics = await recommend_service.recommend_topics(user_id)
 
-  return topics
\ No newline at end of file
+  return topics
+
+# Places already stored near a place, closest first, without asking Google or the LLM
+@router.post("/nearby")
+async def get_nearby_places(req: NearbyReq = Body(...)) -> List[NearbyPlace]:
+  lat, lng = req.lat, req.lng
+  exclude = []
+  if req.place_id:
+    center = await place_store_service.get_by_id(req.place_id)
+    if center is None or center.geometry is None:
+      raise HTTPException(status_code=404, detail="Place not found or without location")
+    lat, lng = center.geometry.location
+    exclude.append(req.place_id)
+  if lat is None or lng is None:
+    raise HTTPException(status_code=400, detail="place_id or lat and lng required")
+
+  found = await nearby_service.nearby(lat, lng, req.radius_km, req.limit, exclude)
+  places = await place_store_service.get_many(place_id for place_id, _ in found)
+  return [NearbyPlace(place=places[place_id], distance_km=round(km, 3)) for place_id, km in found if place_id in places]
@@ -3,8 +3,11 @@ from pymongo import AsyncMongoClient
 from app.models.user_profile import UserProfile
 from app.models.user_preference import UserPreference
 from app.models.place_info import PlaceInfo
+from app.models.place_alias import PlaceAlias
 from app.models.db_session import DbSession
 from app.models.user_survey import UserSurvey
+from app.models.llm_cache import LLMCache
+from app.models.route_cache import RouteCache
 import os
 from dotenv import load_dotenv
 
@@ -15,8 +18,11 @@ class MongoDB:
     self.user_profile = None
     self.user_preference = None
     self.place_info = None
+    self.place_alias = None
     self.session = None
     self.survey = None
+    self.llm_cache = None
+    self.route_cache = None
 
   async def connect(self):
     """connect mongodb"""
@@ -27,8 +33,11 @@ class MongoDB:
       self.user_profile = UserProfile(self.db)
       self.user_preference = UserPreference(self.db)
       self.place_info = PlaceInfo(self.db)
+      self.place_alias = PlaceAlias(self.db)
       self.session = DbSession(self.db)
       self.survey = UserSurvey(self.db)
+      self.llm_cache = LLMCache(self.db)
+      self.route_cache = RouteCache(self.db)
       await self.client.admin.command('ping') 
       print("Successfully connected to MongoDB!")
     except ConnectionFailure as e:
@@ -1,15 +1,29 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from app.db.mongodb import mongodb
 from contextlib import asynccontextmanager
-from app.api import auth, chat, recommend, survey
+from app.api import auth, chat, recommend, survey, metrics
 from app.utils.async_listener import RedisExpiredListener
+from app.services.redis_service import redis_service, REDIS_URL
+from app.utils.intent_classifier import intent_classifier
+from app.services.google_maps_service import google_maps_service
+from app.services.llm_cache_service import llm_cache_service
+from app.services.place_index_service import place_index_service
+from app.services.recommend_service import recommend_service
+from app.utils.metrics import metrics as metrics_registry, request_scope
+from app.utils.single_flight import flight_notifier
 import asyncio
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
   await mongodb.connect()
-  listener = RedisExpiredListener("redis://localhost:6379/0")
+  await redis_service.connect()
+  redis_service.persistence.start()
+  await llm_cache_service.bust_stale_versions()
+  recommend_service.enrichment.start()
+  place_index_service.start()
+  intent_classifier.warm()
+  listener = RedisExpiredListener(REDIS_URL)
   task = asyncio.create_task(listener.listen())
 
   yield
@@ -19,6 +33,12 @@ async def lifespan(app: FastAPI):
     await task
   except asyncio.CancelledError:
     print("Redis listener task cancelled")
+  await recommend_service.enrichment.stop()
+  await place_index_service.stop()
+  await flight_notifier.close()
+  await google_maps_service.close()
+  await redis_service.persistence.drain()
+  await redis_service.close()
   await mongodb.close()
 
 app = FastAPI(title="YOURTravel", version="0.1", lifespan=lifespan)
@@ -29,12 +49,27 @@ app.add_middleware(
   allow_credentials=True,
   allow_methods=["*"],
   allow_headers=["*"],
+  expose_headers=["ETag", "X-Next-Cursor", "X-Redis-Roundtrips"],
 )
 
+# Redis round trips per request, as a response header and per route in GET /metrics.
+# For streamed answers only the round trips made before the first frame are in the header.
+@app.middleware("http")
+async def count_redis_roundtrips(request: Request, call_next):
+  with request_scope() as counts:
+    response = await call_next(request)
+  roundtrips = counts.get("redis.roundtrips", 0)
+  route = request.scope.get("route")
+  if route is not None:
+    metrics_registry.observe(f"redis.roundtrips:{route.path}", roundtrips)
+  response.headers["X-Redis-Roundtrips"] = str(roundtrips)
+  return response
+
 app.include_router(auth.router)
 app.include_router(chat.router)
 app.include_router(recommend.router)
 app.include_router(survey.router)
+app.include_router(metrics.router)
 
 @app.get("/")
 def root():
@@ -1,7 +1,8 @@
 import asyncio
-from pymongo import IndexModel, ASCENDING
+from pymongo import IndexModel, ASCENDING, DESCENDING
 from app.models.session import SessionState, History
-from typing import List
+from typing import List, Optional, Tuple
+from datetime import datetime
 from app.models.shortlist import ShortlistItem
 
 class DbSession:
@@ -11,7 +12,8 @@ class DbSession:
 
   async def _create_indexes(self):
     await self.collection.create_indexes([
-      IndexModel([("user_id", ASCENDING), ("session_id", ASCENDING)], unique = True)
+      IndexModel([("user_id", ASCENDING), ("session_id", ASCENDING)], unique = True),
+      IndexModel([("user_id", ASCENDING), ("update_time", DESCENDING), ("session_id", DESCENDING)]),
     ])
 
   async def get_sesssion(self, user_id: str, session_id: str) -> SessionState | None:
@@ -27,6 +29,30 @@ class DbSession:
     session_states = [SessionState(**doc) for doc in docs]
     return session_states
 
+  # Short-term profiles of a user's sessions, oldest first, without history and shortlist
+  async def get_profiles_by_user_id(self, user_id: str) -> List[dict]:
+    cursor = self.collection.find(
+      {"user_id": user_id},
+      {"_id": 0, "session_id": 1, "update_time": 1, "short_term_profile": 1}
+    ).sort([("update_time", ASCENDING), ("session_id", ASCENDING)])
+    return await cursor.to_list(length=None)
+
+  # One page of a user's sessions, newest first, only what the session list shows.
+  # before is the (update_time, session_id) of the last session of the previous page.
+  async def list_sessions(self, user_id: str, limit: int, before: Optional[Tuple[datetime, str]] = None) -> List[dict]:
+    query = {"user_id": user_id}
+    if before:
+      update_time, session_id = before
+      query["$or"] = [
+        {"update_time": {"$lt": update_time}},
+        {"update_time": update_time, "session_id": {"$lt": session_id}},
+      ]
+    cursor = self.collection.find(
+      query,
+      {"_id": 0, "session_id": 1, "title": 1, "update_time": 1}
+    ).sort([("update_time", DESCENDING), ("session_id", DESCENDING)]).limit(limit)
+    return await cursor.to_list(length=limit)
+
   async def delete_session(self, user_id: str, session_id: str):
     result = await self.collection.delete_one({"user_id": user_id, "session_id": session_id})
 
@@ -66,3 +92,14 @@ class DbSession:
     
     if result.matched_count <= 0:
       print(f"MongoDB: No session found for user {user_id}, session {session_id} to update history.")
+
+  # Several parts of one session written in a single update
+  async def save_session_fields(self, user_id: str, session_id: str, fields: dict):
+    result = await self.collection.update_one(
+      {"user_id": user_id, "session_id": session_id},
+      {"$set": fields},
+      upsert=True
+    )
+
+    if result.matched_count <= 0:
+      print(f"MongoDB: No session found for user {user_id}, session {session_id}, created a new one.")
@@ -0,0 +1,33 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Optional
+from pymongo import IndexModel, ASCENDING
+
+# Durable tier of the LLM response cache, Redis keeps the hot entries
+class LLMCache:
+  def __init__(self, db):
+    self.collection = db["llm_cache"]
+    self._init_task = asyncio.create_task(self._create_indexes())
+
+  async def _create_indexes(self):
+    await self.collection.create_indexes([
+      IndexModel([("key", ASCENDING)], unique=True),
+      IndexModel([("expire_at", ASCENDING)], expireAfterSeconds=0),
+    ])
+
+  async def get_entry(self, key: str) -> Optional[Any]:
+    data = await self.collection.find_one({"key": key, "expire_at": {"$gt": datetime.now(timezone.utc)}}, {"value": 1})
+    return data.get("value") if data else None
+
+  async def save_entry(self, key: str, chain: str, version: str, value: Any, expire_at: datetime):
+    await self.collection.update_one(
+      {"key": key},
+      {"$set": {"chain": chain, "version": version, "value": value, "expire_at": expire_at}},
+      upsert=True
+    )
+
+  async def delete_chain(self, chain: str, keep_version: Optional[str] = None):
+    query = {"chain": chain}
+    if keep_version:
+      query["version"] = {"$ne": keep_version}
+    await self.collection.delete_many(query)
@@ -0,0 +1,29 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+from pymongo import IndexModel, ASCENDING, UpdateOne
+
+# Normalized place names and queries -> Google place_id
+class PlaceAlias:
+  def __init__(self, db):
+    self.collection = db["place_alias"]
+    self._init_task = asyncio.create_task(self._create_indexes())
+
+  async def _create_indexes(self):
+    await self.collection.create_indexes([
+      IndexModel([("alias", ASCENDING)], unique=True),
+      IndexModel([("place_id", ASCENDING)]),
+    ])
+
+  async def get_place_id(self, alias: str) -> Optional[str]:
+    data = await self.collection.find_one({"alias": alias}, {"place_id": 1})
+    return data.get("place_id") if data else None
+
+  async def save_aliases(self, aliases: Iterable[str], place_id: str):
+    now = datetime.now(timezone.utc)
+    ops = [
+      UpdateOne({"alias": alias}, {"$set": {"place_id": place_id, "updated_at": now}}, upsert=True)
+      for alias in set(aliases)
+    ]
+    if ops:
+      await self.collection.bulk_write(ops, ordered=False)
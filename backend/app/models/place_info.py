@@ -1,15 +1,44 @@
 import asyncio
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
 from pymongo import IndexModel
 from app.models.shortlist import ShortlistItem
 
+# GeoJSON point of the place for the 2dsphere index, GeoJSON puts longitude first
+def geo_point(place: ShortlistItem) -> Optional[dict]:
+  if not place.geometry:
+    return None
+  lat, lng = place.geometry.location
+  return {"type": "Point", "coordinates": [lng, lat]}
+
 class PlaceInfo:
   def __init__(self, db):
     self.collection = db["place_info"]
     self._init_task = asyncio.create_task(self._create_indexes())
 
   async def _create_indexes(self):
+    # Names are no longer unique, different places can share one. Drop the old unique index once.
+    indexes = await self.collection.index_information()
+    if indexes.get("name_1", {}).get("unique"):
+      await self.collection.drop_index("name_1")
+    # Places saved before the location field get it from their geometry
+    await self.collection.update_many(
+      {"location": {"$exists": False}, "geometry.location.1": {"$exists": True}},
+      [{"$set": {"location": {
+        "type": "Point",
+        "coordinates": [{"$arrayElemAt": ["$geometry.location", 1]}, {"$arrayElemAt": ["$geometry.location", 0]}],
+      }}}],
+    )
+    # and an updated_at from the time their _id was created
+    await self.collection.update_many(
+      {"updated_at": {"$exists": False}},
+      [{"$set": {"updated_at": {"$toDate": "$_id"}}}],
+    )
     await self.collection.create_indexes([
-      IndexModel([("name", 1)], unique=True)
+      IndexModel([("place_id", 1)], unique=True, partialFilterExpression={"place_id": {"$type": "string"}}),
+      IndexModel([("name", 1)]),
+      IndexModel([("location", "2dsphere")]),
+      IndexModel([("updated_at", 1), ("_id", 1)]),
     ])
 
   async def get_place(self, place_name: str) -> ShortlistItem | None:
@@ -19,9 +48,63 @@ class PlaceInfo:
       return ShortlistItem(**data)
     return None
 
+  async def get_place_by_id(self, place_id: str) -> Optional[ShortlistItem]:
+    data = await self.collection.find_one({"place_id": place_id})
+    if data:
+      data.pop("_id", None)
+      return ShortlistItem(**data)
+    return None
+
+  async def get_places_by_ids(self, place_ids: List[str]) -> List[ShortlistItem]:
+    places = []
+    async for data in self.collection.find({"place_id": {"$in": place_ids}}):
+      data.pop("_id", None)
+      places.append(ShortlistItem(**data))
+    return places
+
+  # Places resolved through Google are keyed by place_id, the name is only a fallback.
+  # updated_at changes with every write, the place index of each worker re-reads places by it.
   async def save_place(self, placeInfo: ShortlistItem):
+    query = {"place_id": placeInfo.place_id} if placeInfo.place_id else {"name": placeInfo.name}
+    doc = placeInfo.model_dump()
+    doc["updated_at"] = datetime.utcnow()
+    location = geo_point(placeInfo)
+    if location:
+      doc["location"] = location
     await self.collection.replace_one(
-      {"name": placeInfo.name},
-      placeInfo.model_dump(),
+      query,
+      doc,
       upsert=True
-    )
\ No newline at end of file
+    )
+
+  # (place_id, metres) of places within max_distance of the point, closest first
+  async def get_nearby(self, lat: float, lng: float, max_distance: float, limit: int, exclude_ids: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+    pipeline = [
+      {"$geoNear": {
+        "near": {"type": "Point", "coordinates": [lng, lat]},
+        "key": "location",
+        "distanceField": "distance",
+        "maxDistance": max_distance,
+        "spherical": True,
+        "query": {"place_id": {"$type": "string", "$nin": exclude_ids or []}},
+      }},
+      {"$limit": limit},
+      {"$project": {"_id": 0, "place_id": 1, "distance": 1}},
+    ]
+    return [(doc["place_id"], doc["distance"]) async for doc in await self.collection.aggregate(pipeline)]
+
+  # (place_id, lat, lng) of places inside the box, at most limit of them
+  async def get_locations_within(self, south: float, west: float, north: float, east: float, limit: int) -> List[Tuple[str, float, float]]:
+    box = {"type": "Polygon", "coordinates": [[[west, south], [east, south], [east, north], [west, north], [west, south]]]}
+    cursor = self.collection.find(
+      {"location": {"$geoWithin": {"$geometry": box}}, "place_id": {"$type": "string"}},
+      {"_id": 0, "place_id": 1, "location.coordinates": 1},
+    ).limit(limit)
+    return [(doc["place_id"], doc["location"]["coordinates"][1], doc["location"]["coordinates"][0]) async for doc in cursor]
+
+  # (updated_at, place) in the order places were written, only those written at or after since when given
+  async def iter_places(self, since: Optional[datetime] = None, batch_size: int = 500) -> AsyncIterator[Tuple[datetime, ShortlistItem]]:
+    query = {"updated_at": {"$gte": since}} if since is not None else {}
+    async for data in self.collection.find(query).sort([("updated_at", 1), ("_id", 1)]).batch_size(batch_size):
+      data.pop("_id", None)
+      yield data.pop("updated_at", None), ShortlistItem(**data)
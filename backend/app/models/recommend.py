@@ -41,4 +41,22 @@ class LongTermProfile(BaseModel):
 class UserBehavior(BaseModel):
   place_name: str # Name of place card user acts
   event_type: Literal["click", "view", "shortlist", "unshortlist"]  # Type of behavior
-  duration_sec: Optional[float] = 0.0 # Viewing time
\ No newline at end of file
+  duration_sec: Optional[float] = 0.0 # Viewing time
+
+# What one session last added to the long-term profile, and at which epoch.
+# Avoids do not decay, a session is kept for them until it is deleted.
+class SessionContribution(BaseModel):
+  preferences: Dict[str, float] = {}
+  avoids: List[str] = []
+  epoch: int = 0
+
+# Running state of the long-term profile, stored next to it in user_preferences.
+# raw_preferences is the decayed sum of every session's preferences, the most recent session
+# counting fully. Each time another session becomes the most recent, the epoch advances and
+# everything folded so far is multiplied by the decay.
+class ProfileFoldState(BaseModel):
+  raw_preferences: Dict[str, float] = {}
+  epoch: int = 0
+  head_session_id: Optional[str] = None
+  contributions: Dict[str, SessionContribution] = {}
+  version: int = 0
@@ -0,0 +1,29 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, Optional
+from pymongo import IndexModel, ASCENDING
+
+# Google Routes results keyed by origin, destination, mode and time bucket
+class RouteCache:
+  def __init__(self, db):
+    self.collection = db["route_cache"]
+    self._init_task = asyncio.create_task(self._create_indexes())
+
+  async def _create_indexes(self):
+    await self.collection.create_indexes([
+      IndexModel([("key", ASCENDING)], unique=True),
+      IndexModel([("fetched_at", ASCENDING)]),
+    ])
+
+  async def get_route(self, key: str, fresh_after: datetime) -> Optional[Dict[str, Any]]:
+    data = await self.collection.find_one({"key": key, "fetched_at": {"$gt": fresh_after}})
+    if data:
+      data.pop("_id", None)
+    return data
+
+  async def save_route(self, key: str, route: Dict[str, Any]):
+    await self.collection.update_one(
+      {"key": key},
+      {"$set": route},
+      upsert=True
+    )
@@ -44,6 +44,16 @@ class History(BaseModel):
   role: str
   message: Message
 
+  # Places of the message as references, see ShortlistItem.to_ref
+  def compact(self) -> "History":
+    message = self.message
+    if not message.recommendations and not message.populars:
+      return self
+    return self.model_copy(update={"message": message.model_copy(update={
+      "recommendations": [p.to_ref() for p in message.recommendations or []],
+      "populars": [p.to_ref() for p in message.populars or []],
+    })})
+
 class SessionState(BaseModel):
   user_id: str
   session_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -57,7 +67,10 @@ class SessionState(BaseModel):
   recommended_places: List[str] = []
   history: Optional[List[History]] = []
   shortlist: Optional[List[ShortlistItem]] = []
+  history_digest: List[str] = [] # One summary line per turn older than the raw window sent to the LLM
+  history_digest_turns: int = 0 # History entries already folded into history_digest
   update_time: Optional[datetime] = None
+  version: int = 0 # Bumped by every write to Redis, clients sync the changes since the version they have
 
   def get_redis_key(self):
     return f"user:{self.user_id}:session:{self.session_id}:metadata"
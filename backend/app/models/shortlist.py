@@ -62,4 +62,32 @@ class ShortlistItem(BaseModel):
     arbitrary_types_allowed = True
     from_attributes = True
 
+  # Compact form kept in history and shortlist: the place_id plus the fields that belong to the entry.
+  # The rest is hydrated from the place store when a response is built.
+  def to_ref(self) -> "ShortlistItem":
+    if not self.place_id:
+      return self
+    recommend_reason = self.info.recommend_reason if self.info else None
+    return ShortlistItem(
+      name=self.name,
+      type=self.type,
+      place_id=self.place_id,
+      description=self.description,
+      info=PlaceDetail(recommend_reason=recommend_reason) if recommend_reason else None,
+    )
+
+  # Full place for a reference, entry fields of the reference win over the stored ones
+  def hydrate(self, place: Optional["ShortlistItem"]) -> "ShortlistItem":
+    if place is None:
+      return self
+    recommend_reason = self.info.recommend_reason if self.info else None
+    info = place.info.model_copy() if place.info else PlaceDetail()
+    if recommend_reason is not None:
+      info.recommend_reason = recommend_reason
+    return place.model_copy(update={
+      "name": self.name,
+      "description": self.description if self.description is not None else place.description,
+      "info": info,
+    })
+
 ShortlistItem.model_rebuild()
\ No newline at end of file
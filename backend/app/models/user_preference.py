@@ -1,6 +1,8 @@
 import asyncio
+from typing import Dict, List, Optional
 from pymongo import IndexModel
-from app.models.recommend import LongTermProfile
+from pymongo.errors import DuplicateKeyError
+from app.models.recommend import LongTermProfile, ProfileFoldState, TagWeight
 
 class UserPreference:
   def __init__(self, db):
@@ -23,5 +25,38 @@ class UserPreference:
       upsert=True
     )
 
+  async def get_fold_state(self, user_id: str) -> Optional[ProfileFoldState]:
+    data = await self.collection.find_one({"user_id": user_id}, {"fold_state": 1})
+    if data and data.get("fold_state"):
+      return ProfileFoldState(**data["fold_state"])
+    return None
+
+  # Write the profile computed from state, only if nobody else saved since state was read.
+  # Returns False on a conflict, the caller reads again and retries.
+  async def save_folded(self, user_id: str, state: ProfileFoldState, decaying_preferences: Dict[str, TagWeight], avoids: List[str]) -> bool:
+    expected = state.version
+    state.version += 1
+    update = {
+      "$set": {
+        "user_id": user_id,
+        "decaying_preferences": {tag: tw.model_dump() for tag, tw in decaying_preferences.items()},
+        "fold_state": state.model_dump(),
+        # Rebuilt from the sessions, so avoids of a deleted session go away
+        "avoids": avoids,
+      },
+    }
+    try:
+      if expected == 0:
+        # First fold of this user, the document may not exist yet
+        result = await self.collection.update_one({"user_id": user_id, "fold_state": {"$exists": False}}, update, upsert=True)
+      else:
+        result = await self.collection.update_one({"user_id": user_id, "fold_state.version": expected}, update)
+    except DuplicateKeyError:
+      result = None
+    if result is not None and (result.matched_count > 0 or result.upserted_id is not None):
+      return True
+    state.version = expected
+    return False
+
   async def delete_preference(self, user_id: str):
     await self.collection.delete_one({"user_id": user_id})
@@ -1,7 +1,7 @@
 from app.services.shared import language_model, openai_language_model
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Set
 from app.models.session import SessionState, Message, History
 from app.utils.prompts import (
   INTENT_CLASSIFIER_PROMPT,
@@ -10,11 +10,14 @@ from app.utils.prompts import (
   BASIC_PROMPT,
 )
 from app.utils.logger import logger
-from app.services.redis_service import redis_service
+from app.utils.metrics import metrics
+from app.utils.stage_graph import StageGraph
+from app.services.place_store_service import place_store_service
+from app.services.session_context import SessionContext
 from app.services.recommend_service import recommend_service
 from app.services.itinerary_service import itinerary_service
-from app.db.mongodb import get_database
-from app.models.db_session import DbSession
+from app.utils.streaming import EventStream, stream_text
+from app.utils.intent_classifier import intent_classifier
 
 class SlotDataExtractor(BaseModel):
   destination: Optional[str]
@@ -60,63 +63,101 @@ class ChatService:
       return "New Trip"
   
   # Processing prompt
-  async def orchestrate_planning_step(self, session_state: SessionState, user_input: str):
+  # Works on the request's SessionContext, the caller commits it once the turn is done
+  async def orchestrate_planning_step(self, ctx: SessionContext, user_input: str, stream: Optional[EventStream] = None):
+    session_state = ctx.state
     result = None
     if session_state.todo_step == -1:
-      db = get_database()
-      sessions = await DbSession(db).get_sessions_by_user_id(session_state.user_id)
-      session_info = []
-      for s in sessions:
-        session_info.append({"update_time": s.update_time, "short_term_profile": s.short_term_profile})
-      session_info.sort(key=lambda x: x["update_time"], reverse=True)
-      await recommend_service.update_longterm_profile(session_state.user_id, session_info)
-      result = await recommend_service.recommend_places(session_state, user_input)
+      # The long-term profile is kept up to date as sessions are saved, see ProfileService
+      result = await recommend_service.recommend_places(ctx, user_input, stream)
       session_state.todo_step = 1
     else:
-      # Intent recognition
-      classified_intent: List[str] = await self.intent_classifier_chain.ainvoke({
-        "user_input": user_input,
-      })
-      intent_set = set(classified_intent)
-      print(classified_intent)
-      # logger.info(f"intentions: {classified_intent}")
-
-      # Dispatch different AI according to intent
-      if "ADVANCE_STEP" in intent_set:
-        session_state.todo_step += 1
-        todoType = session_state.todo[session_state.todo_step]
-        if todoType == 'Recommend': 
-          intent_set.add("MORE_RECOMMENDATIONS")
-        elif todoType == 'Draft':
-          intent_set.add("ITINERARY_GENERATION")
-        else: intent_set.add("FINALIZE_TRIP")
-
-      # New preferences from behavior and input
-      session_state = await recommend_service.update_short_term_profile(session_state, user_input)
-      
-      if ("MORE_RECOMMENDATIONS" in intent_set) or ("MODIFY_PLAN" in intent_set):
-        # Prompt for recommend
-        session_state.todo_step = 1
-        result = await recommend_service.recommend_places(session_state, user_input)
-      if "ITINERARY_GENERATION" in intent_set:
-        session_state.todo_step = 2
-        result = await itinerary_service.create_itinerary(session_state, user_input)
-      # If GENERAL_QUERY, AI is free to answer
-      if not result and (("GENERAL_QUERY" in intent_set) or ("OTHER" in intent_set)):
-        history = await redis_service.get_simplified_history(session_state)
-        content: str = await self.basic_chain.ainvoke({
-          "user_input": user_input,
-          "history": history,
-        })
-        result = Message(content=content)
-        user_history_entry = History(
-          role="ai",
-          message=result
-        )
-        await redis_service.append_history(session_state, user_history_entry)
+      graph = self._turn_graph(ctx, user_input, stream)
+      results = await graph.run()
+      logger.info(f"Turn stages {session_state.user_id}/{session_state.session_id}: {graph.status} {graph.timings}")
+      result = results["itinerary"] or results["recommend"] or results["general"]
     return result, session_state
+
+  # Stages of a non-first turn. Intent and preference extraction do not depend on each other and run
+  # together, the long-term profile is read once for both. Shortlist places are prefetched while the
+  # intent is classified and dropped unless an itinerary is generated.
+  def _turn_graph(self, ctx: SessionContext, user_input: str, stream: Optional[EventStream] = None) -> StageGraph:
+    session_state = ctx.state
+
+    async def classify(results):
+      # Obvious inputs are classified locally, the rest by the LLM
+      classified_intent: Optional[List[str]] = intent_classifier.classify(user_input)
+      if classified_intent is None:
+        with metrics.timer("intent.llm"):
+          classified_intent = await self.intent_classifier_chain.ainvoke({
+            "user_input": user_input,
+          })
+      print(classified_intent)
+      return self._dispatch_intents(session_state, classified_intent)
+
+    async def long_term(results):
+      return await recommend_service.get_long_preferences(session_state.user_id)
+
+    async def prefetch_places(results):
+      return await place_store_service.get_many(s.place_id for s in ctx.get_shortlist())
+
+    # New preferences from behavior and input
+    async def profile(results):
+      return await recommend_service.update_short_term_profile(ctx, user_input, results["long_term"])
+
+    async def recommend(results):
+      session_state.todo_step = 1
+      return await recommend_service.recommend_places(ctx, user_input, stream, results["long_term"])
+
+    async def itinerary(results):
+      session_state.todo_step = 2
+      return await itinerary_service.create_itinerary(ctx, user_input, stream, results["places"])
+
+    # If GENERAL_QUERY, AI is free to answer
+    async def general(results):
+      history = ctx.get_simplified_history()
+      content: str = await stream_text(self.basic_chain, {
+        "user_input": user_input,
+        "history": history,
+      }, stream)
+      result = Message(content=content)
+      user_history_entry = History(
+        role="ai",
+        message=result
+      )
+      ctx.append_history(user_history_entry)
+      return result
+
+    wants_recommend = lambda r: bool(r["intent"] & {"MORE_RECOMMENDATIONS", "MODIFY_PLAN"})
+    wants_itinerary = lambda r: "ITINERARY_GENERATION" in r["intent"]
+    return (
+      StageGraph("turn")
+      .add("intent", classify)
+      .add("long_term", long_term)
+      .add("places", prefetch_places, keep_if=("intent", wants_itinerary))
+      .add("profile", profile, deps=["long_term"])
+      .add("recommend", recommend, deps=["intent", "profile"], when=wants_recommend)
+      .add("itinerary", itinerary, deps=["intent", "profile", "places", "recommend"], when=wants_itinerary)
+      .add("general", general, deps=["recommend", "itinerary"], when=lambda r: (
+        not (r["recommend"] or r["itinerary"]) and bool(r["intent"] & {"GENERAL_QUERY", "OTHER"})
+      ))
+    )
+
+  # Intents of the classifier plus the ones implied by advancing the todo list
+  def _dispatch_intents(self, session_state: SessionState, classified_intent: List[str]) -> Set[str]:
+    intent_set = set(classified_intent)
+    if "ADVANCE_STEP" in intent_set:
+      session_state.todo_step += 1
+      todoType = session_state.todo[session_state.todo_step]
+      if todoType == 'Recommend': 
+        intent_set.add("MORE_RECOMMENDATIONS")
+      elif todoType == 'Draft':
+        intent_set.add("ITINERARY_GENERATION")
+      else: intent_set.add("FINALIZE_TRIP")
+    return intent_set
   
-  async def get_ai_response(self, session_state: SessionState, user_input: str, first_prompt: Optional[str] = None, todo_prompt: Optional[str] = None):   
+  async def get_ai_response(self, ctx: SessionContext, user_input: str, first_prompt: Optional[str] = None, todo_prompt: Optional[str] = None):   
+    session_state = ctx.state
     user_id = session_state.user_id
     session_id = session_state.session_id
     
@@ -136,8 +177,8 @@ class ChatService:
       role="ai",
       message=user_message_content
     )
-    await redis_service.append_history(session_state, user_history_entry)
-    session_state = await recommend_service.update_short_term_profile(session_state, user_input)
+    ctx.append_history(user_history_entry)
+    session_state = await recommend_service.update_short_term_profile(ctx, user_input)
     # logger.info(f"prompt: {prompt_data}, ai response: {response}")
     return {"content": response}, session_state
 
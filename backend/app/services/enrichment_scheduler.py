@@ -0,0 +1,120 @@
+import asyncio
+import contextvars
+import itertools
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.models.shortlist import ShortlistItem
+from app.services.place_store_service import normalize_place_name
+from app.utils.metrics import metrics
+
+load_dotenv()
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", "3"))
+# Prefetch requests beyond this many queued places are dropped, user requests are always queued
+ENRICH_MAX_QUEUE = int(os.getenv("ENRICH_MAX_QUEUE", "100"))
+
+# Lower runs first
+PRIORITY_USER = 0
+PRIORITY_PREFETCH = 10
+
+# Bounded pool of enrichment workers fed by a priority queue.
+# One queued job per place: later requests share its future and can only raise its priority.
+class EnrichmentScheduler:
+  def __init__(self, handler: Callable[[str], Awaitable[Optional[ShortlistItem]]], workers: int = ENRICH_WORKERS, max_queue: int = ENRICH_MAX_QUEUE):
+    self.handler = handler
+    self.workers = workers
+    self.max_queue = max_queue
+    self._queue: Optional[asyncio.PriorityQueue] = None
+    self._jobs: Dict[str, Tuple[int, asyncio.Future]] = {}
+    self._running = set()
+    self._seq = itertools.count()
+    self._tasks: List[asyncio.Task] = []
+
+  def depth(self) -> int:
+    return len(self._jobs) - len(self._running)
+
+  def start(self):
+    if self._tasks:
+      return
+    self._queue = asyncio.PriorityQueue()
+    # Not tied to the request that happened to start them
+    self._tasks = [contextvars.Context().run(asyncio.create_task, self._worker()) for _ in range(self.workers)]
+
+  async def stop(self):
+    for task in self._tasks:
+      task.cancel()
+    await asyncio.gather(*self._tasks, return_exceptions=True)
+    self._tasks = []
+    for _, future in self._jobs.values():
+      future.cancel()
+    self._jobs.clear()
+    self._running.clear()
+
+  # Queue a place, returns the job's future or None when a prefetch is dropped under backpressure
+  def submit(self, place_name: str, priority: int = PRIORITY_PREFETCH) -> Optional[asyncio.Future]:
+    key = normalize_place_name(place_name)
+    if not key:
+      return None
+    self.start()
+
+    job = self._jobs.get(key)
+    if job is not None:
+      metrics.incr("enrich.deduped")
+      queued_priority, future = job
+      # Queue it again ahead, the worker skips whichever entry comes second
+      if priority < queued_priority and key not in self._running:
+        self._jobs[key] = (priority, future)
+        self._queue.put_nowait((priority, next(self._seq), key, place_name, time.perf_counter()))
+      return future
+
+    if priority >= PRIORITY_PREFETCH and self.depth() >= self.max_queue:
+      metrics.incr("enrich.dropped")
+      return None
+
+    future = asyncio.get_running_loop().create_future()
+    self._jobs[key] = (priority, future)
+    self._queue.put_nowait((priority, next(self._seq), key, place_name, time.perf_counter()))
+    metrics.incr("enrich.submitted")
+    metrics.set_gauge("enrich.queue_depth", self.depth())
+    return future
+
+  # User facing: jump the queue and wait for the result
+  async def enrich(self, place_name: str) -> Optional[ShortlistItem]:
+    future = self.submit(place_name, PRIORITY_USER)
+    if future is None:
+      return None
+    return await asyncio.shield(future)
+
+  async def _worker(self):
+    while True:
+      priority, _, key, place_name, queued_at = await self._queue.get()
+      job = self._jobs.get(key)
+      # Stale entry of a job that was raised in priority or already ran
+      if job is None or job[0] != priority or key in self._running:
+        continue
+
+      self._running.add(key)
+      metrics.observe("enrich.wait", (time.perf_counter() - queued_at) * 1000)
+      metrics.set_gauge("enrich.queue_depth", self.depth())
+      future = job[1]
+      try:
+        with metrics.timer("enrich.run"):
+          result = await self.handler(place_name)
+        if not future.done():
+          future.set_result(result)
+        metrics.incr("enrich.completed")
+      except asyncio.CancelledError:
+        future.cancel()
+        raise
+      except Exception as e:
+        print(f"Enrichment failed for {place_name}: {e}")
+        metrics.incr("enrich.failed")
+        if not future.done():
+          future.set_exception(e)
+          # Prefetch futures usually have no reader
+          future.exception()
+      finally:
+        self._running.discard(key)
+        self._jobs.pop(key, None)
+        metrics.set_gauge("enrich.queue_depth", self.depth())
@@ -0,0 +1,111 @@
+import asyncio
+import os
+import random
+from typing import Any, Dict, List, Optional
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+GOOGLE_API_KEY = os.getenv("GOOGLE_API")
+# Base urls can point at a local fake server in tests and benchmarks
+GOOGLE_PLACES_URL = os.getenv("GOOGLE_PLACES_URL", "https://maps.googleapis.com/maps/api/place")
+GOOGLE_ROUTES_URL = os.getenv("GOOGLE_ROUTES_URL", "https://routes.googleapis.com")
+GOOGLE_HTTP_TIMEOUT = float(os.getenv("GOOGLE_HTTP_TIMEOUT", "10"))
+GOOGLE_HTTP_RETRIES = int(os.getenv("GOOGLE_HTTP_RETRIES", "3"))
+GOOGLE_HTTP_MAX_CONNECTIONS = int(os.getenv("GOOGLE_HTTP_MAX_CONNECTIONS", "20"))
+
+# Transient statuses worth retrying, everything else is returned to the caller
+RETRY_STATUS = {429, 500, 502, 503, 504}
+RETRY_BASE_DELAY = 0.2
+
+class GoogleMapsService:
+  def __init__(
+    self,
+    api_key: Optional[str] = GOOGLE_API_KEY,
+    places_url: str = GOOGLE_PLACES_URL,
+    routes_url: str = GOOGLE_ROUTES_URL,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+  ):
+    self.key = api_key
+    self.places_url = places_url.rstrip("/")
+    self.routes_url = routes_url.rstrip("/")
+    self.transport = transport
+    self._client: Optional[httpx.AsyncClient] = None
+
+  # One keep-alive pool shared by Places and Routes, created on first use
+  def _get_client(self) -> httpx.AsyncClient:
+    if self._client is None or self._client.is_closed:
+      self._client = httpx.AsyncClient(
+        timeout=GOOGLE_HTTP_TIMEOUT,
+        limits=httpx.Limits(
+          max_connections=GOOGLE_HTTP_MAX_CONNECTIONS,
+          max_keepalive_connections=GOOGLE_HTTP_MAX_CONNECTIONS,
+        ),
+        transport=self.transport,
+      )
+    return self._client
+
+  async def close(self):
+    if self._client is not None:
+      await self._client.aclose()
+      self._client = None
+
+  # Retry transient failures with full jitter backoff
+  async def _request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> Optional[httpx.Response]:
+    client = self._get_client()
+    for attempt in range(GOOGLE_HTTP_RETRIES + 1):
+      try:
+        response = await client.request(method, url, timeout=timeout or GOOGLE_HTTP_TIMEOUT, **kwargs)
+        if response.status_code not in RETRY_STATUS:
+          return response
+        error = f"status {response.status_code}"
+      except httpx.TransportError as e:
+        response = None
+        error = repr(e)
+
+      if attempt < GOOGLE_HTTP_RETRIES:
+        await asyncio.sleep(random.uniform(0, RETRY_BASE_DELAY * (2 ** attempt)))
+
+    print(f"Google request {method} {url} failed after {GOOGLE_HTTP_RETRIES + 1} attempts: {error}")
+    return response
+
+  async def find_place(self, query: str, fields: List[str], timeout: Optional[float] = None) -> Dict[str, Any]:
+    response = await self._request(
+      "GET",
+      f"{self.places_url}/findplacefromtext/json",
+      timeout=timeout,
+      params={"input": query, "inputtype": "textquery", "fields": ",".join(fields), "key": self.key},
+    )
+    if response is None or response.status_code != 200:
+      return {}
+    return response.json()
+
+  async def place(self, place_id: str, fields: List[str], timeout: Optional[float] = None) -> Dict[str, Any]:
+    response = await self._request(
+      "GET",
+      f"{self.places_url}/details/json",
+      timeout=timeout,
+      params={"place_id": place_id, "fields": ",".join(fields), "key": self.key},
+    )
+    if response is None or response.status_code != 200:
+      return {}
+    return response.json()
+
+  async def compute_routes(self, body: Dict[str, Any], field_mask: str, timeout: Optional[float] = None) -> Optional[httpx.Response]:
+    headers = {
+      "Content-Type": "application/json",
+      "X-Goog-Api-Key": self.key or "",
+      "X-Goog-FieldMask": field_mask,
+    }
+    return await self._request(
+      "POST",
+      f"{self.routes_url}/directions/v2:computeRoutes",
+      timeout=timeout,
+      headers=headers,
+      json=body,
+    )
+
+  def photo_url(self, photo_reference: str) -> str:
+    return f"{self.places_url}/photo?maxwidth=1600&photo_reference={photo_reference}&key={self.key}"
+
+google_maps_service = GoogleMapsService()
@@ -1,17 +1,112 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import json
+import math
 import re
-from typing import List
-from app.utils.prompts import CREATE_ITINERARY_PROMPT
+from typing import Dict, List, Optional
+from app.utils.prompts import CREATE_ITINERARY_PROMPT, ITINERARY_NARRATIVE_PROMPT
 from app.services.shared import openai_language_model, language_model
-from app.models.session import DailyItinerary, Message, SessionState, History
-from app.services.redis_service import redis_service
+from app.models.session import DailyItinerary, DiscardPlace, Extend, Message, History
+from app.models.shortlist import ShortlistItem
+from app.services.session_context import SessionContext
 from langchain.agents import initialize_agent
 from langchain.agents.agent_types import AgentType
 from app.services.recommend_service import recommend_service
+from app.services.place_store_service import place_store_service
+from app.services.nearby_service import nearby_service
+from app.services.route_cache_service import route_cache_service
+from app.utils.geo import haversine_km
+from app.utils.itinerary_solver import ItinerarySolver, Plan, SolverPlace, WALK_MAX_KM, parse_opening_hours, travel_minutes
 from app.utils.tools import get_route_info
+from app.utils.streaming import EventStream, stream_json_field
+from app.utils.concurrency import bounded_gather
 from langchain_core.messages import HumanMessage, ToolMessage
 from langchain_core.output_parsers import JsonOutputParser
+import os
+
+# Max Routes lookups in flight for one itinerary
+ROUTE_LOOKUP_CONCURRENCY = int(os.getenv("ROUTE_LOOKUP_CONCURRENCY", "8"))
+# Stored places around the shortlist offered to the LLM, places it adds itself need a Google lookup
+ITINERARY_NEARBY_RADIUS_KM = float(os.getenv("ITINERARY_NEARBY_RADIUS_KM", "3"))
+ITINERARY_NEARBY_LIMIT = int(os.getenv("ITINERARY_NEARBY_LIMIT", "10"))
+# Visit orders and times are planned locally when every shortlisted place has a location,
+# the LLM then only writes the text
+ITINERARY_LOCAL_SOLVER = os.getenv("ITINERARY_LOCAL_SOLVER", "true").lower() == "true"
+ITINERARY_DAY_START = os.getenv("ITINERARY_DAY_START", "09:00")
+ITINERARY_DAY_END = os.getenv("ITINERARY_DAY_END", "20:00")
+ITINERARY_MAX_DAYS = int(os.getenv("ITINERARY_MAX_DAYS", "14"))
+ITINERARY_VISIT_MINUTES = int(os.getenv("ITINERARY_VISIT_MINUTES", "90"))
+
+# Usual length of a visit by place type, the longest one of a place's tags is used
+VISIT_MINUTES_BY_TAG = {
+  "amusement_park": 240,
+  "zoo": 180,
+  "museum": 120,
+  "aquarium": 120,
+  "art_gallery": 90,
+  "shopping_mall": 90,
+  "restaurant": 75,
+  "park": 60,
+  "church": 45,
+  "cafe": 45,
+}
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+TRIP_DAYS = re.compile(r"\b(\d{1,2}|" + "|".join(NUMBER_WORDS) + r")[\s-]*days?\b", re.IGNORECASE)
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december"]
+WEEKDAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_MONTH = r"(" + "|".join(m[:3] + r"(?:" + m[3:] + r")?" for m in MONTHS) + r")\.?"
+_DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+TRIP_DATE_ISO = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+# Not "may 2 days"
+TRIP_DATE_MONTH_DAY = re.compile(r"\b" + _MONTH + r"\s+" + _DAY + r"\b(?!\s*(?:days?|nights?|weeks?|hours?|people|persons?|adults?|kids?)\b)", re.IGNORECASE)
+TRIP_DATE_DAY_MONTH = re.compile(r"\b" + _DAY + r"(?:\s+of)?\s+" + _MONTH + r"\b", re.IGNORECASE)
+TRIP_WEEKDAY = re.compile(r"\b(?:from|on|starting|start|arrive|arriving|leave|leaving)(?:\s+on)?\s+(" + "|".join(WEEKDAY_NAMES) + r")\b", re.IGNORECASE)
+
+def _hhmm_to_minutes(hhmm: str) -> int:
+  hours, minutes = map(int, hhmm.split(":"))
+  return hours * 60 + minutes
+
+def _minutes_to_hhmm(minutes: int) -> str:
+  return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+# "a 3 day trip", "three days in Rome": the number of days asked for, the input before the history
+def trip_days(*texts: str) -> Optional[int]:
+  for text in texts:
+    match = TRIP_DAYS.search(text or "")
+    if match:
+      value = match.group(1).lower()
+      days = NUMBER_WORDS.get(value) or int(value)
+      if days > 0:
+        return min(days, ITINERARY_MAX_DAYS)
+  return None
+
+def _month(name: str) -> int:
+  return [m[:3] for m in MONTHS].index(name[:3].lower()) + 1
+
+# Weekday of the first day of the trip: "2026-11-03", "November 3", "3rd of Nov", "starting on Friday".
+# A date without a year is the next one from today. None when no date is given.
+def trip_first_weekday(*texts: str, today: Optional[date] = None) -> Optional[int]:
+  today = today or date.today()
+  for text in texts:
+    text = text or ""
+    candidates = [(m.start(), int(m.group(1)), int(m.group(2)), int(m.group(3))) for m in TRIP_DATE_ISO.finditer(text)]
+    candidates += [(m.start(), None, _month(m.group(1)), int(m.group(2))) for m in TRIP_DATE_MONTH_DAY.finditer(text)]
+    candidates += [(m.start(), None, _month(m.group(2)), int(m.group(1))) for m in TRIP_DATE_DAY_MONTH.finditer(text)]
+    for _, year, month, day in sorted(candidates):
+      try:
+        start = date(year or today.year, month, day)
+        if year is None and start < today:
+          start = date(today.year + 1, month, day)
+        return start.weekday()
+      except ValueError:
+        continue
+    match = TRIP_WEEKDAY.search(text)
+    if match:
+      return WEEKDAY_NAMES.index(match.group(1).lower())
+  return None
+
+def visit_minutes(place: ShortlistItem) -> int:
+  return max((VISIT_MINUTES_BY_TAG.get(tag, 0) for tag in place.tags or []), default=0) or ITINERARY_VISIT_MINUTES
 
 class ItineraryService:
   def __init__(self):
@@ -27,11 +122,22 @@ class ItineraryService:
       | language_model
       | JsonOutputParser()
     )
+    self.itinerary_narrative_chain=(
+      ITINERARY_NARRATIVE_PROMPT
+      | language_model
+      | JsonOutputParser()
+    )
   
-  async def create_itinerary(self, session_state: SessionState, user_input: str):
-    history_str = await redis_service.get_simplified_history(session_state)
-    shortlist = await redis_service.get_shortlist(session_state.user_id, session_state.session_id)
-    place_names = ",".join(f"{s.name}: {s.info.weekday_text}" for s in shortlist)
+  # places: shortlist places already read from the place store, by place_id
+  async def create_itinerary(self, ctx: SessionContext, user_input: str, stream: Optional[EventStream] = None, places: Optional[Dict[str, ShortlistItem]] = None):
+    history_str = ctx.get_simplified_history()
+    # Opening hours are not kept in the shortlist references
+    shortlist = await place_store_service.hydrate(ctx.get_shortlist(), places)
+    if self.can_solve_locally(shortlist):
+      return await self.create_local_itinerary(ctx, user_input, history_str, shortlist, stream)
+
+    place_names = ",".join(f"{s.name}: {s.info.weekday_text if s.info else None}" for s in shortlist)
+    nearby_places = ",".join(p.name for p in await self.get_nearby_places(shortlist))
     
     # user_prompt = CREATE_ITINERARY_PROMPT.format(
     #   user_input=user_input,
@@ -71,11 +177,12 @@ class ItineraryService:
     # parsed_data = json.loads(json_str)
     # response = Message(**parsed_data)
 
-    raw_data = await self.create_itinerary_chain.ainvoke({
+    raw_data = await stream_json_field(self.create_itinerary_chain, {
       "user_input":user_input,
       "history":history_str,
-      "place_names":place_names
-    })
+      "place_names":place_names,
+      "nearby_places":nearby_places
+    }, stream)
 
     response = Message(**raw_data)
 
@@ -96,6 +203,8 @@ class ItineraryService:
           place_info = await recommend_service.get_or_fetch_place_brief(place_name, None, None)
           itinerary[i].place_name = place_info.name
           response.recommendations.append(place_info)
+          if stream:
+            await stream.card("recommendations", place_info)
     
     itinerary = await self.update_itinerary_time(itinerary)
     
@@ -103,9 +212,116 @@ class ItineraryService:
       role="ai",
       message=response
     )
-    await redis_service.append_history(session_state, user_history_entry)
+    ctx.append_history(user_history_entry)
     return response
   
+  # Cities cannot be visited in one slot, those shortlists are planned by the LLM
+  def can_solve_locally(self, shortlist: List[ShortlistItem]) -> bool:
+    return ITINERARY_LOCAL_SOLVER and len(shortlist) >= 2 and all(s.geometry and s.type != "city" for s in shortlist)
+
+  # Orders and times from the solver, then one LLM call for the text
+  async def create_local_itinerary(self, ctx: SessionContext, user_input: str, history_str: str, shortlist: List[ShortlistItem], stream: Optional[EventStream] = None) -> Message:
+    plan = await self.plan_days(shortlist, trip_days(user_input, history_str), trip_first_weekday(user_input, history_str))
+    itinerary = self.plan_to_itinerary(plan, shortlist)
+
+    raw_data = await stream_json_field(self.itinerary_narrative_chain, {
+      "user_input": user_input,
+      "history": history_str,
+      "itinerary": self.describe_itinerary(itinerary),
+      "unscheduled": ",".join(shortlist[i].name for i in plan.unscheduled),
+    }, stream)
+    response = Message(content=raw_data.get("content", ""), itinerary=await self.update_itinerary_time(itinerary))
+
+    ctx.append_history(History(role="ai", message=response))
+    return response
+
+  # Without a number of days in the request, the fewest days that fit every place.
+  # Opening hours are those of first_weekday for day 1. The session has no date field,
+  # so without a date in the conversation the trip is assumed to start today.
+  async def plan_days(self, shortlist: List[ShortlistItem], days: Optional[int] = None, first_weekday: Optional[int] = None) -> Plan:
+    lats = [s.geometry.location[0] for s in shortlist]
+    lngs = [s.geometry.location[1] for s in shortlist]
+    travel = travel_minutes(lats, lngs)
+    # Walks fetched for earlier itineraries replace the estimates
+    legs = [(a.place_id, b.place_id) for a in shortlist for b in shortlist if a.place_id and b.place_id and a is not b]
+    cached = await route_cache_service.get_durations(legs, "WALK")
+    index = {s.place_id: i for i, s in enumerate(shortlist)}
+    for (origin, destination), seconds in cached.items():
+      i, j = index[origin], index[destination]
+      travel[i][j] = min(travel[i][j], seconds / 60)
+
+    places = [SolverPlace(i, visit_minutes(s), parse_opening_hours(s.info.weekday_text if s.info else None)) for i, s in enumerate(shortlist)]
+    day_start, day_end = _hhmm_to_minutes(ITINERARY_DAY_START), _hhmm_to_minutes(ITINERARY_DAY_END)
+    if first_weekday is None:
+      first_weekday = datetime.now().weekday()
+
+    def solve(days: int) -> Plan:
+      return ItinerarySolver(places, travel, days, first_weekday, day_start, day_end).solve()
+
+    if days:
+      return solve(days)
+    days = max(1, math.ceil(sum(p.duration for p in places) / (day_end - day_start)))
+    plan = solve(days)
+    while plan.unscheduled and days < min(len(places), ITINERARY_MAX_DAYS):
+      days += 1
+      plan = solve(days)
+    return plan
+
+  # Visits with a commute between each two of a day, places left out go to discarded_places
+  def plan_to_itinerary(self, plan: Plan, shortlist: List[ShortlistItem]) -> List[DailyItinerary]:
+    itinerary = []
+    for day, visits in enumerate(plan.days, start=1):
+      for prev, visit in zip([None] + visits, visits):
+        place = shortlist[visit.key]
+        if prev is not None:
+          origin = shortlist[prev.key].geometry.location
+          km = float(haversine_km(origin[0], origin[1], *place.geometry.location))
+          itinerary.append(DailyItinerary(
+            date=day,
+            type="commute",
+            start_time=_minutes_to_hhmm(prev.end),
+            end_time=_minutes_to_hhmm(visit.arrive),
+            commute_mode="WALK" if km <= WALK_MAX_KM else "TRANSIT",
+          ))
+        itinerary.append(DailyItinerary(
+          date=day,
+          type="visit",
+          place_name=place.name,
+          start_time=_minutes_to_hhmm(visit.start),
+          end_time=_minutes_to_hhmm(visit.end),
+        ))
+    if itinerary and plan.unscheduled:
+      itinerary[0].discarded_places = [
+        DiscardPlace(
+          name=shortlist[i].name,
+          duration=math.ceil(visit_minutes(shortlist[i]) / 60),
+          extendedProps=Extend(openingHours=(shortlist[i].info.weekday_text if shortlist[i].info else None) or [], type="visit"),
+        )
+        for i in plan.unscheduled
+      ]
+    return itinerary
+
+  def describe_itinerary(self, itinerary: List[DailyItinerary]) -> str:
+    return "; ".join(
+      f"Day {e.date} {e.start_time}-{e.end_time} " + (e.place_name if e.type == "visit" else f"{e.commute_mode.lower()} to the next place")
+      for e in itinerary
+    )
+
+  # Stored places within ITINERARY_NEARBY_RADIUS_KM of the middle of the shortlist
+  async def get_nearby_places(self, shortlist: List[ShortlistItem]) -> List[ShortlistItem]:
+    located = [s.geometry.location for s in shortlist if s.geometry]
+    if not located:
+      return []
+    lat = sum(l[0] for l in located) / len(located)
+    lng = sum(l[1] for l in located) / len(located)
+    try:
+      found = await nearby_service.nearby(lat, lng, ITINERARY_NEARBY_RADIUS_KM, ITINERARY_NEARBY_LIMIT, [s.place_id for s in shortlist if s.place_id])
+      places = await place_store_service.get_many(place_id for place_id, _ in found)
+    except Exception as e:
+      print(f"Nearby places lookup failed: {e}")
+      return []
+    return [places[place_id] for place_id, _ in found if place_id in places]
+
   async def update_itinerary_time(self, itinerary: List[DailyItinerary]) -> List[DailyItinerary]:
     sorted_itinerary = sorted(
       itinerary,
@@ -114,6 +330,9 @@ class ItineraryService:
         int(x.start_time.split(":")[0]) * 60 + int(x.start_time.split(":")[1])
       )
     )
+    # A leg only reads its neighbours as they were before any leg is updated,
+    # so all route lookups are issued together and applied afterwards in order
+    legs = []
     for i in range(1, len(sorted_itinerary) - 1):
       if sorted_itinerary[i].type == 'commute':
         commute_mode = sorted_itinerary[i].commute_mode
@@ -133,26 +352,34 @@ class ItineraryService:
         today = datetime.now().date()
         hours, minutes = map(int, arrival_time.split(':'))
         utc_dt = datetime.combine(today, datetime.min.time()) + timedelta(hours=hours, minutes=minutes)
-        duration, mode, route_steps = await get_route_info(origin, destination, commute_mode, utc_dt.isoformat(timespec='seconds') + 'Z')
-        if not duration:
-          print("Fail to get route")
-          continue
-        
-        if len(route_steps) > 1:
-          # arrival = route_steps[len(route_steps) - 1].arrival_time
-          # sorted_itinerary[i].end_time = self._rfc_to_hhmm(arrival)
-
-          for step in route_steps:
-            if step.departure_time:
-              step.departure_time = self._rfc_to_hhmm(step.departure_time)
-              step.arrival_time = self._rfc_to_hhmm(step.arrival_time)
-          sorted_itinerary[i].route_steps = route_steps
-        
-        arrival_dt = datetime.strptime(sorted_itinerary[i].end_time, "%H:%M")
-        duration_seconds = float(duration[:-1])
-        departure_dt = arrival_dt - timedelta(seconds=duration_seconds)
-        sorted_itinerary[i].start_time = departure_dt.strftime("%H:%M")
-        sorted_itinerary[i].commute_mode = mode
+        legs.append((i, origin, destination, commute_mode, utc_dt.isoformat(timespec='seconds') + 'Z'))
+
+    routes = await bounded_gather(
+      lambda leg: get_route_info(*leg[1:]),
+      legs,
+      ROUTE_LOOKUP_CONCURRENCY,
+    )
+
+    for (i, *_), (duration, mode, route_steps) in zip(legs, routes):
+      if not duration:
+        print("Fail to get route")
+        continue
+      
+      if len(route_steps) > 1:
+        # arrival = route_steps[len(route_steps) - 1].arrival_time
+        # sorted_itinerary[i].end_time = self._rfc_to_hhmm(arrival)
+
+        for step in route_steps:
+          if step.departure_time:
+            step.departure_time = self._rfc_to_hhmm(step.departure_time)
+            step.arrival_time = self._rfc_to_hhmm(step.arrival_time)
+        sorted_itinerary[i].route_steps = route_steps
+      
+      arrival_dt = datetime.strptime(sorted_itinerary[i].end_time, "%H:%M")
+      duration_seconds = float(duration[:-1])
+      departure_dt = arrival_dt - timedelta(seconds=duration_seconds)
+      sorted_itinerary[i].start_time = departure_dt.strftime("%H:%M")
+      sorted_itinerary[i].commute_mode = mode
 
     return sorted_itinerary
   
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from langchain_core.prompts import BasePromptTemplate
+from langchain_core.runnables import Runnable
+from app.db.mongodb import mongodb
+from app.services.redis_service import redis_service
+from app.utils.metrics import metrics
+
+load_dotenv()
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+# Bump to drop every cached response, prompt edits already change the key of their own chain
+LLM_CACHE_VERSION = os.getenv("LLM_CACHE_VERSION", "1")
+
+LRU_KEY = "llmcache:lru"
+
+# Case and whitespace insensitive form of a chain input, dict keys sorted
+def normalize_input(value: Any) -> Any:
+  if isinstance(value, str):
+    return " ".join(value.lower().split())
+  if isinstance(value, dict):
+    return {str(k): normalize_input(v) for k, v in sorted(value.items())}
+  if isinstance(value, (list, tuple)):
+    return [normalize_input(v) for v in value]
+  return value
+
+def prompt_fingerprint(prompt: BasePromptTemplate) -> str:
+  return hashlib.sha1(prompt.pretty_repr().encode("utf-8")).hexdigest()[:12]
+
+# A chain whose ainvoke goes through the cache. Only for prompts whose answer depends on the input alone.
+class CachedChain:
+  def __init__(self, name: str, prompt: BasePromptTemplate, chain: Runnable, cache: "LLMCacheService"):
+    self.name = name
+    self.chain = chain
+    self.cache = cache
+    self.version = f"{LLM_CACHE_VERSION}.{prompt_fingerprint(prompt)}"
+
+  def key_for(self, inputs: Any) -> str:
+    normalized = json.dumps(normalize_input(inputs), sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+    return f"llmcache:{self.name}:{self.version}:{digest}"
+
+  async def ainvoke(self, inputs: Any) -> Any:
+    return await self.cache.get_or_invoke(self, inputs)
+
+class LLMCacheService:
+  def __init__(self):
+    self.chains: Dict[str, CachedChain] = {}
+
+  def wrap(self, name: str, prompt: BasePromptTemplate, chain: Runnable) -> CachedChain:
+    cached = CachedChain(name, prompt, chain, self)
+    self.chains[name] = cached
+    return cached
+
+  async def get_or_invoke(self, chain: CachedChain, inputs: Any) -> Any:
+    key = chain.key_for(inputs)
+
+    value = await self._get_redis(key)
+    if value is not None:
+      metrics.incr("llm_cache.hit.redis")
+      return value
+
+    value = await self._get_mongo(key)
+    if value is not None:
+      metrics.incr("llm_cache.hit.mongo")
+      await self._set_redis(key, value)
+      return value
+
+    metrics.incr("llm_cache.miss")
+    with metrics.timer(f"llm.{chain.name}"):
+      value = await chain.chain.ainvoke(inputs)
+    if value is not None:
+      await self._set_redis(key, value)
+      await self._set_mongo(key, chain, value)
+    return value
+
+  def stats(self) -> Dict[str, float]:
+    hits = metrics.counter("llm_cache.hit.redis") + metrics.counter("llm_cache.hit.mongo")
+    misses = metrics.counter("llm_cache.miss")
+    return {
+      "hits": hits,
+      "misses": misses,
+      "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+    }
+
+  # Remove entries written under older prompt versions from MongoDB, Redis copies expire or get evicted on their own
+  async def bust_stale_versions(self):
+    if mongodb.llm_cache is None:
+      return
+    for chain in self.chains.values():
+      try:
+        await mongodb.llm_cache.delete_chain(chain.name, keep_version=chain.version)
+      except Exception as e:
+        print(f"LLM cache bust failed for {chain.name}: {e}")
+
+  async def _get_redis(self, key: str) -> Optional[Any]:
+    client = redis_service.get_redis_client()
+    try:
+      async with client.pipeline(transaction=False) as pipe:
+        pipe.get(key)
+        pipe.zadd(LRU_KEY, {key: time.time()}, xx=True)
+        data, _ = await pipe.execute()
+      return json.loads(data) if data else None
+    except Exception as e:
+      print(f"LLM cache read failed for {key}: {e}")
+      return None
+
+  async def _set_redis(self, key: str, value: Any):
+    client = redis_service.get_redis_client()
+    try:
+      async with client.pipeline(transaction=False) as pipe:
+        pipe.set(key, json.dumps(value, ensure_ascii=False), ex=LLM_CACHE_TTL)
+        pipe.zadd(LRU_KEY, {key: time.time()})
+        pipe.zcard(LRU_KEY)
+        _, _, size = await pipe.execute()
+
+      # Evict least recently used entries over the cap
+      if size > LLM_CACHE_MAX_ENTRIES:
+        evicted = await client.zpopmin(LRU_KEY, size - LLM_CACHE_MAX_ENTRIES)
+        if evicted:
+          await client.delete(*[k for k, _ in evicted])
+          metrics.incr("llm_cache.evicted", len(evicted))
+    except Exception as e:
+      print(f"LLM cache write failed for {key}: {e}")
+
+  async def _get_mongo(self, key: str) -> Optional[Any]:
+    if mongodb.llm_cache is None:
+      return None
+    try:
+      return await mongodb.llm_cache.get_entry(key)
+    except Exception as e:
+      print(f"LLM cache MongoDB read failed for {key}: {e}")
+      return None
+
+  async def _set_mongo(self, key: str, chain: CachedChain, value: Any):
+    if mongodb.llm_cache is None:
+      return
+    try:
+      expire_at = datetime.now(timezone.utc) + timedelta(seconds=LLM_CACHE_TTL)
+      await mongodb.llm_cache.save_entry(key, chain.name, chain.version, value, expire_at)
+    except Exception as e:
+      print(f"LLM cache MongoDB write failed for {key}: {e}")
+
+llm_cache_service = LLMCacheService()
@@ -0,0 +1,106 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+from dotenv import load_dotenv
+from app.db.mongodb import mongodb
+from app.models.shortlist import ShortlistItem
+from app.utils.geo import GeoGrid, cell_bounds
+from app.utils.metrics import metrics
+
+load_dotenv()
+# An area is loaded into memory after this many queries had to go to MongoDB
+NEARBY_HOT_HITS = int(os.getenv("NEARBY_HOT_HITS", "3"))
+# Loaded areas are read again after this long, and the least recently used dropped beyond NEARBY_MAX_AREAS
+NEARBY_AREA_TTL = int(os.getenv("NEARBY_AREA_TTL", "600"))
+NEARBY_MAX_AREAS = int(os.getenv("NEARBY_MAX_AREAS", "32"))
+# Denser areas stay in MongoDB
+NEARBY_AREA_MAX_PLACES = int(os.getenv("NEARBY_AREA_MAX_PLACES", "100000"))
+NEARBY_MAX_RADIUS_KM = float(os.getenv("NEARBY_MAX_RADIUS_KM", "50"))
+
+# Places near a point, from the geohash grid when the areas around it are hot and loaded,
+# otherwise from the 2dsphere index of place_info.
+class NearbyService:
+  def __init__(self):
+    self.grid = GeoGrid()
+    self._loaded_at: "OrderedDict[int, float]" = OrderedDict()
+    self._misses: Dict[int, int] = {}
+    self._loading: Dict[int, asyncio.Task] = {}
+
+  # (place_id, km) within radius_km of the point, closest first
+  async def nearby(self, lat: float, lng: float, radius_km: float, limit: int, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+    radius_km = min(radius_km, NEARBY_MAX_RADIUS_KM)
+    exclude = set(exclude)
+    areas = self.grid.areas_covering(lat, lng, radius_km)
+    self._expire()
+    if self.grid.is_loaded(areas):
+      for area in areas:
+        self._loaded_at.move_to_end(area)
+      metrics.incr("nearby.memory")
+      with metrics.timer("nearby.memory"):
+        return self.grid.query(lat, lng, radius_km, limit, exclude)
+    if mongodb.place_info is None:
+      return []
+
+    for area in areas:
+      if area in self.grid.areas:
+        continue
+      self._misses[area] = self._misses.get(area, 0) + 1
+      if self._misses[area] >= NEARBY_HOT_HITS and area not in self._loading:
+        # Not tied to the request that made the area hot
+        self._loading[area] = contextvars.Context().run(asyncio.create_task, self._load_area(area))
+
+    metrics.incr("nearby.mongo")
+    with metrics.timer("nearby.mongo"):
+      found = await mongodb.place_info.get_nearby(lat, lng, radius_km * 1000, limit, list(exclude))
+    return [(place_id, metres / 1000) for place_id, metres in found]
+
+  # Places saved while their area is loaded are added right away
+  def add(self, place: ShortlistItem):
+    if place.place_id and place.geometry:
+      self.grid.upsert(place.place_id, *place.geometry.location)
+
+  def stats(self) -> Dict[str, float]:
+    memory, mongo = metrics.counter("nearby.memory"), metrics.counter("nearby.mongo")
+    return {
+      "areas": len(self.grid.areas),
+      "places": sum(len(a) for a in self.grid.areas.values()),
+      "memory": memory,
+      "mongo": mongo,
+      "memory_rate": round(memory / (memory + mongo), 4) if memory + mongo else 0.0,
+    }
+
+  async def _load_area(self, area: int):
+    try:
+      south, west, north, east = cell_bounds(area, self.grid.area_precision)
+      # A little wider than the cell, load_area keeps the places that fall inside it
+      margin = (north - south) * 0.01
+      with metrics.timer("nearby.load_area"):
+        rows = await mongodb.place_info.get_locations_within(south - margin, west - margin, north + margin, east + margin, NEARBY_AREA_MAX_PLACES + 1)
+      if len(rows) > NEARBY_AREA_MAX_PLACES:
+        print(f"Nearby area {area} has more than {NEARBY_AREA_MAX_PLACES} places, not loaded")
+        return
+      self.grid.load_area(area, [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows])
+      self._loaded_at[area] = time.monotonic()
+      self._loaded_at.move_to_end(area)
+      metrics.incr("nearby.area_loaded")
+      while len(self._loaded_at) > NEARBY_MAX_AREAS:
+        oldest, _ = self._loaded_at.popitem(last=False)
+        self.grid.drop_area(oldest)
+    except Exception as e:
+      print(f"Nearby area {area} load failed: {e}")
+    finally:
+      self._misses.pop(area, None)
+      self._loading.pop(area, None)
+
+  # Expired areas are dropped and become hot again with the next queries
+  def _expire(self):
+    now = time.monotonic()
+    for area, loaded_at in list(self._loaded_at.items()):
+      if now - loaded_at > NEARBY_AREA_TTL:
+        del self._loaded_at[area]
+        self.grid.drop_area(area)
+
+nearby_service = NearbyService()
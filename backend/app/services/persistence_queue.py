@@ -0,0 +1,151 @@
+import asyncio
+import contextvars
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from dotenv import load_dotenv
+from app.db.mongodb import mongodb
+from app.utils.metrics import metrics
+
+load_dotenv()
+# Writes for the same session arriving within this window are merged into one MongoDB update
+PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", "0.5"))
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "50"))
+# A failed write is queued again this many times before it is dropped
+PERSIST_MAX_RETRIES = int(os.getenv("PERSIST_MAX_RETRIES", "3"))
+
+# Parts of a session document that can be pending
+SESSION = "session"
+HISTORY = "history"
+SHORTLIST = "shortlist"
+DELETE = "delete"
+
+SessionKey = Tuple[str, str]
+
+# Write-behind outbox for Redis -> MongoDB sync.
+# Pending parts are kept per session, the latest Redis state is read when the batch is flushed.
+class PersistenceQueue:
+  def __init__(
+    self,
+    load_fields: Callable[[str, str, Set[str]], Awaitable[Optional[Dict[str, Any]]]],
+    on_written: Optional[Callable[[str, str, Set[str], Optional[Dict[str, Any]]], Awaitable[None]]] = None,
+  ):
+    self.load_fields = load_fields
+    # Runs after a successful write with the parts and fields that were written
+    self.on_written = on_written
+    self._pending: Dict[SessionKey, Set[str]] = {}
+    self._attempts: Dict[SessionKey, int] = {}
+    self._wakeup = asyncio.Event()
+    self._stopping = asyncio.Event()
+    self._task: Optional[asyncio.Task] = None
+
+  def depth(self) -> int:
+    return len(self._pending)
+
+  def enqueue(self, user_id: str, session_id: str, part: str):
+    key = (user_id, session_id)
+    parts = self._pending.get(key)
+    if parts is None:
+      self._pending[key] = {part}
+    elif DELETE in parts:
+      # Session is being deleted, later writes would only bring it back
+      return
+    elif part == DELETE:
+      self._pending[key] = {DELETE}
+    else:
+      if part in parts:
+        metrics.incr("persist.coalesced")
+      parts.add(part)
+
+    metrics.incr("persist.enqueued")
+    metrics.set_gauge("persist.queue_depth", self.depth())
+    if (self._task is None or self._task.done()) and not self._stopping.is_set():
+      self.start()
+    self._wakeup.set()
+
+  # Runs in an empty context, so a loop restarted from a request does not count into that request
+  def start(self):
+    self._task = contextvars.Context().run(asyncio.create_task, self._run())
+
+  async def _run(self):
+    while not self._stopping.is_set():
+      await self._wakeup.wait()
+      # Let more writes for the same sessions arrive before flushing, unless shutting down
+      try:
+        await asyncio.wait_for(self._stopping.wait(), PERSIST_FLUSH_INTERVAL)
+      except asyncio.TimeoutError:
+        pass
+      self._wakeup.clear()
+      await self.flush()
+
+  # Failed writes are queued again after the flush, so they wait for the next one
+  async def flush(self):
+    failed = []
+    while self._pending:
+      batch = []
+      for key in list(self._pending)[:PERSIST_BATCH_SIZE]:
+        batch.append((key, self._pending.pop(key)))
+
+      start = time.perf_counter()
+      written = await asyncio.gather(*(self._write(key, parts) for key, parts in batch))
+      metrics.observe("persist.flush", (time.perf_counter() - start) * 1000)
+      metrics.incr("persist.flushed", len(batch))
+      failed += [item for item, ok in zip(batch, written) if not ok]
+    for key, parts in failed:
+      self._retry(key, parts)
+    metrics.set_gauge("persist.queue_depth", self.depth())
+
+  # Called from the lifespan on shutdown, nothing pending is lost on a clean exit.
+  # The loop is woken and finishes its flush, a batch already taken from the queue is not cancelled.
+  async def drain(self):
+    self._stopping.set()
+    self._wakeup.set()
+    if self._task is not None:
+      await asyncio.gather(self._task, return_exceptions=True)
+      self._task = None
+    await self.flush()
+    # Failed writes get their remaining retries before exit
+    while self._pending:
+      await asyncio.sleep(PERSIST_FLUSH_INTERVAL)
+      await self.flush()
+
+  def _retry(self, key: SessionKey, parts: Set[str]):
+    attempts = self._attempts.get(key, 0) + 1
+    if attempts > PERSIST_MAX_RETRIES:
+      self._attempts.pop(key, None)
+      print(f"ERROR: Dropping MongoDB write for {key[0]}/{key[1]} after {PERSIST_MAX_RETRIES} retries")
+      metrics.incr("persist.dropped")
+      return
+    self._attempts[key] = attempts
+    metrics.incr("persist.retried")
+    pending = self._pending.get(key)
+    if pending is None:
+      self._pending[key] = set(parts)
+    elif DELETE not in pending and DELETE not in parts:
+      pending |= parts
+    # Otherwise what was enqueued since is newer than the failed write and kept as is
+    self._wakeup.set()
+
+  # Returns whether the write went through
+  async def _write(self, key: SessionKey, parts: Set[str]) -> bool:
+    user_id, session_id = key
+    try:
+      db_session = mongodb.session
+      if db_session is None:
+        raise RuntimeError("Database not connected.")
+      fields = None
+      if DELETE in parts:
+        await db_session.delete_session(user_id, session_id)
+      else:
+        fields = await self.load_fields(user_id, session_id, parts)
+        if fields:
+          await db_session.save_session_fields(user_id, session_id, fields)
+    except Exception as e:
+      print(f"ERROR: Background save to MongoDB failed for {user_id}/{session_id}: {e}")
+      metrics.incr("persist.failed")
+      return False
+
+    self._attempts.pop(key, None)
+    if self.on_written is not None:
+      await self.on_written(user_id, session_id, parts, fields)
+    return True
@@ -0,0 +1,209 @@
+import asyncio
+import contextvars
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from app.db.mongodb import mongodb
+from app.models.recommend import ShortTermProfile
+from app.models.shortlist import ShortlistItem
+from app.utils.metrics import metrics
+from app.utils.vector_index import VectorIndex, embed_text, kmeans, EMBEDDING_DIM
+
+load_dotenv()
+PLACE_INDEX_ENABLED = os.getenv("PLACE_INDEX_ENABLED", "true").lower() == "true"
+# "flat" scores every place, "ivf" only the closest clusters
+PLACE_INDEX_MODE = os.getenv("PLACE_INDEX_MODE", "flat")
+PLACE_INDEX_NPROBE = int(os.getenv("PLACE_INDEX_NPROBE", "8"))
+# Places inserted into place_info by other workers are picked up this often
+PLACE_INDEX_REFRESH = int(os.getenv("PLACE_INDEX_REFRESH", "60"))
+# Places embedded per thread hop while refreshing
+PLACE_INDEX_BATCH = int(os.getenv("PLACE_INDEX_BATCH", "500"))
+# Places written this long before the last one seen are read again, for clock differences between workers
+PLACE_INDEX_REFRESH_OVERLAP = float(os.getenv("PLACE_INDEX_REFRESH_OVERLAP", "5"))
+# Candidates must be this close to a place of the session
+PLACE_INDEX_RADIUS_KM = float(os.getenv("PLACE_INDEX_RADIUS_KM", "50"))
+# and at least this similar to the profile
+PLACE_INDEX_MIN_SCORE = float(os.getenv("PLACE_INDEX_MIN_SCORE", "0.05"))
+# Share of the score given to rating and number of ratings
+PLACE_INDEX_POPULARITY_WEIGHT = float(os.getenv("PLACE_INDEX_POPULARITY_WEIGHT", "0.2"))
+
+EARTH_RADIUS_KM = 6371.0
+
+# Words the embedding of a place is made of, tags count double
+def place_text(place: ShortlistItem) -> str:
+  info = place.info
+  parts = [place.name, place.type or "", place.description or ""]
+  parts += [tag.replace("_", " ") for tag in place.tags or []] * 2
+  if info:
+    parts += info.pros or []
+    parts += [r.review for r in info.reviews or []]
+  return " . ".join(p for p in parts if p)
+
+# Rating scaled by how many people rated, 0..1
+def popularity(place: ShortlistItem) -> float:
+  info = place.info
+  if not info or not info.rating:
+    return 0.0
+  return info.rating / 5 * min(1.0, math.log10(1 + (info.total_ratings or 0)) / 4)
+
+# Preference tags by their weight, avoided tags negatively, plus the current input
+def profile_query(profile: ShortTermProfile, user_input: str = "") -> np.ndarray:
+  query = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+  for tag, tw in profile.preferences.items():
+    embed_text(tag.replace("_", " "), tw.weight, out=query)
+  for tag in profile.avoids:
+    embed_text(tag.replace("_", " "), -1.0, out=query)
+  embed_text(user_input, 0.5, out=query)
+  return query
+
+# In-process vector index over place_info, so places already resolved can be recommended
+# without an LLM call or Google lookup. Loaded in the background at startup, places saved by this
+# worker are added right away, places inserted or rewritten by other workers on the next refresh.
+class PlaceIndexService:
+  def __init__(self, mode: str = PLACE_INDEX_MODE):
+    self.index = VectorIndex(mode=mode, nprobe=PLACE_INDEX_NPROBE)
+    self._coords = np.full((0, 2), np.nan)
+    self._popularity = np.zeros(0)
+    self._since: Optional[datetime] = None
+    self._task: Optional[asyncio.Task] = None
+    self._training: Optional[asyncio.Task] = None
+    self.loaded = False
+
+  def start(self):
+    if self._task is None and PLACE_INDEX_ENABLED:
+      self._task = contextvars.Context().run(asyncio.create_task, self._refresh_loop())
+
+  async def stop(self):
+    if self._task is None:
+      return
+    self._task.cancel()
+    await asyncio.gather(self._task, return_exceptions=True)
+    self._task = None
+
+  # Called on the request path when a place is saved, only the embedding and cluster assignment run inline
+  def add(self, place: ShortlistItem):
+    if not PLACE_INDEX_ENABLED or not place.place_id:
+      return
+    self._add(place, embed_text(place_text(place)))
+    self._train_later()
+
+  def _add(self, place: ShortlistItem, vector: np.ndarray):
+    pos = self.index.upsert(place.place_id, vector)
+    if pos >= len(self._coords):
+      size = max(64, 2 * pos)
+      self._coords = np.vstack([self._coords, np.full((size - len(self._coords), 2), np.nan)])
+      self._popularity = np.concatenate([self._popularity, np.zeros(size - len(self._popularity))])
+    if place.geometry:
+      self._coords[pos] = np.radians(place.geometry.location)
+    self._popularity[pos] = popularity(place)
+
+  # Place ids of the best matches near the anchor places, best first.
+  # Without an anchor in the index the destination is unknown and nothing is returned.
+  def search(self, profile: ShortTermProfile, user_input: str, anchors: Iterable[str], exclude: Iterable[str] = (), k: int = 6) -> List[Tuple[str, float]]:
+    size = len(self.index)
+    anchor_pos = [self.index.positions[a] for a in anchors if a in self.index.positions]
+    anchor_coords = self._coords[anchor_pos]
+    anchor_coords = anchor_coords[~np.isnan(anchor_coords).any(axis=1)]
+    if size == 0 or len(anchor_coords) == 0:
+      return []
+
+    with metrics.timer("place_index.search"):
+      mask = self._near(anchor_coords, size)
+      mask[anchor_pos] = False
+      for place_id in exclude:
+        pos = self.index.positions.get(place_id)
+        if pos is not None:
+          mask[pos] = False
+      found = self.index.search(profile_query(profile, user_input), 4 * k, mask)
+      scored = [
+        (place_id, (1 - PLACE_INDEX_POPULARITY_WEIGHT) * score + PLACE_INDEX_POPULARITY_WEIGHT * float(self._popularity[self.index.positions[place_id]]))
+        for place_id, score in found if score >= PLACE_INDEX_MIN_SCORE
+      ]
+    scored.sort(key=lambda s: -s[1])
+    metrics.incr("place_index.hit" if scored else "place_index.miss")
+    return scored[:k]
+
+  def stats(self) -> Dict[str, float]:
+    return {
+      "size": len(self.index),
+      "loaded": self.loaded,
+      "mode": self.index.mode,
+      "hit": metrics.counter("place_index.hit"),
+      "miss": metrics.counter("place_index.miss"),
+    }
+
+  async def _add_batch(self, places: List[ShortlistItem]):
+    if not places:
+      return
+    vectors = await asyncio.to_thread(lambda: [embed_text(place_text(p)) for p in places])
+    for place, vector in zip(places, vectors):
+      self._add(place, vector)
+    self._train_later()
+
+  # Haversine distance of every indexed place to its closest anchor
+  def _near(self, anchor_coords: np.ndarray, size: int) -> np.ndarray:
+    lat, lng = self._coords[:size, 0:1], self._coords[:size, 1:2]
+    dlat = lat - anchor_coords[:, 0]
+    dlng = lng - anchor_coords[:, 1]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(anchor_coords[:, 0]) * np.sin(dlng / 2) ** 2
+    distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    # Places without geometry are never near
+    return np.nan_to_num(distance, nan=np.inf).min(axis=1) <= PLACE_INDEX_RADIUS_KM
+
+  # k-means runs in a thread, searches keep using the previous clusters until it is done.
+  # Without a running loop (benchmarks) the owner calls index.train() itself.
+  def _train_later(self):
+    if self._training is not None or not self.index.needs_training():
+      return
+    try:
+      asyncio.get_running_loop()
+    except RuntimeError:
+      return
+    self._training = contextvars.Context().run(asyncio.create_task, self._train())
+
+  async def _train(self):
+    try:
+      vectors = self.index.begin_training()
+      with metrics.timer("place_index.train"):
+        centroids, assign = await asyncio.to_thread(kmeans, vectors)
+      self.index.install(centroids, assign)
+    except Exception as e:
+      print(f"Place index training failed: {e}")
+    finally:
+      self._training = None
+
+  async def _refresh_loop(self):
+    while True:
+      try:
+        await self.refresh()
+      except Exception as e:
+        print(f"Place index refresh failed: {e}")
+      await asyncio.sleep(PLACE_INDEX_REFRESH)
+
+  # Adds or re-embeds the places written to place_info since the last refresh, all of them the first time.
+  # Places are embedded in a thread batch by batch, so the loop stays free at startup.
+  async def refresh(self):
+    if mongodb.place_info is None or not PLACE_INDEX_ENABLED:
+      return
+    since = self._since - timedelta(seconds=PLACE_INDEX_REFRESH_OVERLAP) if self._since else None
+    with metrics.timer("place_index.refresh"):
+      batch, last = [], self._since
+      async for updated_at, place in mongodb.place_info.iter_places(since):
+        if place.place_id:
+          batch.append(place)
+        if updated_at is not None:
+          last = updated_at
+        if len(batch) >= PLACE_INDEX_BATCH:
+          await self._add_batch(batch)
+          batch, self._since = [], last
+      await self._add_batch(batch)
+      self._since = last
+    if not self.loaded:
+      self.loaded = True
+      print(f"Place index loaded {len(self.index)} places")
+    metrics.set_gauge("place_index.size", len(self.index))
+
+place_index_service = PlaceIndexService()
@@ -0,0 +1,216 @@
+import os
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.db.mongodb import mongodb
+from app.models.session import History
+from app.models.shortlist import ShortlistItem
+from app.services.nearby_service import nearby_service
+from app.services.place_index_service import place_index_service
+from app.services.redis_service import redis_service
+from app.utils.metrics import metrics
+from app.utils.serialization import place_codec
+
+load_dotenv()
+PLACE_CACHE_TTL = int(os.getenv("PLACE_CACHE_TTL", str(24 * 3600)))
+PLACE_ALIAS_TTL = int(os.getenv("PLACE_ALIAS_TTL", str(7 * 24 * 3600)))
+# Names Google could not resolve are not looked up again for this long
+PLACE_NEGATIVE_TTL = int(os.getenv("PLACE_NEGATIVE_TTL", "600"))
+
+# Stored as the alias value of names Google could not resolve
+UNRESOLVABLE = ""
+
+# "The Louvre", "louvre" and "Louvré" are one alias
+def normalize_place_name(name: str) -> str:
+  name = unicodedata.normalize("NFKD", name or "")
+  name = "".join(c for c in name if not unicodedata.combining(c)).lower()
+  name = re.sub(r"[^\w\s]", " ", name)
+  name = re.sub(r"^the\s+", "", name.strip())
+  return re.sub(r"\s+", " ", name).strip()
+
+# Places keyed by Google place_id in Redis (place:{id}) and MongoDB (place_info),
+# with an alias index from normalized names to place_id in both
+class PlaceStoreService:
+  def _place_key(self, place_id: str) -> str:
+    return f"place:{place_id}"
+
+  def _alias_key(self, alias: str) -> str:
+    return f"place_alias:{alias}"
+
+  # Returns (place, unresolvable), unresolvable is True for a cached negative entry
+  async def lookup(self, name: str) -> Tuple[Optional[ShortlistItem], bool]:
+    alias = normalize_place_name(name)
+    if not alias:
+      return None, True
+
+    client = redis_service.get_redis_client()
+    place_id = None
+    try:
+      place_id = await client.get(self._alias_key(alias))
+      if place_id == UNRESOLVABLE:
+        metrics.incr("place_store.hit.negative")
+        return None, True
+      if place_id:
+        raw = await client.get(self._place_key(place_id))
+        if raw:
+          metrics.incr("place_store.hit.redis")
+          return place_codec.loads(raw), False
+    except Exception as e:
+      print(f"Place store read failed for {name}: {e}")
+
+    place = await self._lookup_mongo(alias, name, place_id)
+    if place:
+      metrics.incr("place_store.hit.mongo")
+      await self._set_redis(place, [alias])
+      return place, False
+    return None, False
+
+  async def get_by_id(self, place_id: str) -> Optional[ShortlistItem]:
+    try:
+      raw = await redis_service.get(self._place_key(place_id))
+      if raw:
+        return place_codec.loads(raw)
+    except Exception as e:
+      print(f"Place store read failed for {place_id}: {e}")
+    if mongodb.place_info is None:
+      return None
+    place = await mongodb.place_info.get_place_by_id(place_id)
+    if place:
+      await self._set_redis(place, [])
+    return place
+
+  # Places by id, one MGET for all of them and one MongoDB query for the misses
+  async def get_many(self, place_ids: Iterable[str]) -> Dict[str, ShortlistItem]:
+    place_ids = list(dict.fromkeys(i for i in place_ids if i))
+    if not place_ids:
+      return {}
+
+    places = {}
+    try:
+      raws = await redis_service.get_redis_client().mget([self._place_key(i) for i in place_ids])
+      for place_id, raw in zip(place_ids, raws):
+        if raw:
+          places[place_id] = place_codec.loads(raw)
+    except Exception as e:
+      print(f"Place store read failed for {len(place_ids)} places: {e}")
+
+    missing = [i for i in place_ids if i not in places]
+    if missing and mongodb.place_info is not None:
+      try:
+        found = await mongodb.place_info.get_places_by_ids(missing)
+      except Exception as e:
+        print(f"Place store MongoDB read failed for {len(missing)} places: {e}")
+        found = []
+      for place in found:
+        places[place.place_id] = place
+      await self._set_redis_many(found)
+    return places
+
+  # History and shortlist store places as references, both are hydrated with one bulk lookup.
+  # known: places the caller already read, only the others are looked up
+  async def hydrate_session(self, history: List[History], shortlist: List[ShortlistItem], known: Optional[Dict[str, ShortlistItem]] = None) -> Tuple[List[History], List[ShortlistItem]]:
+    refs = [p for h in history for p in (h.message.recommendations or []) + (h.message.populars or [])]
+    places = dict(known or {})
+    with metrics.timer("place_store.hydrate"):
+      places.update(await self.get_many(p.place_id for p in refs + shortlist if p.place_id not in places))
+
+    def hydrate_all(items: Optional[List[ShortlistItem]]) -> List[ShortlistItem]:
+      return [p.hydrate(places.get(p.place_id)) if p.place_id else p for p in items or []]
+
+    hydrated = [
+      h.model_copy(update={"message": h.message.model_copy(update={
+        "recommendations": hydrate_all(h.message.recommendations),
+        "populars": hydrate_all(h.message.populars),
+      })}) if h.message.recommendations or h.message.populars else h
+      for h in history
+    ]
+    return hydrated, hydrate_all(shortlist)
+
+  async def hydrate(self, items: List[ShortlistItem], known: Optional[Dict[str, ShortlistItem]] = None) -> List[ShortlistItem]:
+    _, hydrated = await self.hydrate_session([], items, known)
+    return hydrated
+
+  # Save the place and point every given name, and its own name, at it
+  async def save(self, place: ShortlistItem, names: Iterable[str] = ()):
+    aliases = {normalize_place_name(n) for n in (place.name, *names)}
+    aliases.discard("")
+    await self._set_redis(place, aliases)
+    place_index_service.add(place)
+    nearby_service.add(place)
+    if mongodb.place_info is None:
+      return
+    try:
+      await mongodb.place_info.save_place(place)
+      if place.place_id:
+        await mongodb.place_alias.save_aliases(aliases, place.place_id)
+    except Exception as e:
+      print(f"Place store MongoDB write failed for {place.name}: {e}")
+
+  async def save_unresolvable(self, name: str):
+    alias = normalize_place_name(name)
+    if not alias:
+      return
+    try:
+      await redis_service.set(self._alias_key(alias), UNRESOLVABLE, ex=PLACE_NEGATIVE_TTL)
+    except Exception as e:
+      print(f"Place store write failed for {name}: {e}")
+
+  # Called once per lookup that had to go to Google, with the outcome
+  def record_google(self, resolved: bool):
+    metrics.incr("place_store.hit.google" if resolved else "place_store.miss")
+
+  def stats(self) -> Dict[str, float]:
+    tiers = {
+      "redis": metrics.counter("place_store.hit.redis"),
+      "mongo": metrics.counter("place_store.hit.mongo"),
+      "google": metrics.counter("place_store.hit.google"),
+      "negative": metrics.counter("place_store.hit.negative"),
+      "unresolved": metrics.counter("place_store.miss"),
+    }
+    total = sum(tiers.values())
+    stats = dict(tiers)
+    stats["lookups"] = total
+    for tier, count in tiers.items():
+      stats[f"{tier}_rate"] = round(count / total, 4) if total else 0.0
+    return stats
+
+  async def _lookup_mongo(self, alias: str, name: str, place_id: Optional[str]) -> Optional[ShortlistItem]:
+    if mongodb.place_info is None:
+      return None
+    try:
+      if not place_id:
+        place_id = await mongodb.place_alias.get_place_id(alias)
+      if place_id:
+        return await mongodb.place_info.get_place_by_id(place_id)
+      # Places saved before the alias index only have their name
+      return await mongodb.place_info.get_place(name)
+    except Exception as e:
+      print(f"Place store MongoDB read failed for {name}: {e}")
+      return None
+
+  async def _set_redis(self, place: ShortlistItem, aliases: Iterable[str]):
+    if not place.place_id:
+      return
+    try:
+      async with redis_service.get_redis_client().pipeline(transaction=False) as pipe:
+        pipe.set(self._place_key(place.place_id), place_codec.dumps(place), ex=PLACE_CACHE_TTL)
+        for alias in aliases:
+          pipe.set(self._alias_key(alias), place.place_id, ex=PLACE_ALIAS_TTL)
+        await pipe.execute()
+    except Exception as e:
+      print(f"Place store write failed for {place.name}: {e}")
+
+  async def _set_redis_many(self, places: List[ShortlistItem]):
+    places = [p for p in places if p.place_id]
+    if not places:
+      return
+    try:
+      async with redis_service.get_redis_client().pipeline(transaction=False) as pipe:
+        for place in places:
+          pipe.set(self._place_key(place.place_id), place_codec.dumps(place), ex=PLACE_CACHE_TTL)
+        await pipe.execute()
+    except Exception as e:
+      print(f"Place store write failed for {len(places)} places: {e}")
+
+place_store_service = PlaceStoreService()
@@ -0,0 +1,108 @@
+import os
+from typing import Dict, List, Optional, Set
+from dotenv import load_dotenv
+from app.db.mongodb import mongodb
+from app.models.recommend import ProfileFoldState, SessionContribution, ShortTermProfile, TagWeight
+from app.services.persistence_queue import DELETE
+from app.utils.metrics import metrics
+
+load_dotenv()
+# Weight of a session relative to the next more recent one
+PROFILE_DECAY = float(os.getenv("PROFILE_DECAY", "0.7"))
+# Sessions decayed below this factor are forgotten, a later revisit just adds on top
+PROFILE_MIN_FACTOR = float(os.getenv("PROFILE_MIN_FACTOR", "0.01"))
+PROFILE_SAVE_RETRIES = 3
+
+# Keeps LongTermProfile up to date from the short-term profile of each saved session.
+# A save costs O(tags): the previous contribution of the session is taken out at its decayed
+# weight and the new one added, instead of recomputing over every session of the user.
+class ProfileService:
+  # Called by the persistence queue after a session was written to MongoDB
+  async def on_session_written(self, user_id: str, session_id: str, parts: Set[str], fields: Optional[dict]):
+    if DELETE in parts:
+      await self.remove_session(user_id, session_id)
+    elif fields and fields.get("short_term_profile") is not None:
+      await self.fold_session(user_id, session_id, ShortTermProfile(**fields["short_term_profile"]))
+
+  async def fold_session(self, user_id: str, session_id: str, profile: ShortTermProfile):
+    preferences = {tag: tw.weight for tag, tw in profile.preferences.items()}
+    await self._update(user_id, lambda state: self._fold(state, session_id, preferences, profile.avoids))
+
+  async def remove_session(self, user_id: str, session_id: str):
+    await self._update(user_id, lambda state: self._subtract(state, session_id))
+
+  # Fold every stored session, oldest first. Used once for users saved before the fold state existed.
+  async def rebuild(self, user_id: str) -> ProfileFoldState:
+    state = ProfileFoldState()
+    for doc in await mongodb.session.get_profiles_by_user_id(user_id):
+      profile = ShortTermProfile(**(doc.get("short_term_profile") or {}))
+      self._fold(state, doc["session_id"], {tag: tw.weight for tag, tw in profile.preferences.items()}, profile.avoids)
+    if await mongodb.user_preference.save_folded(user_id, state, self.normalize(state), self.avoids(state)):
+      metrics.incr("profile.rebuild")
+    return state
+
+  def normalize(self, state: ProfileFoldState) -> Dict[str, TagWeight]:
+    if not state.raw_preferences:
+      return {}
+    max_weight = max(state.raw_preferences.values())
+    return {
+      tag: TagWeight(tag=tag, weight=round(weight / max_weight, 4) if max_weight > 0 else 0.0)
+      for tag, weight in state.raw_preferences.items()
+    }
+
+  # Union of the avoids of every session still stored
+  def avoids(self, state: ProfileFoldState) -> List[str]:
+    return sorted({tag for c in state.contributions.values() for tag in c.avoids})
+
+  async def _update(self, user_id: str, apply):
+    if mongodb.user_preference is None:
+      return
+    try:
+      for _ in range(PROFILE_SAVE_RETRIES):
+        state = await mongodb.user_preference.get_fold_state(user_id)
+        if state is None:
+          # The rebuild already reads what was just written
+          await self.rebuild(user_id)
+          return
+        apply(state)
+        with metrics.timer("profile.fold"):
+          if await mongodb.user_preference.save_folded(user_id, state, self.normalize(state), self.avoids(state)):
+            return
+        metrics.incr("profile.conflict")
+      print(f"Long-term profile of {user_id} not updated, too many concurrent writes")
+    except Exception as e:
+      print(f"Error updating long-term profile of {user_id}: {e}")
+
+  def _fold(self, state: ProfileFoldState, session_id: str, preferences: Dict[str, float], avoids: List[str]):
+    if state.head_session_id != session_id:
+      # Another session becomes the most recent, everything before it decays one step
+      state.epoch += 1
+      state.raw_preferences = {tag: weight * PROFILE_DECAY for tag, weight in state.raw_preferences.items()}
+      state.head_session_id = session_id
+    self._subtract(state, session_id)
+    for tag, weight in preferences.items():
+      state.raw_preferences[tag] = state.raw_preferences.get(tag, 0.0) + weight
+    state.contributions[session_id] = SessionContribution(preferences=preferences, avoids=avoids, epoch=state.epoch)
+    self._prune(state)
+
+  def _subtract(self, state: ProfileFoldState, session_id: str):
+    previous = state.contributions.pop(session_id, None)
+    if previous is None:
+      return
+    factor = PROFILE_DECAY ** (state.epoch - previous.epoch)
+    for tag, weight in previous.preferences.items():
+      state.raw_preferences[tag] = state.raw_preferences.get(tag, 0.0) - weight * factor
+    self._prune(state)
+
+  # Forgotten sessions keep only their avoids
+  def _prune(self, state: ProfileFoldState):
+    contributions = {}
+    for sid, c in state.contributions.items():
+      if PROFILE_DECAY ** (state.epoch - c.epoch) >= PROFILE_MIN_FACTOR:
+        contributions[sid] = c
+      elif c.avoids:
+        contributions[sid] = SessionContribution(avoids=c.avoids, epoch=c.epoch)
+    state.contributions = contributions
+    state.raw_preferences = {tag: weight for tag, weight in state.raw_preferences.items() if weight > 1e-6}
+
+profile_service = ProfileService()
@@ -1,14 +1,12 @@
-from collections import defaultdict
 from pydantic import BaseModel
-from typing import Dict, List, Any, Optional
+from typing import Awaitable, Callable, List, Any, Optional
 from app.db.mongodb import get_database
 from app.models.user_preference import UserPreference
-from app.models.place_info import PlaceInfo
-from app.models.recommend import LongTermProfile, TagWeight, UserBehavior
+from app.models.recommend import LongTermProfile, TagWeight
 from app.models.shortlist import ShortlistItem, PlaceReview, PlaceGeo, PlaceDetail, PlaceCard
 from app.models.session import SessionState, Message, History
 from app.services.shared import language_model, openai_language_model
-from app.services.redis_service import redis_service
+from app.services.session_context import SessionContext
 from app.utils.prompts import (
   EXTRACT_PREFERENCES_PROMPT, 
   RECOMMEND_NEW_PLACES_PROMPT, 
@@ -18,13 +16,28 @@ from app.utils.prompts import (
   TOPIC_RECOMMEND_PROMPT,
 )
 from langchain_core.output_parsers import JsonOutputParser
-import math
-import googlemaps
-from dotenv import load_dotenv
-import os
+from app.services.google_maps_service import google_maps_service
+from app.services.llm_cache_service import llm_cache_service
+from app.services.place_store_service import place_store_service, normalize_place_name
+from app.services.place_index_service import place_index_service
+from app.services.enrichment_scheduler import EnrichmentScheduler
 from datetime import timedelta, datetime
 from app.utils.logger import logger
+from app.utils.concurrency import bounded_gather
+from app.utils.single_flight import SingleFlight
+from pydantic import TypeAdapter
+from app.utils.metrics import metrics
+from app.utils.behavior_scoring import aggregate_behaviors
+from app.utils.place_ranking import rank_places
+from app.utils.streaming import EventStream, stream_json_field
 import asyncio
+import os
+
+# Max place lookups in flight for one request
+PLACE_RESOLVE_CONCURRENCY = int(os.getenv("PLACE_RESOLVE_CONCURRENCY", "5"))
+# Popular picks taken from the local place index, the LLM is only asked when fewer than LOCAL_POPULARS_MIN match
+LOCAL_POPULARS = int(os.getenv("LOCAL_POPULARS", "6"))
+LOCAL_POPULARS_MIN = int(os.getenv("LOCAL_POPULARS_MIN", "4"))
 
 class PlacePreference(BaseModel):
   place: str
@@ -59,11 +72,18 @@ ADMINISTRATIVE_TYPES = {
   'country',
 }
 
+# Google place types that say nothing about what a place is like
+GENERIC_TYPES = {
+  'point_of_interest',
+  'establishment',
+  'tourist_attraction',
+  'premise',
+  'geocode',
+}
+
 class RecommendService:
   def __init__(self):
-    load_dotenv()
-    self.key = os.getenv("GOOGLE_API")
-    self.gmaps = googlemaps.Client(key=self.key)
+    self.gmaps = google_maps_service
 
     self.extract_preferences_chain = (
       EXTRACT_PREFERENCES_PROMPT
@@ -77,13 +97,18 @@ class RecommendService:
       | JsonOutputParser(pydantic_object=LLMRes)
     )
 
-    self.enrich_place_detail_chain = (
+    # Both prompts only take a place name, answers are shared across users through the LLM cache
+    self.enrich_place_detail_chain = llm_cache_service.wrap(
+      "place_detail_enrich",
+      PLACE_DETAIL_ENRICH_PROMPT,
       PLACE_DETAIL_ENRICH_PROMPT
       | language_model
       | JsonOutputParser()
     )
 
-    self.popular_places_chain = (
+    self.popular_places_chain = llm_cache_service.wrap(
+      "city_popular_attractions",
+      CITY_POPULAR_ATTRACTIONS_PROMPT,
       CITY_POPULAR_ATTRACTIONS_PROMPT
       | language_model
       | JsonOutputParser(pydantic_object=PlaceCard)
@@ -101,6 +126,12 @@ class RecommendService:
       | JsonOutputParser()
     )
     
+    # Google lookups and LLM enrichment of one place run once however many users ask at the same time
+    self.fetch_flight = SingleFlight("place_fetch", TypeAdapter(Optional[ShortlistItem]), lock_ttl=30)
+    self.enrich_flight = SingleFlight("place_enrich", TypeAdapter(Optional[ShortlistItem]), lock_ttl=180)
+    # Background enrichment, started and stopped with the app
+    self.enrichment = EnrichmentScheduler(self.enrich_place_detail)
+
     self.sigmoid_scale = 0.5
 
     self.init_weight = 0.8
@@ -110,35 +141,32 @@ class RecommendService:
     user_preference = UserPreference(db)
     return await user_preference.get_preference(user_id)
 
-  async def save_long_preferences(self, profile: LongTermProfile):
-    db = get_database()
-    user_preference = UserPreference(db)
-    await user_preference.save_preference(profile)
-
   async def clear_long_preferences(self, user_id: str):
     db = get_database()
     user_preference = UserPreference(db)
     await user_preference.delete_preference(user_id)
 
-  async def update_short_term_profile(self, session_state: SessionState, user_input: str) -> SessionState:
+  # long_term_profile is read from MongoDB unless the caller already has it
+  async def update_short_term_profile(self, ctx: SessionContext, user_input: str, long_term_profile: Optional[LongTermProfile] = None) -> SessionState:
+    session_state = ctx.state
     user_behavior = session_state.current_user_behavior
     place_names = None
     short_term_profile = session_state.short_term_profile
-    long_term_profile = await self.get_long_preferences(session_state.user_id)
+    if long_term_profile is None:
+      long_term_profile = await self.get_long_preferences(session_state.user_id)
     # Update shortlist
+    behavior_scores = aggregate_behaviors(user_behavior, self.sigmoid_scale)
     if (user_behavior != None): 
       place_names = set()
       for behavior in user_behavior:
         place_names.add(behavior.place_name)
         if behavior.event_type == 'shortlist':
-          shortlist_place = await redis_service.get_place_info(behavior.place_name)
-          if shortlist_place is None:
-            shortlist_place = await self.get_place_info(behavior.place_name)
+          shortlist_place, _ = await place_store_service.lookup(behavior.place_name)
           if shortlist_place is None:
             raise Exception("None")
-          await redis_service.add_to_shortlist(session_state, shortlist_place)
+          ctx.add_to_shortlist(shortlist_place)
         elif behavior.event_type == 'unshortlist':
-          await redis_service.remove_from_shortlist(session_state, behavior.place_name)
+          ctx.remove_from_shortlist(behavior.place_name)
     
     raw_data = await self.extract_preferences_chain.ainvoke({
       "places": place_names, 
@@ -155,10 +183,8 @@ class RecommendService:
 
       # Behaviors acted at each place according to user_behavior
       if user_behavior != None:
-        place_behaviors = [b for b in user_behavior if b.place_name == place_name]
-
-        # Total weight of each place, according to place_behaviors
-        total_weight = self.sigmoid(sum(self.raw_behavior_score(b) for b in place_behaviors))
+        # Total weight of each place, a place without events scores sigmoid(0)
+        total_weight = behavior_scores.get(place_name, 0.5)
 
         # Add new weight to short_term_profile, according to each style
         for style in inferred_styles:
@@ -181,35 +207,25 @@ class RecommendService:
       else:
         short_term_profile.preferences[style] = TagWeight(tag=style, weight=self.init_weight)
     
-    shortlist = await redis_service.get_shortlist(session_state.user_id, session_state.session_id)
-    session_state = await redis_service.update_session_field(session_state.user_id, session_state.session_id, "shortlist", shortlist)
+    # Shortlist and profile changes are committed with the rest of the turn
     return session_state
   
-  async def get_place_info(self, place_name: str) -> ShortlistItem | None:
-    db = get_database()
-    place_info = PlaceInfo(db)
-    return await place_info.get_place(place_name)
-  
-  async def save_place_info(self, placeInfo: ShortlistItem):
-    db = get_database()
-    place_info = PlaceInfo(db)
-    return await place_info.save_place(placeInfo)
-  
-  async def recommend_places(self, session_state: SessionState, user_input: str):
+  async def recommend_places(self, ctx: SessionContext, user_input: str, stream: Optional[EventStream] = None, long_term_profile: Optional[LongTermProfile] = None):
+    session_state = ctx.state
     user_id = session_state.user_id
-    session_id = session_state.session_id
-    long_term_profile = await self.get_long_preferences(user_id)
+    if long_term_profile is None:
+      long_term_profile = await self.get_long_preferences(user_id)
     short_term_profile = session_state.short_term_profile
     recommended_places = session_state.recommended_places
-    history = await redis_service.get_simplified_history(session_state)
+    history = ctx.get_simplified_history()
 
-    raw_data = await self.recommend_places_chain.ainvoke({
+    raw_data = await stream_json_field(self.recommend_places_chain, {
       "user_input": user_input,
       "long_term_profile": long_term_profile,
       "short_term_profile": short_term_profile,
       "recommended_places": recommended_places,
       "history": history,
-    })
+    }, stream)
 
     # logger.info(f"short_term_profile: {short_term_profile}, user_input: {user_input}, recommend_places: {raw_data}")
     
@@ -220,96 +236,125 @@ class RecommendService:
     )
 
     for place in recommendations:
-      # If place information is in DB, get place info, else fetch from google map api
       session_state.add_recommended_places(place.name)
-      place_info = await self.get_or_fetch_place_brief(place.name, place.description, place.recommend_reason)
-      if place_info:
-        response.recommendations.append(place_info)
-    
-    raw_popular = await self.popular_recommends_chain.ainvoke({
-      "user_input": user_input,
-      "recommended_places": session_state.recommended_places,
-      "history": history,
-    })
-
-    populars = [PlaceCard(**p) for p in raw_popular]
 
-    for place in populars:
-      # If place information is in DB, get place info, else fetch from google map api
-      session_state.add_recommended_places(place.name)
-      place_info = await self.get_or_fetch_place_brief(place.name, place.description, place.recommend_reason)
-      if place_info:
-        response.populars.append(place_info)
+    # Already resolved places near the ones of this session, they replace the LLM's popular picks
+    local_populars = await self.local_candidates(ctx, user_input, LOCAL_POPULARS + len(recommendations))
+    if len(local_populars) < LOCAL_POPULARS_MIN:
+      local_populars = None
+
+    async def popular_cards():
+      if local_populars is not None:
+        return []
+      return await self.popular_recommends_chain.ainvoke({
+        "user_input": user_input,
+        "recommended_places": session_state.recommended_places,
+        "history": history,
+      })
+
+    # Popular picks only depend on the recommended names, so the LLM call overlaps with place resolution
+    resolved, raw_popular = await asyncio.gather(
+      self.resolve_places(recommendations, stream.card_emitter("recommendations") if stream else None),
+      popular_cards(),
+    )
+    # Closest to the session's preferences first
+    response.recommendations.extend(rank_places(resolved, short_term_profile))
+
+    if local_populars is not None:
+      recommended_ids = {p.place_id for p in resolved}
+      populars = [p for p in local_populars if p.place_id not in recommended_ids][:LOCAL_POPULARS]
+      for place in populars:
+        session_state.add_recommended_places(place.name)
+        if stream:
+          await stream.card("populars", place)
+      response.populars.extend(populars)
+    else:
+      populars = [PlaceCard(**p) for p in raw_popular]
+      for place in populars:
+        session_state.add_recommended_places(place.name)
+      response.populars.extend(rank_places(
+        await self.resolve_places(populars, stream.card_emitter("populars") if stream else None),
+        short_term_profile,
+      ))
     
     user_history_entry = History(
       role="ai",
       message=response
     )
-    await redis_service.append_history(session_state, user_history_entry)
-    await redis_service.save_session_state(session_state)
+    ctx.append_history(user_history_entry)
 
     return response
   
+  # Places from the local index matching the profile, near the shortlist and the latest recommendations.
+  # Places the session has already seen are left out.
+  async def local_candidates(self, ctx: SessionContext, user_input: str, k: int) -> List[ShortlistItem]:
+    anchors = [s.place_id for s in ctx.get_shortlist() if s.place_id]
+    seen = set(anchors)
+    latest = True
+    for entry in reversed(ctx.history):
+      message = entry.message
+      place_ids = [p.place_id for p in (message.recommendations or []) + (message.populars or []) if p.place_id]
+      if place_ids and latest:
+        anchors += place_ids
+        latest = False
+      seen.update(place_ids)
+
+    found = place_index_service.search(ctx.state.short_term_profile, user_input, anchors, seen, k)
+    if not found:
+      return []
+    places = await place_store_service.get_many(place_id for place_id, _ in found)
+    recommended = ctx.state.recommended_places_set
+    return [places[i] for i, _ in found if i in places and places[i].name not in recommended]
+
+  # Resolve place cards concurrently, bounded per request, keeping the order of cards
+  async def resolve_places(self, cards: List[PlaceCard], on_resolved: Optional[Callable[[int, Optional[ShortlistItem]], Awaitable[None]]] = None) -> List[ShortlistItem]:
+    async def resolve(card: PlaceCard) -> Optional[ShortlistItem]:
+      with metrics.timer("place.resolve"):
+        return await self.get_or_fetch_place_brief(card.name, card.description, card.recommend_reason)
+
+    places = await bounded_gather(resolve, cards, PLACE_RESOLVE_CONCURRENCY, on_resolved)
+    return [p for p in places if p]
+
   async def get_or_fetch_place_brief(self, place_name: str, description: Optional[str] = None, recommend_reason: Optional[str] = None) -> ShortlistItem:
-    # Check if in Redis
-    place_info = await redis_service.get_place_info(place_name)
-    # Check if in MongoDB
-    if place_info is None:
-      place_info = await self.get_place_info(place_name)
-    if place_info is None:
-      # Fetch from google map api
-      places = self.gmaps.find_place(place_name, "textquery", fields=['place_id', 'name']).get("candidates", [])
-      if len(places):
-        place_id = places[0].get('place_id')
-        official_name = places[0].get('name')
-        place_info = await self.get_place_info(official_name)
-        if not place_info:
-          result = self.gmaps.place(place_id, ESSENTIAL_FIELDS).get("result")
-          place_info = self.google_to_shortlist(result, description, recommend_reason)
-    if place_info: 
+    # Check Redis and MongoDB through the alias index
+    place_info, unresolvable = await place_store_service.lookup(place_name)
+    if place_info is None and not unresolvable:
+      # Fetch from google map api, once for concurrent requests of the same name
+      place_info = await self.fetch_flight.do(
+        normalize_place_name(place_name),
+        lambda: self.fetch_place(place_name, description, recommend_reason)
+      )
+      # Callers that joined the flight get the same object, each sets its own card text
+      if place_info:
+        place_info = place_info.model_copy(deep=True)
+    if place_info:
       place_info.description = description
       place_info.info.recommend_reason = recommend_reason
-      # Save in Redis and MongoDB
-      await redis_service.save_place_info(place_info.name, place_info)
-      await self.save_place_info(place_info)
-      asyncio.create_task(self.enrich_place_detail(place_info.name))
+      # Save in Redis and MongoDB, the queried name becomes an alias of the place
+      await place_store_service.save(place_info, [place_name])
+      # Speculative, dropped when the enrichment queue is full
+      self.enrichment.submit(place_info.name)
     
     return place_info
 
-  async def update_longterm_profile(self, user_id: str, session_info: List) -> LongTermProfile:
-    decaying_preferences: Dict[str, float] = defaultdict(float)
-    avoids_set = set()
-    
-    for i, session in enumerate(session_info):
-      stp = session.get("short_term_profile", {})
-      decay = 1.0 / (i + 1)
-      for tag, tag_weight in stp.preferences.items():
-        decaying_preferences[tag] += tag_weight.weight * decay
-      avoids_set.update(stp.avoids, [])
-      
-    normalized_preferences = {}
-    if decaying_preferences:
-      max_weight = max(decaying_preferences.values())
-      if max_weight > 0:
-        normalized_preferences = {
-          tag: TagWeight(tag=tag, weight=round(weight / max_weight, 4))
-          for tag, weight in decaying_preferences.items()
-        }
-      else:
-        normalized_preferences = {
-          tag: TagWeight(tag=tag, weight=0.0)
-          for tag in decaying_preferences
-        }
-      
-    long_term_pref = LongTermProfile(
-      user_id=user_id,
-      verified_preferences={},
-      decaying_preferences=normalized_preferences,
-      avoids=list(avoids_set),
-    )
-    
-    await self.save_long_preferences(long_term_pref)
-    return long_term_pref
+  # Google tier of the place store, details are only requested for place ids not stored yet
+  async def fetch_place(self, place_name: str, description: Optional[str] = None, recommend_reason: Optional[str] = None) -> Optional[ShortlistItem]:
+    found = await self.gmaps.find_place(place_name, ['place_id', 'name'])
+    places = found.get("candidates", [])
+    if not places:
+      # Only a definite answer is cached, not a failed request
+      if found.get("status") == "ZERO_RESULTS":
+        await place_store_service.save_unresolvable(place_name)
+      place_store_service.record_google(False)
+      return None
+
+    place_info = await place_store_service.get_by_id(places[0].get('place_id'))
+    if not place_info:
+      result = (await self.gmaps.place(places[0].get('place_id'), ESSENTIAL_FIELDS)).get("result")
+      if result:
+        place_info = self.google_to_shortlist(result, description, recommend_reason)
+    place_store_service.record_google(place_info is not None)
+    return place_info
 
   async def recommend_topics(self, user_id: str) -> List[TopicRec]:
     long_term_profile = await self.get_long_preferences(user_id)
@@ -318,18 +363,6 @@ class RecommendService:
     result = [TopicRec(**r) for r in raw_result]
     return result
 
-  def raw_behavior_score(self, behavior: UserBehavior) -> float:
-    return (
-      0.5 * (behavior.event_type == "click") +
-      1.0 * (behavior.event_type == "view") +
-      3.0 * (behavior.event_type == "shortlist") -
-      3.0 * (behavior.event_type == "unshortlist") +
-      0.1 * (behavior.duration_sec / 10 if behavior.duration_sec else 0)
-    )
-  
-  def sigmoid(self, x: float) -> float:
-    return 1 / (1 + math.exp(-self.sigmoid_scale * x))
-  
   def google_to_placeinfo(self, result: Any, recommend_reason: str) -> PlaceDetail:
     opening_hours = result.get('opening_hours', {})
     reviews = result.get('reviews', [])
@@ -351,6 +384,8 @@ class RecommendService:
   def google_to_shortlist(self, result: Any, description: str, recommend_reason: str) -> ShortlistItem:
     photos = result.get('photos', [])
     type = "city" if ADMINISTRATIVE_TYPES.intersection(result.get('types', [])) else "attraction"
+    # Place types become tags, e.g. 'museum', 'park', 'art_gallery', used to rank places locally
+    tags = [t for t in result.get('types', []) if t not in GENERIC_TYPES and t not in ADMINISTRATIVE_TYPES]
     google_geom = result.get('geometry', {})
 
     return ShortlistItem(
@@ -358,6 +393,7 @@ class RecommendService:
       type=type,
       place_id=result.get('place_id'),
       description=description,
+      tags=tags,
       info=self.google_to_placeinfo(result, recommend_reason),
       geometry=PlaceGeo(
         location=[google_geom.get('location').get('lat'), google_geom.get('location').get('lng')],
@@ -368,56 +404,43 @@ class RecommendService:
           google_geom.get('viewport').get('southwest').get('lng')]
         ]
       ),
-      photos=[(f"https://maps.googleapis.com/maps/api/place/photo?maxwidth=1600&photo_reference={p.get('photo_reference')}&key={self.key}")
-        for p in photos if p.get('photo_reference')],
+      photos=[self.gmaps.photo_url(p.get('photo_reference')) for p in photos if p.get('photo_reference')],
       updated_time=datetime.now()
     )
 
-  # Place information needs to be generated by ai or updated
+  # Place information needs to be generated by ai or updated.
+  # Concurrent calls for the same place, from any worker, share one run and its result.
   async def enrich_place_detail(self, place_name: str) -> ShortlistItem:
-    # Redis lock ensures tasks not duplicate
-    lock_key = f"place_lock:{place_name}"
-    if redis_service.get(lock_key):
+    return await self.enrich_flight.do(normalize_place_name(place_name), lambda: self._enrich_place_detail(place_name))
+
+  async def _enrich_place_detail(self, place_name: str) -> Optional[ShortlistItem]:
+    place, _ = await place_store_service.lookup(place_name)
+    if not place:
+      place = await self.get_or_fetch_place_brief(place_name, None, None)
+    
+    if not place:
       return
-    try:
-      redis_service.set(lock_key, "1", ex=300)
-      place = await redis_service.get_place_info(place_name)
-
-      if not place:
-        place = await self.get_place_info(place_name)
-      if not place:
-        place = await self.get_or_fetch_place_brief(place_name, None, None)
-      
-      if not place:
-        return
-
-      isChanged = False
-      # City: Top ten attractions in city
-      if (place.type == "city") and (len(place.sub_items) == 0):
-        raw_data = await self.popular_places_chain.ainvoke(place_name)
-        popular_places: List[PlaceCard] = [PlaceCard(**item) for item in raw_data]
-        for p in popular_places:
-          place_info = await self.get_or_fetch_place_brief(p.name, p.description, p.recommend_reason)
-          if (place_info):
-            place.sub_items.append(place_info)
-        isChanged = True
-
-      # Not city: update if over one month or haven't generated by ai
-      elif (place.type != "city") and ((place.info.advice_trip is None) or (datetime.now() - place.updated_time > timedelta(days=30))):
-        enrich_data = await self.enrich_place_detail_chain.ainvoke(place_name)
-        place.info.pros = enrich_data['pros']
-        place.info.cons = enrich_data['cons']
-        place.info.advice_trip = enrich_data['advice_trip']
-        isChanged = True
-      
-      if isChanged:
-        place.updated_time = datetime.now()
-        await redis_service.save_place_info(place_name, place)
-        await self.save_place_info(place)
-
-      return place
-
-    finally:
-      redis_service.delete(lock_key)
+
+    isChanged = False
+    # City: Top ten attractions in city
+    if (place.type == "city") and (len(place.sub_items) == 0):
+      raw_data = await self.popular_places_chain.ainvoke(place_name)
+      popular_places: List[PlaceCard] = [PlaceCard(**item) for item in raw_data]
+      place.sub_items.extend(await self.resolve_places(popular_places))
+      isChanged = True
+
+    # Not city: update if over one month or haven't generated by ai
+    elif (place.type != "city") and ((place.info.advice_trip is None) or (datetime.now() - place.updated_time > timedelta(days=30))):
+      enrich_data = await self.enrich_place_detail_chain.ainvoke(place_name)
+      place.info.pros = enrich_data['pros']
+      place.info.cons = enrich_data['cons']
+      place.info.advice_trip = enrich_data['advice_trip']
+      isChanged = True
+    
+    if isChanged:
+      place.updated_time = datetime.now()
+      await place_store_service.save(place, [place_name])
+
+    return place
 
 recommend_service = RecommendService()
\ No newline at end of file
@@ -1,109 +1,513 @@
-import redis
-from typing import Optional, List
+from redis.asyncio import ConnectionPool, Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import RedisError, ResponseError
+from pydantic import TypeAdapter
+from typing import Any, Dict, Iterable, Optional, List, Set, Tuple
 from app.models.session import Message, SessionState, History, DailyItinerary
 from app.models.shortlist import ShortlistItem
-import asyncio
-from app.db.mongodb import get_database
+from app.db.mongodb import get_database, mongodb
 from app.models.db_session import DbSession
+from app.services.persistence_queue import PersistenceQueue, SESSION, HISTORY, SHORTLIST, DELETE
+from app.services.profile_service import profile_service
+from app.utils.metrics import count_in_request
+from app.utils.serialization import history_codec, shortlist_codec
+from dotenv import load_dotenv
 from datetime import datetime
-import re
+import os
 import json
+import base64
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+SESSION_TTL = 3600
+# Writes kept in a session's changelog, clients further behind get the whole session
+SESSION_CHANGELOG_LEN = int(os.getenv("SESSION_CHANGELOG_LEN", "100"))
+
+# Session metadata hash fields, history and shortlist live in their own keys
+METADATA_FIELDS: Dict[str, TypeAdapter] = {
+  name: TypeAdapter(field.annotation)
+  for name, field in SessionState.model_fields.items()
+  if name not in ("history", "shortlist")
+}
+
+# Write fields only if the session hash still exists, so an expired session is not recreated half empty.
+# Bumps the version and logs the change under it, returns the new version or 0 if the session expired.
+# KEYS: metadata hash, changelog. ARGV: ttl, change, changelog length, field value pairs
+UPDATE_FIELDS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return 0
+end
+if #ARGV > 3 then
+  redis.call('HSET', KEYS[1], unpack(ARGV, 4))
+end
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('ZADD', KEYS[2], version, version .. ':' .. ARGV[2])
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[3]) - 1)
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return version
+"""
+
+# LSET fails on a missing list, replaced entries of an expired session come back with its restore
+REPLACE_HISTORY_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return 0
+end
+for i = 1, #ARGV, 2 do
+  redis.call('LSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+# Every command sent on its own and every pipeline flush is one round trip to Redis
+class CountingPipeline(Pipeline):
+  async def execute(self, raise_on_error: bool = True) -> List[Any]:
+    if self.command_stack:
+      count_in_request("redis.roundtrips")
+    return await super().execute(raise_on_error)
+
+class CountingRedis(Redis):
+  async def execute_command(self, *args, **options):
+    count_in_request("redis.roundtrips")
+    return await super().execute_command(*args, **options)
+
+  def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+    return CountingPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+def encode_field(field_name: str, value: Any) -> str:
+  return METADATA_FIELDS[field_name].dump_json(value).decode("utf-8")
+
+# Each metadata field is stored JSON encoded in its own hash field
+def encode_session(session_state: SessionState) -> Dict[str, str]:
+  return {name: encode_field(name, getattr(session_state, name)) for name in METADATA_FIELDS}
+
+# Hash fields are already JSON, they are joined into one document and validated in a single pass
+def decode_session(data: Dict[str, str]) -> SessionState:
+  body = ",".join(f"{json.dumps(name)}:{value}" for name, value in data.items() if name in METADATA_FIELDS)
+  return SessionState.model_validate_json("{" + body + "}")
+
+# Changelog entry of one write: history indexes written, whether the shortlist changed, metadata fields written
+def encode_change(history_indexes: Iterable[int] = (), shortlist: bool = False, fields: Iterable[str] = ()) -> str:
+  return json.dumps({"h": sorted(set(history_indexes)), "s": int(shortlist), "f": sorted(set(fields))}, separators=(",", ":"))
+
+# Opaque keyset cursor of the session list: update time and session id of the last item
+def encode_session_cursor(update_time: datetime, session_id: str) -> str:
+  return base64.urlsafe_b64encode(f"{update_time.isoformat()}|{session_id}".encode("utf-8")).decode("ascii")
+
+def decode_session_cursor(cursor: str) -> Tuple[datetime, str]:
+  update_time, session_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+  return datetime.fromisoformat(update_time), session_id
+
+def format_message_content(message: Message) -> str:
+  parts = [
+    message.content,
+    str(message.itinerary) if message.itinerary else None,
+    ','.join(r.name for r in message.recommendations) if getattr(message, 'recommendations', None) else None,
+    ','.join(p.name for p in message.populars) if getattr(message, 'populars', None) else None
+  ]
+  return ' '.join(filter(None, parts))
+
+def format_history(history: Iterable[History]) -> str:
+  return '\n'.join(f"{h.role}: {format_message_content(h.message)}" for h in history)
 
 class RedisService:
   _instance = None
-  _redis_client: Optional[redis.Redis] = None
+  _redis_client: Optional[Redis] = None
+  persistence: Optional[PersistenceQueue] = None
 
   def __new__(cls):
     if cls._instance is None:
       cls._instance = super(RedisService, cls).__new__(cls)
-      cls._redis_client = cls._connect_redis()
+      cls._redis_client = cls._create_client()
+      cls._update_fields_script = cls._redis_client.register_script(UPDATE_FIELDS_SCRIPT)
+      cls._replace_history_script = cls._redis_client.register_script(REPLACE_HISTORY_SCRIPT)
+      # Saved sessions are folded into the user's long-term profile
+      cls.persistence = PersistenceQueue(cls._instance._load_persist_fields, profile_service.on_session_written)
     return cls._instance
 
   @classmethod
-  # Connect to redis
-  def _connect_redis(cls):
+  # Pooled asyncio client, connections are opened lazily by the pool
+  def _create_client(cls) -> Redis:
+    pool = ConnectionPool.from_url(
+      REDIS_URL,
+      max_connections=REDIS_MAX_CONNECTIONS,
+      decode_responses=True,
+    )
+    return CountingRedis(connection_pool=pool)
+
+  async def connect(self):
     try:
-      redis_client = redis.Redis(host="127.0.0.1", port=6379, db=0, decode_responses=True)
-      redis_client.ping()
+      await self._redis_client.ping()
       print("Connected to Redis successfully!")
-      return redis_client
-    except redis.exceptions.ConnectionError as e:
+    except RedisError as e:
       print(f"Could not connect to Redis: {e}")
-      return None
 
-  def get_redis_client(self) -> Optional[redis.Redis]:
+  async def close(self):
+    if self._redis_client:
+      await self._redis_client.aclose()
+      print("Redis connection closed.")
+
+  def get_redis_client(self) -> Optional[Redis]:
     return self._redis_client
 
   # Deal with session metadata
   def _get_session_metadata_key(self, user_id: str, session_id: str) -> str:
     return f"user:{user_id}:session:{session_id}:metadata"
 
+  def _get_history_key(self, user_id: str, session_id: str) -> str:
+    return f"user:{user_id}:session:{session_id}:history"
+
+  def _get_shortlist_key(self, user_id: str, session_id: str) -> str:
+    return f"user:{user_id}:session:{session_id}:shortlist"
+
+  # Sorted set of "version:change" entries scored by version
+  def _get_changelog_key(self, user_id: str, session_id: str) -> str:
+    return f"user:{user_id}:session:{session_id}:changelog"
+
+  def _update_fields_args(self, change: str, fields: Dict[str, str]) -> List[Any]:
+    return [SESSION_TTL, change, SESSION_CHANGELOG_LEN, *[x for kv in fields.items() for x in kv]]
+
+  # Sorted set of a user's sessions scored by update time
+  def _get_user_sessions_key(self, user_id: str) -> str:
+    return f"user:{user_id}:sessions"
+
+  def _index_session(self, pipe, user_id: str, session_id: str, update_time: Optional[datetime]):
+    index_key = self._get_user_sessions_key(user_id)
+    pipe.zadd(index_key, {session_id: (update_time or datetime.now()).timestamp()})
+    pipe.expire(index_key, SESSION_TTL)
+
   async def load_session_state(self, user_id: str, session_id: str) -> Optional[SessionState]:
     if not self._redis_client:
       return None
 
     key = self._get_session_metadata_key(user_id, session_id)
-    data = self._redis_client.get(key)
+    try:
+      data = await self._redis_client.hgetall(key)
+    except ResponseError:
+      data = await self._migrate_session_blob(key)
+
     if not data:
-      data = await self._get_session_from_db(user_id, session_id)
-      if isinstance(data, SessionState):
-        return data
-    if data:
+      return await self._get_session_from_db(user_id, session_id)
+    try:
+      return decode_session(data)
+    except Exception as e:
+      print(f"Error loading session state for {user_id}: {e}")
+      return None
+
+  # Metadata, history and shortlist of a session in one round trip, used by SessionContext
+  async def load_session_bundle(self, user_id: str, session_id: str) -> Optional[Tuple[SessionState, List[History], List[ShortlistItem]]]:
+    if not self._redis_client:
+      return None
+
+    raw = await self._read_session_raw(user_id, session_id)
+    if raw is None:
+      return None
+
+    data, history, shortlist = raw
+    try:
+      if not data:
+        # Expired in Redis, MongoDB already has all three parts
+        session_state = await self._get_session_from_db(user_id, session_id)
+        if not session_state:
+          return None
+        history, shortlist = session_state.history or [], session_state.shortlist or []
+        session_state.history, session_state.shortlist = [], []
+        return session_state, history, shortlist
+
+      return decode_session(data), history_codec.loads_many(history), shortlist_codec.loads_many(shortlist.values())
+    except Exception as e:
+      print(f"Error loading session bundle for {user_id}/{session_id}: {e}")
+      return None
+
+  # The newest `limit` history entries before index `before` (all entries if limit is None),
+  # with metadata and shortlist, in one round trip.
+  # Returns (state, history page, index of the first entry on the page, history length, shortlist).
+  async def load_session_page(self, user_id: str, session_id: str, limit: Optional[int] = None, before: Optional[int] = None):
+    if not self._redis_client:
+      return None
+
+    key = self._get_session_metadata_key(user_id, session_id)
+    history_key = self._get_history_key(user_id, session_id)
+    if before is None:
+      first, last = (-limit, -1) if limit else (0, -1)
+    elif before > 0:
+      first, last = (max(0, before - limit) if limit else 0), before - 1
+    else:
+      # Nothing before the first entry, LRANGE 0 -1 would be the whole list
+      first, last = 1, 0
+    for _ in range(2):
       try:
-        return SessionState.model_validate_json(data)
-      except Exception as e:
-        print(f"Error loading session state for {user_id}: {e}")
+        async with self._redis_client.pipeline(transaction=False) as pipe:
+          pipe.hgetall(key)
+          pipe.llen(history_key)
+          pipe.lrange(history_key, first, last)
+          pipe.hgetall(self._get_shortlist_key(user_id, session_id))
+          data, total, history, shortlist = await pipe.execute()
+      except ResponseError:
+        await self._migrate_session_blob(key)
+        continue
+      if data:
+        break
+      # Expired in Redis, restore it from MongoDB and read again
+      if not await self._get_session_from_db(user_id, session_id):
         return None
+    else:
+      return None
+
+    start = max(0, total + first) if first < 0 else min(first, total)
+    try:
+      return decode_session(data), history_codec.loads_many(history), start, total, shortlist_codec.loads_many(shortlist.values())
+    except Exception as e:
+      print(f"Error loading session page for {user_id}/{session_id}: {e}")
+      return None
+
+  # What changed after since_version, read from the changelog.
+  # Returns None when the changelog no longer covers that version and the client needs the whole session,
+  # otherwise (state, history length, {index: entry}, shortlist or None if unchanged, changed fields).
+  async def load_session_changes(self, user_id: str, session_id: str, since_version: int):
+    if not self._redis_client:
+      return None
+
+    key = self._get_session_metadata_key(user_id, session_id)
+    history_key = self._get_history_key(user_id, session_id)
+    try:
+      async with self._redis_client.pipeline(transaction=False) as pipe:
+        pipe.hgetall(key)
+        pipe.llen(history_key)
+        pipe.zrangebyscore(self._get_changelog_key(user_id, session_id), f"({since_version}", "+inf")
+        data, total, entries = await pipe.execute()
+    except ResponseError:
+      return None
+    if not data:
+      return None
+
+    session_state = decode_session(data)
+    if since_version > session_state.version or len(entries) != session_state.version - since_version:
+      return None
+
+    history_indexes, shortlist_changed, fields = set(), False, set()
+    for entry in entries:
+      change = json.loads(entry.split(":", 1)[1])
+      history_indexes.update(i for i in change["h"] if i < total)
+      shortlist_changed = shortlist_changed or bool(change["s"])
+      fields.update(change["f"])
+
+    history_indexes = sorted(history_indexes)
+    changed_history, shortlist = {}, None
+    if history_indexes or shortlist_changed:
+      async with self._redis_client.pipeline(transaction=False) as pipe:
+        for idx in history_indexes:
+          pipe.lindex(history_key, idx)
+        if shortlist_changed:
+          pipe.hgetall(self._get_shortlist_key(user_id, session_id))
+        results = await pipe.execute()
+      changed_history = {idx: history_codec.loads(raw) for idx, raw in zip(history_indexes, results) if raw is not None}
+      if shortlist_changed:
+        shortlist = shortlist_codec.loads_many(results[-1].values())
+    return session_state, total, changed_history, shortlist, fields
+
+  # Metadata hash, history list and shortlist hash as stored, in one round trip
+  async def _read_session_raw(self, user_id: str, session_id: str) -> Optional[Tuple[Dict[str, str], List[str], Dict[str, str]]]:
+    key = self._get_session_metadata_key(user_id, session_id)
+    for _ in range(2):
+      try:
+        async with self._redis_client.pipeline(transaction=False) as pipe:
+          pipe.hgetall(key)
+          pipe.lrange(self._get_history_key(user_id, session_id), 0, -1)
+          pipe.hgetall(self._get_shortlist_key(user_id, session_id))
+          return tuple(await pipe.execute())
+      except ResponseError:
+        await self._migrate_session_blob(key)
     return None
 
-  async def load_session_with_userId(self, user_id: str):
-    pattern = f"user:{user_id}:session:*:metadata"
-    cursor = b"0"
-    sessions = []
+  # Flush the changes of a SessionContext in one pipeline.
+  # Fields go through the EXISTS guard, if the session expired meanwhile all three parts are rewritten from the context.
+  async def commit_session(
+    self,
+    session_state: SessionState,
+    fields: Dict[str, str],
+    new_history: List[History],
+    replaced_history: Dict[int, History],
+    shortlist_upserts: Dict[str, ShortlistItem],
+    shortlist_removed: Set[str],
+    history: List[History],
+    shortlist: List[ShortlistItem],
+  ) -> bool:
+    if not self._redis_client:
+      return False
+
+    user_id, session_id = session_state.user_id, session_state.session_id
+    key = session_state.get_redis_key()
+    appended = range(len(history) - len(new_history), len(history))
+    change = encode_change([*replaced_history, *appended], bool(shortlist_upserts or shortlist_removed), fields)
+    try:
+      async with self._redis_client.pipeline(transaction=True) as pipe:
+        await self._update_fields_script(keys=[key, self._get_changelog_key(user_id, session_id)], args=self._update_fields_args(change, fields), client=pipe)
+        if replaced_history:
+          args = [arg for idx, replaced in replaced_history.items() for arg in (idx, history_codec.dumps(replaced))]
+          await self._replace_history_script(keys=[session_state.history_key], args=args, client=pipe)
+        if new_history:
+          pipe.rpush(session_state.history_key, *[history_codec.dumps(h) for h in new_history])
+        if shortlist_removed:
+          pipe.hdel(session_state.shortlist_key, *shortlist_removed)
+        if shortlist_upserts:
+          pipe.hset(session_state.shortlist_key, mapping={name: shortlist_codec.dumps(s) for name, s in shortlist_upserts.items()})
+        if fields:
+          self._index_session(pipe, user_id, session_id, session_state.update_time)
+        results = await pipe.execute()
+
+      if results[0]:
+        session_state.version = results[0]
+      else:
+        # Expired meanwhile, its changelog is gone too, clients resync in full.
+        # The restore rewrites every key, including those the pipeline created.
+        session_state.version += 1
+        if not await self.save_from_db(session_state.model_copy(update={"history": history, "shortlist": shortlist})):
+          return False
+
+      if fields:
+        self.persistence.enqueue(user_id, session_id, SESSION)
+      if new_history or replaced_history:
+        self.persistence.enqueue(user_id, session_id, HISTORY)
+      if shortlist_upserts or shortlist_removed:
+        self.persistence.enqueue(user_id, session_id, SHORTLIST)
+      return True
+    except Exception as e:
+      print(f"Error committing session {user_id}/{session_id}: {e}")
+      return False
+
+  # Sessions of a user in Redis, newest first, read from the user's session index instead of a SCAN
+  async def load_session_with_userId(self, user_id: str, limit: Optional[int] = None, before: Optional[Tuple[datetime, str]] = None):
+    index_key = self._get_user_sessions_key(user_id)
+    try:
+      max_score = before[0].timestamp() if before else "+inf"
+    except (OverflowError, ValueError, OSError):
+      # Cursor past sessions without an update time, none of them are in the index
+      return []
+    # One extra per page for entries tied with the cursor
+    extra = 1 if limit is not None else 0
+    entries = await self._redis_client.zrevrangebyscore(
+      index_key, max_score, "-inf", start=0 if limit is not None else None, num=limit + extra if limit is not None else None, withscores=True
+    )
+    if before:
+      entries = [(sid, score) for sid, score in entries if (score, sid) < (max_score, before[1])]
+    if not entries:
+      return []
 
-    while cursor:
-      cursor, keys = self._redis_client.scan(cursor=cursor, match=pattern, count=100)
-      for key in keys:
-        match = re.search(rf"user:{user_id}:session:(.*):metadata", key)
-        if match:
-          session_id = match.group(1)
-          raw_data = self._redis_client.get(key)
-          if not raw_data:
-            continue
-          try:
-            data = json.loads(raw_data)
-            title = data.get("title", "")
-            update_time_str = data.get("update_time")
-            update_time = datetime.fromisoformat(update_time_str) if update_time_str else datetime.min
-            sessions.append({
-              "session_id": session_id,
-              "title": title,
-              "update_time": update_time,
-              "short_term_profile": data.get("short_term_profile", {})
-            })
-          except Exception as e:
-            print(f"Error parsing session metadata for {session_id}: {e}")
-      if cursor == b"0":
+    async with self._redis_client.pipeline(transaction=False) as pipe:
+      for session_id, _ in entries:
+        pipe.hmget(self._get_session_metadata_key(user_id, session_id), "title", "update_time", "short_term_profile")
+      rows = await pipe.execute(raise_on_error=False)
+
+    sessions = []
+    stale = []
+    for (session_id, _), row in zip(entries, rows):
+      key = self._get_session_metadata_key(user_id, session_id)
+      if isinstance(row, ResponseError):
+        row = await self._migrate_session_blob(key)
+        row = [row.get("title"), row.get("update_time"), row.get("short_term_profile")]
+      title, update_time, short_term_profile = row
+      if title is None:
+        # Metadata expired, MongoDB still has the session
+        stale.append(session_id)
+        continue
+      try:
+        update_time_str = json.loads(update_time) if update_time else None
+        sessions.append({
+          "session_id": session_id,
+          "title": json.loads(title),
+          "update_time": datetime.fromisoformat(update_time_str) if update_time_str else datetime.min,
+          "short_term_profile": json.loads(short_term_profile) if short_term_profile else {}
+        })
+      except Exception as e:
+        print(f"Error parsing session metadata for {session_id}: {e}")
+    if stale:
+      await self._redis_client.zrem(index_key, *stale)
+
+    sessions.sort(key=lambda x: (x["update_time"], x["session_id"]), reverse=True)
+    return sessions[:limit] if limit is not None else sessions
+
+  # Session list for the sidebar, newest first, one page at a time.
+  # Active sessions come from the Redis index, which may be ahead of MongoDB by the write-behind delay.
+  # Both are read after the same cursor and merged, one row more than the page tells if there is a next one.
+  async def list_sessions(self, user_id: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    before = decode_session_cursor(cursor) if cursor else None
+    sessions = {}
+    if mongodb.session is not None:
+      for doc, update_time in await self._list_db_sessions(user_id, limit + 1, before):
+        sessions[doc["session_id"]] = {
+          "session_id": doc["session_id"],
+          "title": doc.get("title"),
+          "update_time": update_time,
+        }
+    try:
+      for s in await self.load_session_with_userId(user_id, limit + 1, before):
+        sessions[s["session_id"]] = {"session_id": s["session_id"], "title": s["title"], "update_time": s["update_time"]}
+    except RedisError as e:
+      print(f"Error listing sessions of {user_id} from Redis: {e}")
+
+    rows = sorted(sessions.values(), key=lambda x: (x["update_time"], x["session_id"]), reverse=True)
+    page = rows[:limit]
+    next_cursor = encode_session_cursor(page[-1]["update_time"], page[-1]["session_id"]) if len(rows) > limit else None
+    return page, next_cursor
+
+  # (doc, update_time) of MongoDB sessions after the cursor, at least count of them outside the Redis index.
+  # Indexed sessions are listed from Redis with their newer time; their rows here take the index time
+  # and are dropped when that puts them before the cursor, so they do not count and MongoDB is read further.
+  async def _list_db_sessions(self, user_id: str, count: int, before: Optional[Tuple[datetime, str]]) -> List[Tuple[dict, datetime]]:
+    try:
+      before_score = before[0].timestamp() if before else float("inf")
+    except (OverflowError, ValueError, OSError):
+      # Cursor past sessions without an update time, every indexed session is newer
+      before_score = float("-inf")
+    found, unindexed, after = [], 0, before
+    while unindexed < count:
+      docs = await mongodb.session.list_sessions(user_id, count, after)
+      scores = await self._index_scores(user_id, [doc["session_id"] for doc in docs])
+      for doc, score in zip(docs, scores):
+        if score is None:
+          found.append((doc, doc.get("update_time") or datetime.min))
+          unindexed += 1
+        elif not before or (score, doc["session_id"]) < (before_score, before[1]):
+          found.append((doc, datetime.fromtimestamp(score)))
+      if len(docs) < count:
         break
+      last = docs[-1]
+      after = (last.get("update_time") or datetime.min, last["session_id"])
+    return found
+
+  # Score of every session in the user's index, None for those not in it. One ZMSCORE.
+  async def _index_scores(self, user_id: str, session_ids: List[str]) -> List[Optional[float]]:
+    if not session_ids or not self._redis_client:
+      return [None] * len(session_ids)
+    try:
+      return await self._redis_client.zmscore(self._get_user_sessions_key(user_id), session_ids)
+    except RedisError as e:
+      print(f"Error reading the session index of {user_id}: {e}")
+      return [None] * len(session_ids)
 
-    sessions.sort(key=lambda x: x["update_time"], reverse=True)
-    return sessions
-  
-  def save_from_db(self, session_state: SessionState) -> bool:
+  # Restore metadata, history and shortlist of a session loaded from MongoDB in one round trip
+  async def save_from_db(self, session_state: SessionState) -> bool:
     if not self._redis_client:
       return False
 
     key = session_state.get_redis_key()
     try:
-      json_data = session_state.model_dump_json()
-      # history = session_state.history
-      # shortlist = session_state.shortlist
-      # for h in history:
-      #   self._redis_client.rpush(session_state.history_key, h.model_dump_json())
-      # for s in shortlist:
-      #   self._redis_client.hset(session_state.shortlist_key, s.name, s.model_dump_json())
-
-      self._redis_client.set(key, json_data, ex=3600)
+      history = session_state.history or []
+      shortlist = session_state.shortlist or []
+
+      async with self._redis_client.pipeline(transaction=True) as pipe:
+        # Changes logged before the restore may not be in MongoDB yet, clients resync in full
+        pipe.delete(key, session_state.history_key, session_state.shortlist_key, self._get_changelog_key(session_state.user_id, session_state.session_id))
+        if history:
+          pipe.rpush(session_state.history_key, *[history_codec.dumps(h) for h in history])
+        if shortlist:
+          pipe.hset(session_state.shortlist_key, mapping={s.name: shortlist_codec.dumps(s) for s in shortlist})
+        pipe.hset(key, mapping=encode_session(session_state))
+        pipe.expire(key, SESSION_TTL)
+        self._index_session(pipe, session_state.user_id, session_state.session_id, session_state.update_time)
+        await pipe.execute()
       return True
     except Exception as e:
       print(f"Error saving session state for {session_state.user_id}/{session_state.session_id}: {e}")
@@ -116,47 +520,71 @@ class RedisService:
     key = session_state.get_redis_key()
     try:
       session_state.update_time = datetime.now()
-      json_data = session_state.model_dump_json()
-      self._redis_client.set(key, json_data, ex=3600)
-
-      asyncio.create_task(self._session_to_mongodb(session_state))
+      async with self._redis_client.pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        pipe.hset(key, mapping=encode_session(session_state))
+        pipe.expire(key, SESSION_TTL)
+        self._index_session(pipe, session_state.user_id, session_state.session_id, session_state.update_time)
+        await pipe.execute()
+
+      self.persistence.enqueue(session_state.user_id, session_state.session_id, SESSION)
       return True
     except Exception as e:
       print(f"Error saving session state for {session_state.user_id}/{session_state.session_id}: {e}")
       return False
 
-  async def update_session_title(self, user_id: str, session_id: str, new_title: str) -> Optional[SessionState]:
-    session_state = await self.load_session_state(user_id, session_id)
-    if session_state:
-      session_state.title = new_title
-      await self.save_session_state(session_state)
-      return session_state
-    return None
+  async def update_session_title(self, user_id: str, session_id: str, new_title: str) -> bool:
+    return await self.update_session_field(user_id, session_id, "title", new_title)
 
   async def delete_session(self, user_id: str, session_id: str) -> bool:
-    histroy_key = "user:{user_id}:session:{session_id}:history"
-    shortlist_key = "user:{user_id}:session:{session_id}:shortlist"
+    history_key = self._get_history_key(user_id, session_id)
+    shortlist_key = self._get_shortlist_key(user_id, session_id)
     meta_key = self._get_session_metadata_key(user_id, session_id)
 
     try:
-      self.delete(histroy_key)
-      self.delete(shortlist_key)
-      self.delete(meta_key)
+      async with self._redis_client.pipeline(transaction=True) as pipe:
+        pipe.delete(history_key, shortlist_key, meta_key, self._get_changelog_key(user_id, session_id))
+        pipe.zrem(self._get_user_sessions_key(user_id), session_id)
+        await pipe.execute()
 
-      asyncio.create_task(self._delete_session_in_db(user_id, session_id))
+      self.persistence.enqueue(user_id, session_id, DELETE)
       return True
     except Exception as e:
       print(f"Fail to delete session {user_id}/{session_id}: {e}")
       return False
 
-  # Deal with metadata except from title and slot
-  async def update_session_field(self, user_id: str, session_id: str, field_name: str, value: any) -> Optional[SessionState]:
-    session_state = await self.load_session_state(user_id, session_id)
-    if session_state and hasattr(session_state, field_name):
-      setattr(session_state, field_name, value)
-      await self.save_session_state(session_state)
-      return session_state
-    return None
+  # Deal with metadata except from title and slot.
+  # One HSET of the encoded field, the session is only loaded if it has to be restored from MongoDB first.
+  async def update_session_field(self, user_id: str, session_id: str, field_name: str, value: any) -> bool:
+    if field_name not in METADATA_FIELDS:
+      return False
+
+    key = self._get_session_metadata_key(user_id, session_id)
+    update_time = datetime.now()
+    fields = {
+      field_name: encode_field(field_name, value),
+      "update_time": encode_field("update_time", update_time),
+    }
+    try:
+      for _ in range(2):
+        try:
+          async with self._redis_client.pipeline(transaction=False) as pipe:
+            await self._update_fields_script(keys=[key, self._get_changelog_key(user_id, session_id)], args=self._update_fields_args(encode_change(fields=fields), fields), client=pipe)
+            self._index_session(pipe, user_id, session_id, update_time)
+            updated = (await pipe.execute())[0]
+        except ResponseError:
+          await self._migrate_session_blob(key)
+          continue
+        if updated:
+          self.persistence.enqueue(user_id, session_id, SESSION)
+          return True
+        # Expired in Redis, restore it from MongoDB and try again
+        if not await self._get_session_from_db(user_id, session_id):
+          return False
+      return False
+    except Exception as e:
+      print(f"Error updating {field_name} for {user_id}/{session_id}: {e}")
+      return False
 
   # Deal with conversation history, use redis list
   async def append_history(self, session_state: SessionState, history: History) -> bool:
@@ -167,8 +595,8 @@ class RedisService:
       return False
     
     try:
-      self._redis_client.rpush(session_state.history_key, history.model_dump_json())
-      asyncio.create_task(self._history_to_mongodb(session_state))
+      await self._redis_client.rpush(session_state.history_key, history_codec.dumps(history))
+      self.persistence.enqueue(session_state.user_id, session_state.session_id, HISTORY)
       return True
     except Exception as e:
       print(f"Error appending history for {session_state.user_id}/{session_state.session_id}: {e}")
@@ -177,22 +605,24 @@ class RedisService:
   async def get_history(self, user_id: str, session_id: str) -> List[History]:
     if not self._redis_client:
       return []
-    
-    session_state = await self.load_session_state(user_id, session_id)
 
-    if not session_state:
-      return []
-    
-    history = self._redis_client.lrange(session_state.history_key, 0, -1)
-    return [History(**json.loads(msg)) for msg in history]
+    # Metadata and history list are read in one round trip, MongoDB is only touched if metadata expired
+    async with self._redis_client.pipeline(transaction=False) as pipe:
+      pipe.exists(self._get_session_metadata_key(user_id, session_id))
+      pipe.lrange(self._get_history_key(user_id, session_id), 0, -1)
+      exists, history = await pipe.execute()
+
+    if not exists:
+      session_state = await self.load_session_state(user_id, session_id)
+      if not session_state:
+        return []
+      history = await self._redis_client.lrange(session_state.history_key, 0, -1)
+
+    return history_codec.loads_many(history)
   
   async def get_simplified_history(self, session_state: SessionState) -> str:
     history = await self.get_history(session_state.user_id, session_state.session_id)
-    history_str = '\n'.join(
-      f"{h.role}: {self._format_message_content(h.message)}"
-      for h in history
-    )
-    return history_str
+    return format_history(history)
 
   # Handle with itinerary
   async def save_itinerary(self, session_state: SessionState, itinerary: DailyItinerary, chat_idx: int):
@@ -203,36 +633,10 @@ class RedisService:
     
     cur_history = history[chat_idx]
     cur_history.message.itinerary = itinerary
-    self._redis_client.lset(session_state.history_key, chat_idx, cur_history.model_dump_json())
-    asyncio.create_task(self._history_to_mongodb(session_state))
+    await self._redis_client.lset(session_state.history_key, chat_idx, history_codec.dumps(cur_history))
+    self.persistence.enqueue(session_state.user_id, session_state.session_id, HISTORY)
     return True
 
-  # Deal with place infomation
-  async def get_place_info(self, place_name: str) -> ShortlistItem:
-    if not self._redis_client:
-      return None
-    
-    data = self._redis_client.get(place_name)
-    if data:
-      try:
-        return ShortlistItem.model_validate_json(data)
-      except Exception as e:
-        print(f"Error loading place infomation of {place_name}: {e}")
-        return None
-    return None
-  
-  async def save_place_info(self, place_name: str, place_info: ShortlistItem) -> bool:
-    if not self._redis_client:
-      return False
-    
-    try:
-      json_data = place_info.model_dump_json()
-      self._redis_client.set(place_name, json_data, ex=3600)
-      return True
-    except Exception as e:
-      print(f"Error saving place information for {place_name}: {e}")
-      return False
-  
   # Deal with shortlist
   async def add_to_shortlist(self, session_state: SessionState, item: ShortlistItem) -> bool:
     if not self._redis_client:
@@ -240,8 +644,8 @@ class RedisService:
     
     try:
       item_id = item.name
-      self._redis_client.hset(session_state.shortlist_key, item_id, item.model_dump_json())
-      asyncio.create_task(self._shortlist_to_mongodb(session_state))
+      await self._redis_client.hset(session_state.shortlist_key, item_id, shortlist_codec.dumps(item))
+      self.persistence.enqueue(session_state.user_id, session_state.session_id, SHORTLIST)
       return True
     except Exception as e:
       print(f"Error adding to shortlist for {session_state.user_id}/{session_state.session_id}: {e}")
@@ -250,17 +654,22 @@ class RedisService:
   async def get_shortlist(self, user_id: str, session_id: str) -> List[ShortlistItem]:
     if not self._redis_client:
       return []
-    
-    session_state = await self.load_session_state(user_id, session_id)
 
-    if not session_state:
-      return []
-    
     try:
-      items_data = self._redis_client.hgetall(session_state.shortlist_key)
-      return [ShortlistItem.model_validate_json(data) for data in items_data.values()]
+      async with self._redis_client.pipeline(transaction=False) as pipe:
+        pipe.exists(self._get_session_metadata_key(user_id, session_id))
+        pipe.hgetall(self._get_shortlist_key(user_id, session_id))
+        exists, items_data = await pipe.execute()
+
+      if not exists:
+        session_state = await self.load_session_state(user_id, session_id)
+        if not session_state:
+          return []
+        items_data = await self._redis_client.hgetall(session_state.shortlist_key)
+
+      return shortlist_codec.loads_many(items_data.values())
     except Exception as e:
-      print(f"Error adding to shortlist for {session_state.user_id}/{session_state.session_id}: {e}")
+      print(f"Error getting shortlist for {user_id}/{session_id}: {e}")
       return []
 
   async def remove_from_shortlist(self, session_state: SessionState, item_id: str) -> bool:
@@ -268,73 +677,76 @@ class RedisService:
       return False
     
     try:
-      self._redis_client.hdel(session_state.shortlist_key, item_id)
-      asyncio.create_task(self._shortlist_to_mongodb(session_state))
+      await self._redis_client.hdel(session_state.shortlist_key, item_id)
+      self.persistence.enqueue(session_state.user_id, session_state.session_id, SHORTLIST)
       return True
     except Exception as e:
       print(f"Error removing from shortlist for {session_state.user_id}/{session_state.session_id}: {e}")
       return False
   
   # Redis key for asynio functions
-  def get(self, key: str) -> Optional[str]:
-    return self._redis_client.get(key)
+  async def get(self, key: str) -> Optional[str]:
+    return await self._redis_client.get(key)
 
-  def set(self, key: str, value: str, ex: int = 300):
-    self._redis_client.set(key, value, ex=ex)
+  async def set(self, key: str, value: str, ex: int = 300):
+    await self._redis_client.set(key, value, ex=ex)
 
-  def delete(self, key: str):
-    self._redis_client.delete(key)
+  async def delete(self, key: str):
+    await self._redis_client.delete(key)
 
   # helper functions
-  async def _session_to_mongodb(self, session_state: SessionState):
-    db = get_database()
-    try:
-      await DbSession(db).save_session(session_state)
-    except Exception as e:
-      print(f"ERROR: Background save to MongoDB failed for {session_state.user_id}/{session_state.session_id}: {e}")
-  
-  async def _history_to_mongodb(self, session_state: SessionState):
-    db = get_database()
-    user_id = session_state.user_id
-    session_id = session_state.session_id
-    history = await self.get_history(user_id, session_id)
-    
-    try:
-      await DbSession(db).save_history(user_id, session_id, history)
-    except Exception as e:
-      print(f"ERROR: Background save to MongoDB failed for {session_state.user_id}/{session_state.session_id}: {e}")
-
-  async def _shortlist_to_mongodb(self, session_state: SessionState):
-    db = get_database()
-    user_id = session_state.user_id
-    session_id = session_state.session_id
-    shortlist = await self.get_shortlist(user_id, session_id)
+  # Current Redis state of the pending parts of a session, read when the persistence queue flushes
+  # History and shortlist were written by this service, they are copied without being validated again
+  async def _load_persist_fields(self, user_id: str, session_id: str, parts: set) -> Optional[dict]:
+    if not self._redis_client:
+      return {}
+    raw = await self._read_session_raw(user_id, session_id)
+    # Expired meanwhile, nothing newer than MongoDB to write
+    if not raw or not raw[0]:
+      return {}
+    data, history, shortlist = raw
+    fields = {}
+    if SESSION in parts:
+      fields.update(decode_session(data).model_dump(exclude={"history", "shortlist"}))
+    if HISTORY in parts:
+      fields["history"] = history_codec.raw_documents(history)
+    if SHORTLIST in parts:
+      fields["shortlist"] = shortlist_codec.raw_documents(shortlist.values())
+    return fields
+
+  # Sessions written before metadata became a hash are stored as one JSON string, convert them in place
+  async def _migrate_session_blob(self, key: str) -> Dict[str, str]:
+    async with self._redis_client.pipeline(transaction=True) as pipe:
+      pipe.get(key)
+      pipe.ttl(key)
+      blob, ttl = await pipe.execute()
+    if not blob:
+      return {}
+
+    session_state = SessionState.model_validate_json(blob)
+    data = encode_session(session_state)
+    async with self._redis_client.pipeline(transaction=True) as pipe:
+      pipe.delete(key)
+      pipe.hset(key, mapping=data)
+      pipe.expire(key, ttl if ttl and ttl > 0 else SESSION_TTL)
+      await pipe.execute()
+    return data
 
-    try:
-      await DbSession(db).save_shortlist(user_id, session_id, shortlist)
-    except Exception as e:
-      print(f"ERROR: Background save to MongoDB failed for {session_state.user_id}/{session_state.session_id}: {e}")
+  # Convert every remaining blob, used by scripts/migrate_session_metadata.py
+  async def migrate_session_blobs(self) -> int:
+    migrated = 0
+    async for key in self._redis_client.scan_iter(match="user:*:session:*:metadata", count=500):
+      if await self._redis_client.type(key) == "string":
+        await self._migrate_session_blob(key)
+        migrated += 1
+    return migrated
 
   async def _get_session_from_db(self, user_id: str, session_id: str):
     db = get_database()
     data = await DbSession(db).get_sesssion(user_id, session_id)
     if data:
-      self.save_from_db(data)
+      await self.save_from_db(data)
     return data
-  
-  async def _delete_session_in_db(self, user_id: str, session_id: str):
-    db = get_database()
-    await DbSession(db).delete_session(user_id, session_id)
-  
-  def _format_message_content(self, message: Message) -> str:
-    parts = []
-    parts = [
-      message.content,
-      str(message.itinerary) if message.itinerary else None,
-      ','.join(r.name for r in message.recommendations) if getattr(message, 'recommendations', None) else None,
-      ','.join(p.name for p in message.populars) if getattr(message, 'populars', None) else None
-    ]
-    return ' '.join(filter(None, parts))
 
 # Ensure single instance
-redis_service = RedisService()
\ No newline at end of file
+redis_service = RedisService()
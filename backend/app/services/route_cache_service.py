@@ -0,0 +1,119 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.db.mongodb import mongodb
+from app.models.session import RouteStep
+from app.services.redis_service import redis_service
+from app.utils.metrics import metrics
+
+load_dotenv()
+# Routes older than this are fetched again
+ROUTE_CACHE_MAX_AGE = int(os.getenv("ROUTE_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+# Transit timetables differ across the day, arrival times are grouped into buckets of this size
+ROUTE_CACHE_BUCKET_MINUTES = int(os.getenv("ROUTE_CACHE_BUCKET_MINUTES", "30"))
+
+# Only transit depends on the time of day, routes are requested without live traffic
+TIME_DEPENDENT_MODES = {"TRANSIT"}
+
+Route = Tuple[str, str, List[RouteStep]]
+
+class RouteCacheService:
+  def make_key(self, origin_id: str, destination_id: str, mode: str, arrival_time: Optional[str]) -> str:
+    return f"route:{origin_id}:{destination_id}:{mode.upper()}:{self._time_bucket(mode, arrival_time)}"
+
+  async def get_route(self, origin_id: str, destination_id: str, mode: str, arrival_time: Optional[str]) -> Optional[Route]:
+    key = self.make_key(origin_id, destination_id, mode, arrival_time)
+
+    data = None
+    try:
+      raw = await redis_service.get(key)
+      data = json.loads(raw) if raw else None
+    except Exception as e:
+      print(f"Route cache read failed for {key}: {e}")
+    if data:
+      metrics.incr("route_cache.hit.redis")
+      return self._to_route(data)
+
+    if mongodb.route_cache is not None:
+      try:
+        fresh_after = datetime.now(timezone.utc) - timedelta(seconds=ROUTE_CACHE_MAX_AGE)
+        data = await mongodb.route_cache.get_route(key, fresh_after)
+      except Exception as e:
+        print(f"Route cache MongoDB read failed for {key}: {e}")
+    if data:
+      metrics.incr("route_cache.hit.mongo")
+      await self._set_redis(key, data)
+      return self._to_route(data)
+
+    metrics.incr("route_cache.miss")
+    return None
+
+  # Cached durations in seconds of many legs with one MGET, Redis only, legs not cached are left out
+  async def get_durations(self, legs: List[Tuple[str, str]], mode: str) -> Dict[Tuple[str, str], float]:
+    if not legs:
+      return {}
+    try:
+      raws = await redis_service.get_redis_client().mget([self.make_key(o, d, mode, None) for o, d in legs])
+    except Exception as e:
+      print(f"Route cache read failed for {len(legs)} legs: {e}")
+      return {}
+    durations = {}
+    for leg, raw in zip(legs, raws):
+      duration = json.loads(raw).get("duration") if raw else None
+      if duration:
+        durations[leg] = float(duration.rstrip("s"))
+    return durations
+
+  async def save_route(self, origin_id: str, destination_id: str, mode: str, arrival_time: Optional[str], route: Route):
+    key = self.make_key(origin_id, destination_id, mode, arrival_time)
+    duration, resolved_mode, route_steps = route
+    data = {
+      "duration": duration,
+      "mode": resolved_mode,
+      "route_steps": [s.model_dump() for s in route_steps or []],
+      "fetched_at": datetime.now(timezone.utc),
+    }
+    await self._set_redis(key, data)
+    if mongodb.route_cache is not None:
+      try:
+        await mongodb.route_cache.save_route(key, data)
+      except Exception as e:
+        print(f"Route cache MongoDB write failed for {key}: {e}")
+
+  def stats(self) -> Dict[str, float]:
+    hits = metrics.counter("route_cache.hit.redis") + metrics.counter("route_cache.hit.mongo")
+    misses = metrics.counter("route_cache.miss")
+    return {
+      "hits": hits,
+      "misses": misses,
+      "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+    }
+
+  async def _set_redis(self, key: str, data: Dict):
+    fetched_at = data.get("fetched_at")
+    if isinstance(fetched_at, datetime):
+      if fetched_at.tzinfo is None:
+        fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+      ttl = ROUTE_CACHE_MAX_AGE - int((datetime.now(timezone.utc) - fetched_at).total_seconds())
+    else:
+      ttl = ROUTE_CACHE_MAX_AGE
+    if ttl <= 0:
+      return
+    try:
+      await redis_service.set(key, json.dumps(data, default=str), ex=ttl)
+    except Exception as e:
+      print(f"Route cache write failed for {key}: {e}")
+
+  def _to_route(self, data: Dict) -> Route:
+    return data["duration"], data["mode"], [RouteStep(**s) for s in data.get("route_steps", [])]
+
+  def _time_bucket(self, mode: str, arrival_time: Optional[str]) -> str:
+    if mode.upper() not in TIME_DEPENDENT_MODES or not arrival_time:
+      return "any"
+    arrival = datetime.fromisoformat(arrival_time.replace("Z", "+00:00"))
+    minutes = arrival.hour * 60 + arrival.minute
+    return str(minutes // ROUTE_CACHE_BUCKET_MINUTES)
+
+route_cache_service = RouteCacheService()
@@ -0,0 +1,138 @@
+from typing import Dict, List, Optional, Set
+from app.models.session import SessionState, History, DailyItinerary
+from app.models.shortlist import ShortlistItem
+from app.services.redis_service import redis_service, encode_session
+from app.utils.history_digest import HISTORY_RAW_TURNS, fold_digest, build_prompt_history
+from datetime import datetime
+
+# Unit of work for one request: session metadata, history and shortlist are loaded once,
+# changes are kept in memory and flushed to Redis in one pipeline by commit()
+class SessionContext:
+  def __init__(self, state: SessionState, history: List[History], shortlist: List[ShortlistItem]):
+    self.state = state
+    self.history = history
+    self.shortlist: Dict[str, ShortlistItem] = {s.name: s for s in shortlist}
+    # Encoded metadata as loaded, dirty fields are found by comparing against it on commit
+    self._loaded_fields = encode_session(state)
+    self._dirty_fields: Set[str] = set()
+    self._history_len = len(history)
+    self._replaced_history: Dict[int, History] = {}
+    self._shortlist_upserts: Dict[str, ShortlistItem] = {}
+    self._shortlist_removed: Set[str] = set()
+
+  @classmethod
+  async def load(cls, user_id: str, session_id: str) -> Optional["SessionContext"]:
+    bundle = await redis_service.load_session_bundle(user_id, session_id)
+    if not bundle:
+      return None
+    return cls(*bundle)
+
+  @property
+  def user_id(self) -> str:
+    return self.state.user_id
+
+  @property
+  def session_id(self) -> str:
+    return self.state.session_id
+
+  # Fields mutated in place are picked up on commit anyway, this is for callers that want to be explicit
+  def mark_dirty(self, *field_names: str):
+    self._dirty_fields.update(field_names)
+
+  def set_field(self, field_name: str, value):
+    setattr(self.state, field_name, value)
+    self._dirty_fields.add(field_name)
+
+  # Deal with conversation history
+  def append_history(self, history: History):
+    self.history.append(history)
+    self._fold_history()
+
+  # Rolling digest of older turns plus the newest raw turns, capped at HISTORY_TOKEN_BUDGET
+  def get_simplified_history(self) -> str:
+    self._fold_history()
+    return build_prompt_history(self.state.history_digest, self.history[self.state.history_digest_turns:])
+
+  # Turns are summarized once, when they leave the raw window
+  def _fold_history(self):
+    folded = self.state.history_digest_turns
+    if folded > len(self.history):
+      self._rebuild_digest()
+      return
+    end = len(self.history) - HISTORY_RAW_TURNS
+    if end > folded:
+      self.state.history_digest = fold_digest(self.state.history_digest, self.history[folded:end])
+      self.state.history_digest_turns = end
+
+  def _rebuild_digest(self):
+    self.state.history_digest = []
+    self.state.history_digest_turns = 0
+    self._fold_history()
+
+  def save_itinerary(self, itinerary: List[DailyItinerary], chat_idx: int) -> bool:
+    if (chat_idx >= len(self.history)) or (self.history[chat_idx].role != 'ai'):
+      print("Trying to modify a wrong message")
+      return False
+
+    cur_history = self.history[chat_idx]
+    cur_history.message.itinerary = itinerary
+    if chat_idx < self.state.history_digest_turns:
+      self._rebuild_digest()
+    # Entries appended in this request are pushed whole on commit
+    if chat_idx < self._history_len:
+      self._replaced_history[chat_idx] = cur_history
+    return True
+
+  # Deal with shortlist
+  def get_shortlist(self) -> List[ShortlistItem]:
+    return list(self.shortlist.values())
+
+  def add_to_shortlist(self, item: ShortlistItem):
+    self.shortlist[item.name] = item
+    self._shortlist_upserts[item.name] = item
+    self._shortlist_removed.discard(item.name)
+
+  def remove_from_shortlist(self, item_id: str):
+    self.shortlist.pop(item_id, None)
+    self._shortlist_upserts.pop(item_id, None)
+    self._shortlist_removed.add(item_id)
+
+  def is_dirty(self) -> bool:
+    return bool(
+      self._dirty_fields
+      or len(self.history) > self._history_len
+      or self._replaced_history
+      or self._shortlist_upserts
+      or self._shortlist_removed
+      or encode_session(self.state) != self._loaded_fields
+    )
+
+  async def commit(self) -> bool:
+    if not self.is_dirty():
+      return True
+
+    self.state.update_time = datetime.now()
+    encoded = encode_session(self.state)
+    fields = {
+      name: value for name, value in encoded.items()
+      if name in self._dirty_fields or self._loaded_fields.get(name) != value
+    }
+    committed = await redis_service.commit_session(
+      self.state,
+      fields,
+      self.history[self._history_len:],
+      self._replaced_history,
+      self._shortlist_upserts,
+      self._shortlist_removed,
+      self.history,
+      self.get_shortlist(),
+    )
+    if committed:
+      # commit_session set the new version
+      self._loaded_fields = encode_session(self.state)
+      self._dirty_fields.clear()
+      self._history_len = len(self.history)
+      self._replaced_history = {}
+      self._shortlist_upserts = {}
+      self._shortlist_removed = set()
+    return committed
@@ -5,7 +5,7 @@ class RedisExpiredListener:
     self.redis_url = redis_url
       
   async def listen(self):
-    redis = Redis(host="localhost", port=6379, db=0)
+    redis = Redis.from_url(self.redis_url)
     pubsub = redis.pubsub()
     await pubsub.subscribe("__keyevent@0__:expired")
     print("RedisExpiredListener: Subscribed to expired key events.")
@@ -23,6 +23,7 @@ class RedisExpiredListener:
           base_key = f"user:{user_id}:session:{session_id}"
           history_key = f"{base_key}:history"
           shortlist_key = f"{base_key}:shortlist"
+          changelog_key = f"{base_key}:changelog"
           
           try:
             # Explicitly delete the related keys in Redis
@@ -30,6 +31,8 @@ class RedisExpiredListener:
             pipe = redis.pipeline()
             pipe.delete(history_key)
             pipe.delete(shortlist_key)
+            pipe.delete(changelog_key)
+            pipe.zrem(f"user:{user_id}:sessions", session_id)
             await pipe.execute()
           except Exception as ex:
             print(f"RedisExpiredListener: ERROR during cleanup for {user_id}/{session_id}: {ex}")
\ No newline at end of file
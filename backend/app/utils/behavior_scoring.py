@@ -0,0 +1,21 @@
+from typing import Dict, List, Optional
+import numpy as np
+from app.models.recommend import UserBehavior
+
+# Score of one event: event weight plus 0.01 per second viewed
+EVENT_WEIGHTS = {"click": 0.5, "view": 1.0, "shortlist": 3.0, "unshortlist": -3.0}
+DURATION_WEIGHT = 0.01
+
+# Sigmoid of the summed event scores of every place, events are grouped in one pass
+# and summed with a bincount instead of being rescanned for each place
+def aggregate_behaviors(behaviors: Optional[List[UserBehavior]], sigmoid_scale: float) -> Dict[str, float]:
+  if not behaviors:
+    return {}
+  index: Dict[str, int] = {}
+  place_idx = np.fromiter((index.setdefault(b.place_name, len(index)) for b in behaviors), dtype=np.int64, count=len(behaviors))
+  weights = np.fromiter((EVENT_WEIGHTS[b.event_type] for b in behaviors), dtype=np.float64, count=len(behaviors))
+  durations = np.fromiter((b.duration_sec or 0.0 for b in behaviors), dtype=np.float64, count=len(behaviors))
+
+  totals = np.bincount(place_idx, weights=weights + DURATION_WEIGHT * durations, minlength=len(index))
+  scores = 1 / (1 + np.exp(-sigmoid_scale * totals))
+  return dict(zip(index, scores.tolist()))
@@ -0,0 +1,25 @@
+import asyncio
+from typing import Awaitable, Callable, Iterable, List, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Run func over items with at most `limit` calls in flight, results keep the order of items.
+# on_result is called as soon as each item finishes, with its index, which lets callers stream partial results.
+async def bounded_gather(
+  func: Callable[[T], Awaitable[R]],
+  items: Iterable[T],
+  limit: int,
+  on_result: Optional[Callable[[int, R], Awaitable[None]]] = None,
+) -> List[R]:
+  items = list(items)
+  semaphore = asyncio.Semaphore(max(1, limit))
+
+  async def run(idx: int, item: T) -> R:
+    async with semaphore:
+      result = await func(item)
+    if on_result is not None:
+      await on_result(idx, result)
+    return result
+
+  return await asyncio.gather(*(run(i, item) for i, item in enumerate(items)))
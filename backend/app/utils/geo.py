@@ -0,0 +1,169 @@
+import math
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.195
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Great-circle distance in km, arguments in degrees, broadcasts over arrays
+def haversine_km(lat1, lng1, lat2, lng2):
+  lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+  a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def _bits(precision: int) -> Tuple[int, int]:
+  bits = 5 * precision
+  return (bits + 1) // 2, bits // 2 # lng, lat
+
+# Geohash as an integer of 5 * precision bits, works on scalars and arrays.
+# The cells of a coarser geohash are one contiguous range of finer codes.
+def geohash_int(lat, lng, precision: int):
+  lng_bits, lat_bits = _bits(precision)
+  x = np.clip(np.floor((np.asarray(lng, dtype=np.float64) + 180) / 360 * (1 << lng_bits)), 0, (1 << lng_bits) - 1).astype(np.int64)
+  y = np.clip(np.floor((np.asarray(lat, dtype=np.float64) + 90) / 180 * (1 << lat_bits)), 0, (1 << lat_bits) - 1).astype(np.int64)
+  code = np.zeros_like(x)
+  # Bits alternate starting with longitude
+  for k in range(lng_bits + lat_bits):
+    bit = (x >> (lng_bits - 1 - k // 2)) & 1 if k % 2 == 0 else (y >> (lat_bits - 1 - k // 2)) & 1
+    code = (code << 1) | bit
+  return code
+
+def geohash(lat: float, lng: float, precision: int) -> str:
+  code = int(geohash_int(lat, lng, precision))
+  return "".join(BASE32[(code >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+# Height and width of a cell in degrees
+def cell_size(precision: int) -> Tuple[float, float]:
+  lng_bits, lat_bits = _bits(precision)
+  return 180 / (1 << lat_bits), 360 / (1 << lng_bits)
+
+# (south, west, north, east) of a cell
+def cell_bounds(code: int, precision: int) -> Tuple[float, float, float, float]:
+  lng_bits, lat_bits = _bits(precision)
+  x = y = 0
+  for k in range(lng_bits + lat_bits):
+    bit = (code >> (lng_bits + lat_bits - 1 - k)) & 1
+    if k % 2 == 0:
+      x = (x << 1) | bit
+    else:
+      y = (y << 1) | bit
+  height, width = cell_size(precision)
+  return -90 + y * height, -180 + x * width, -90 + (y + 1) * height, -180 + (x + 1) * width
+
+# Codes of every cell intersecting the bounding box of the circle.
+# Longitudes wrap, a circle across the antimeridian covers cells on both sides of it.
+def covering_cells(lat: float, lng: float, radius_km: float, precision: int) -> List[int]:
+  dlat = radius_km / KM_PER_DEGREE
+  dlng = min(180.0, radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6)))
+  height, width = cell_size(precision)
+  lats = np.append(np.arange(lat - dlat, lat + dlat, height), lat + dlat)
+  lngs = np.append(np.arange(lng - dlng, lng + dlng, width), lng + dlng)
+  grid_lat, grid_lng = np.meshgrid(np.clip(lats, -90, 90), (lngs + 180) % 360 - 180)
+  return sorted(set(geohash_int(grid_lat.ravel(), grid_lng.ravel(), precision).tolist()))
+
+class _Area:
+  def __init__(self, keys: List[Hashable], lats: np.ndarray, lngs: np.ndarray, cell_precision: int):
+    self.cell_precision = cell_precision
+    self._rows: Dict[Hashable, Tuple[float, float]] = dict(zip(keys, zip(lats.tolist(), lngs.tolist())))
+    self._build()
+
+  def _build(self):
+    self.keys = list(self._rows)
+    coords = np.array(list(self._rows.values()), dtype=np.float64).reshape(-1, 2)
+    codes = geohash_int(coords[:, 0], coords[:, 1], self.cell_precision)
+    order = np.argsort(codes, kind="stable")
+    self.keys = [self.keys[i] for i in order]
+    self.lats, self.lngs, self.codes = coords[order, 0], coords[order, 1], codes[order]
+    self.dirty = False
+
+  def __len__(self) -> int:
+    return len(self._rows)
+
+  def upsert(self, key: Hashable, lat: float, lng: float):
+    self._rows[key] = (lat, lng)
+    self.dirty = True
+
+  # Rows of the given cells, found by binary search on the sorted codes
+  def rows(self, cells: Optional[List[Tuple[int, int]]]) -> np.ndarray:
+    if self.dirty:
+      self._build()
+    if cells is None:
+      return np.arange(len(self.keys))
+    ranges = [np.arange(*np.searchsorted(self.codes, [lo, hi])) for lo, hi in cells]
+    return np.concatenate(ranges) if ranges else np.zeros(0, dtype=np.int64)
+
+# Places of loaded areas (geohash cells of area_precision, ~40 x 20 km at 4) held in memory.
+# Inside an area places are sorted by their geohash at cell_precision, a radius query only
+# computes distances for the rows of the cells around the point.
+class GeoGrid:
+  def __init__(self, area_precision: int = 4, cell_precision: int = 6, max_cells: int = 64):
+    self.area_precision = area_precision
+    self.cell_precision = cell_precision
+    self.max_cells = max_cells
+    self.areas: Dict[int, _Area] = {}
+
+  def area_of(self, lat: float, lng: float) -> int:
+    return int(geohash_int(lat, lng, self.area_precision))
+
+  def areas_covering(self, lat: float, lng: float, radius_km: float) -> List[int]:
+    return covering_cells(lat, lng, radius_km, self.area_precision)
+
+  def is_loaded(self, areas: Iterable[int]) -> bool:
+    return all(a in self.areas for a in areas)
+
+  # Places outside the area are dropped, a place belongs to exactly one area
+  def load_area(self, area: int, keys: List[Hashable], lats: Iterable[float], lngs: Iterable[float]):
+    lats, lngs = np.asarray(list(lats), dtype=np.float64), np.asarray(list(lngs), dtype=np.float64)
+    inside = geohash_int(lats, lngs, self.area_precision) == area if len(keys) else np.zeros(0, dtype=bool)
+    self.areas[area] = _Area([k for k, keep in zip(keys, inside) if keep], lats[inside], lngs[inside], self.cell_precision)
+
+  def drop_area(self, area: int):
+    self.areas.pop(area, None)
+
+  # Only kept when the area of the place is loaded, returns whether it was
+  def upsert(self, key: Hashable, lat: float, lng: float) -> bool:
+    area = self.areas.get(self.area_of(lat, lng))
+    if area is None:
+      return False
+    area.upsert(key, lat, lng)
+    return True
+
+  # (key, km) within radius_km, closest first. The areas covering the circle must be loaded.
+  def query(self, lat: float, lng: float, radius_km: float, limit: int, exclude: Set[Hashable] = frozenset()) -> List[Tuple[Hashable, float]]:
+    cells = covering_cells(lat, lng, radius_km, self.cell_precision)
+    shift = 5 * (self.cell_precision - self.area_precision)
+    # Too many cells for a large radius, every row of the areas is checked instead
+    by_area: Dict[int, Optional[List[Tuple[int, int]]]] = {}
+    if len(cells) <= self.max_cells:
+      for cell in cells:
+        by_area.setdefault(cell >> shift, []).append((cell, cell + 1))
+    else:
+      by_area = {area: None for area in self.areas_covering(lat, lng, radius_km)}
+
+    keys, distances = [], []
+    for area_code, area_cells in by_area.items():
+      area = self.areas.get(area_code)
+      if area is None:
+        continue
+      rows = area.rows(area_cells)
+      if len(rows) == 0:
+        continue
+      km = haversine_km(lat, lng, area.lats[rows], area.lngs[rows])
+      close = km <= radius_km
+      keys += [area.keys[i] for i in rows[close]]
+      distances.append(km[close])
+    if not keys:
+      return []
+
+    distances = np.concatenate(distances)
+    order = np.argsort(distances, kind="stable")
+    found = []
+    for i in order:
+      if keys[i] in exclude:
+        continue
+      found.append((keys[i], float(distances[i])))
+      if len(found) == limit:
+        break
+    return found
@@ -0,0 +1,94 @@
+from typing import Iterable, List, Optional
+from dotenv import load_dotenv
+from app.models.session import History, DailyItinerary
+import math
+import os
+
+load_dotenv()
+# Newest turns sent to the LLM verbatim, older ones only through the digest
+HISTORY_RAW_TURNS = int(os.getenv("HISTORY_RAW_TURNS", "6"))
+# Cap of the digest of older turns
+HISTORY_DIGEST_TOKENS = int(os.getenv("HISTORY_DIGEST_TOKENS", "300"))
+# Cap of the whole history text put into a prompt, digest included
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1200"))
+
+# Roughly 4 characters per token for English text, close enough for budgeting without a tokenizer
+def estimate_tokens(text: str) -> int:
+  return math.ceil(len(text) / 4)
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+  max_chars = max(0, max_tokens * 4)
+  if len(text) <= max_chars:
+    return text
+  return text[:max(0, max_chars - 3)].rstrip() + "..."
+
+def _names(items) -> str:
+  return ', '.join(i.name for i in items)
+
+# Day by day place names and times instead of the repr of every itinerary item
+def format_itinerary(itinerary: List[DailyItinerary], with_times: bool = True) -> str:
+  days = {}
+  for item in itinerary:
+    if item.type != 'visit' or not item.place_name:
+      continue
+    entry = f"{item.place_name} {item.start_time}-{item.end_time}" if with_times else item.place_name
+    days.setdefault(item.date, []).append(entry)
+  return '; '.join(f"Day {date}: {', '.join(places)}" for date, places in sorted(days.items()))
+
+# Recent turn as the LLM sees it
+def render_turn(history: History) -> str:
+  message = history.message
+  parts = [message.content]
+  if message.recommendations:
+    parts.append(f"[recommended: {_names(message.recommendations)}]")
+  if message.populars:
+    parts.append(f"[popular: {_names(message.populars)}]")
+  if message.itinerary:
+    parts.append(f"[itinerary: {format_itinerary(message.itinerary)}]")
+  return f"{history.role}: {' '.join(filter(None, parts))}"
+
+# One line per older turn: the start of the text plus the places it was about
+def summarize_turn(history: History) -> str:
+  message = history.message
+  parts = [truncate_tokens(message.content or "", 40 if history.role == "user" else 25)]
+  if message.recommendations:
+    parts.append(f"[recommended: {_names(message.recommendations)}]")
+  if message.populars:
+    parts.append(f"[popular: {_names(message.populars)}]")
+  if message.itinerary:
+    days = len(set(i.date for i in message.itinerary))
+    parts.append(f"[{days}-day itinerary: {format_itinerary(message.itinerary, with_times=False)}]")
+  return f"{history.role}: {' '.join(filter(None, parts))}"
+
+# Fold turns that left the raw window into the digest. The first line is the opening request
+# (destination, dates) and is always kept, the oldest of the other lines go first over budget.
+def fold_digest(digest: List[str], turns: Iterable[History], budget: Optional[int] = None) -> List[str]:
+  budget = HISTORY_DIGEST_TOKENS if budget is None else budget
+  digest = digest + [summarize_turn(h) for h in turns]
+  tokens = sum(estimate_tokens(line) + 1 for line in digest)
+  while len(digest) > 2 and tokens > budget:
+    tokens -= estimate_tokens(digest[1]) + 1
+    del digest[1]
+  return digest
+
+# Digest plus the newest raw turns, newest first when the budget runs out
+def build_prompt_history(digest: List[str], recent: List[History], budget: Optional[int] = None) -> str:
+  budget = HISTORY_TOKEN_BUDGET if budget is None else budget
+  summary = '\n'.join(digest)
+  remaining = budget - estimate_tokens(summary)
+
+  lines = []
+  for history in reversed(recent):
+    line = render_turn(history)
+    tokens = estimate_tokens(line) + 1
+    if tokens > remaining:
+      if not lines and remaining > 0:
+        lines.append(truncate_tokens(line, remaining))
+      break
+    lines.append(line)
+    remaining -= tokens
+  lines.reverse()
+
+  if not summary:
+    return '\n'.join(lines)
+  return f"Earlier in this conversation:\n{summary}\nRecent turns:\n" + '\n'.join(lines)
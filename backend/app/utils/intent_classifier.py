@@ -0,0 +1,147 @@
+import os
+import re
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from app.utils.intent_examples import INTENT_EXAMPLES
+from app.utils.metrics import metrics
+
+load_dotenv()
+# The model answers only above this probability, otherwise the LLM chain classifies
+INTENT_LOCAL_THRESHOLD = float(os.getenv("INTENT_LOCAL_THRESHOLD", "0.75"))
+INTENT_LOCAL_ENABLED = os.getenv("INTENT_LOCAL_ENABLED", "true").lower() == "true"
+
+# Categories of INTENT_CLASSIFIER_PROMPT
+INTENTS = [
+  "ADVANCE_STEP",
+  "MORE_RECOMMENDATIONS",
+  "ITINERARY_GENERATION",
+  "GENERAL_QUERY",
+  "MODIFY_PLAN",
+  "FINALIZE_TRIP",
+  "OTHER",
+]
+
+# Whole inputs that leave no doubt, checked before the model
+INTENT_RULES: List[Tuple[re.Pattern, str]] = [
+  (re.compile(r"^(ok(ay)?[ ,]*)?(next( step)?|continue|go on|proceed|move on|carry on|keep going)( please)?$"), "ADVANCE_STEP"),
+  (re.compile(r"^(show( me)?|give me|load|any)? ?more( options| places| ideas| recommendations)?( please)?$"), "MORE_RECOMMENDATIONS"),
+  (re.compile(r"^(please )?(make|create|generate|build|draft)( me)? (an?|the|my) itinerary( please)?$"), "ITINERARY_GENERATION"),
+  (re.compile(r"^(hi|hello|hey|thanks|thank you|bye)( there| so much)?$"), "OTHER"),
+]
+
+# Words that point to one intent. The model gives a single intent, an input with cues of several
+# ("next, and show me more museums", "no more museums") goes to the LLM, which can answer all of them.
+INTENT_CUES: Dict[str, re.Pattern] = {
+  "ADVANCE_STEP": re.compile(r"\b(next|continue|proceed|move on|go on|carry on|keep going)\b"),
+  "MORE_RECOMMENDATIONS": re.compile(r"\b(more|other|another|else|similar|alternatives?|suggest|recommend)\b"),
+  "ITINERARY_GENERATION": re.compile(r"\b(itinerary|schedule|daily plan|route)\b"),
+  "MODIFY_PLAN": re.compile(r"\b(no|not|don't|dont|never|without|instead|rather|avoid|change|changed|switch)\b"),
+  "FINALIZE_TRIP": re.compile(r"\b(hotels?|accommodation|flights?|transport|transfers?|restaurants?|finali[sz]e|final|book|booking)\b"),
+}
+
+FEATURE_DIM = 1 << 12
+
+def tokenize(text: str) -> List[str]:
+  return re.findall(r"[a-z0-9']+", text.lower())
+
+def cued_intents(normalized: str) -> List[str]:
+  return [intent for intent, pattern in INTENT_CUES.items() if pattern.search(normalized)]
+
+# Hashed unigrams and bigrams, crc32 so feature indexes do not change between processes
+def featurize(text: str) -> np.ndarray:
+  tokens = tokenize(text)
+  features = np.zeros(FEATURE_DIM + 1, dtype=np.float32)
+  features[FEATURE_DIM] = 1.0 # bias
+  grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+  for gram in grams:
+    features[zlib.crc32(gram.encode("utf-8")) % FEATURE_DIM] += 1.0
+  norm = np.linalg.norm(features[:FEATURE_DIM])
+  if norm > 0:
+    features[:FEATURE_DIM] /= norm
+  return features
+
+# Multinomial logistic regression trained with full-batch gradient descent
+class LinearIntentModel:
+  def __init__(self, weights: np.ndarray):
+    self.weights = weights
+
+  @classmethod
+  def train(cls, examples: Sequence[Tuple[str, str]], epochs: int = 300, lr: float = 2.0, l2: float = 1e-4) -> "LinearIntentModel":
+    x = np.stack([featurize(text) for text, _ in examples])
+    y = np.zeros((len(examples), len(INTENTS)), dtype=np.float32)
+    for i, (_, intent) in enumerate(examples):
+      y[i, INTENTS.index(intent)] = 1.0
+    # Only hashed features that occur in the examples can get a weight, train on those columns
+    used = np.flatnonzero(x.any(axis=0))
+    x_used = x[:, used]
+    w = np.zeros((len(used), len(INTENTS)), dtype=np.float32)
+    for _ in range(epochs):
+      probs = _softmax(x_used @ w)
+      w -= lr * (x_used.T @ (probs - y) / len(examples) + l2 * w)
+    weights = np.zeros((x.shape[1], len(INTENTS)), dtype=np.float32)
+    weights[used] = w
+    return cls(weights)
+
+  def predict(self, text: str) -> Tuple[str, float]:
+    probs = _softmax(featurize(text)[None, :] @ self.weights)[0]
+    best = int(np.argmax(probs))
+    return INTENTS[best], float(probs[best])
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+  z = z - z.max(axis=1, keepdims=True)
+  e = np.exp(z)
+  return e / e.sum(axis=1, keepdims=True)
+
+# Answers confident cases in process, returns None when the LLM chain should decide
+class IntentClassifier:
+  def __init__(self, examples: Sequence[Tuple[str, str]] = INTENT_EXAMPLES, threshold: float = INTENT_LOCAL_THRESHOLD):
+    self.examples = examples
+    self.threshold = threshold
+    self._model: Optional[LinearIntentModel] = None
+
+  # Trained on first use, tens of milliseconds for the bundled examples
+  @property
+  def model(self) -> LinearIntentModel:
+    if self._model is None:
+      self._model = LinearIntentModel.train(self.examples)
+    return self._model
+
+  # Called from the lifespan so the first request does not pay for training
+  def warm(self):
+    self.model
+
+  # (intents, source), source is "code", "rule" or "model"
+  def explain(self, user_input: str) -> Tuple[Optional[List[str]], Optional[str]]:
+    text = (user_input or "").strip()
+    # Buttons of the chat view send the category itself
+    if text in INTENTS:
+      return [text], "code"
+    normalized = " ".join(tokenize(text))
+    for pattern, intent in INTENT_RULES:
+      if pattern.match(normalized):
+        return [intent], "rule"
+    if not normalized or len(cued_intents(normalized)) > 1:
+      return None, None
+    intent, confidence = self.model.predict(normalized)
+    if confidence >= self.threshold:
+      return [intent], "model"
+    return None, None
+
+  def classify(self, user_input: str) -> Optional[List[str]]:
+    if not INTENT_LOCAL_ENABLED:
+      return None
+    with metrics.timer("intent.local"):
+      intents, source = self.explain(user_input)
+    metrics.incr(f"intent.{source}" if source else "intent.fallback")
+    return intents
+
+  def stats(self) -> Dict[str, float]:
+    counts = {source: metrics.counter(f"intent.{source}") for source in ("code", "rule", "model", "fallback")}
+    total = sum(counts.values())
+    stats = dict(counts)
+    stats["local_rate"] = round((total - counts["fallback"]) / total, 4) if total else 0.0
+    return stats
+
+intent_classifier = IntentClassifier()
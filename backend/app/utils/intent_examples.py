@@ -0,0 +1,138 @@
+# Labelled user inputs for the local intent model, categories of INTENT_CLASSIFIER_PROMPT
+INTENT_EXAMPLES = [
+  # ADVANCE_STEP
+  ("next", "ADVANCE_STEP"),
+  ("next step", "ADVANCE_STEP"),
+  ("go on", "ADVANCE_STEP"),
+  ("continue", "ADVANCE_STEP"),
+  ("let's continue", "ADVANCE_STEP"),
+  ("ok, move on", "ADVANCE_STEP"),
+  ("looks good, let's go to the next step", "ADVANCE_STEP"),
+  ("i'm happy with these, what's next", "ADVANCE_STEP"),
+  ("done, proceed", "ADVANCE_STEP"),
+  ("that's enough places, next please", "ADVANCE_STEP"),
+  ("perfect, let's move forward", "ADVANCE_STEP"),
+  ("yes that works, carry on", "ADVANCE_STEP"),
+  ("i'm done choosing", "ADVANCE_STEP"),
+  ("ok proceed to the next stage", "ADVANCE_STEP"),
+  ("sounds great, keep going", "ADVANCE_STEP"),
+  ("all set, next", "ADVANCE_STEP"),
+  ("confirmed, go ahead", "ADVANCE_STEP"),
+  ("great, what do we do now", "ADVANCE_STEP"),
+  ("fine with my shortlist, move on", "ADVANCE_STEP"),
+  ("step forward", "ADVANCE_STEP"),
+
+  # MORE_RECOMMENDATIONS
+  ("show more", "MORE_RECOMMENDATIONS"),
+  ("show me more", "MORE_RECOMMENDATIONS"),
+  ("more please", "MORE_RECOMMENDATIONS"),
+  ("any other places", "MORE_RECOMMENDATIONS"),
+  ("give me more options", "MORE_RECOMMENDATIONS"),
+  ("more recommendations", "MORE_RECOMMENDATIONS"),
+  ("can you suggest some museums", "MORE_RECOMMENDATIONS"),
+  ("focus on nature and hiking", "MORE_RECOMMENDATIONS"),
+  ("i want to see more beaches", "MORE_RECOMMENDATIONS"),
+  ("recommend some restaurants with local food", "MORE_RECOMMENDATIONS"),
+  ("what else is there to see", "MORE_RECOMMENDATIONS"),
+  ("something more relaxing", "MORE_RECOMMENDATIONS"),
+  ("other ideas for kids", "MORE_RECOMMENDATIONS"),
+  ("show me some hidden gems", "MORE_RECOMMENDATIONS"),
+  ("more places like the second one", "MORE_RECOMMENDATIONS"),
+  ("any parks or gardens nearby", "MORE_RECOMMENDATIONS"),
+  ("suggest a few nightlife spots", "MORE_RECOMMENDATIONS"),
+  ("i'd like more historical sites", "MORE_RECOMMENDATIONS"),
+  ("give me alternatives", "MORE_RECOMMENDATIONS"),
+  ("load more", "MORE_RECOMMENDATIONS"),
+  ("find me some quiet cafes", "MORE_RECOMMENDATIONS"),
+  ("what about art galleries", "MORE_RECOMMENDATIONS"),
+
+  # ITINERARY_GENERATION
+  ("make an itinerary", "ITINERARY_GENERATION"),
+  ("create an itinerary", "ITINERARY_GENERATION"),
+  ("generate the itinerary", "ITINERARY_GENERATION"),
+  ("plan my days", "ITINERARY_GENERATION"),
+  ("build a schedule for the trip", "ITINERARY_GENERATION"),
+  ("make a day by day plan", "ITINERARY_GENERATION"),
+  ("put these places into a schedule", "ITINERARY_GENERATION"),
+  ("can you arrange them into a route", "ITINERARY_GENERATION"),
+  ("draft a 3 day itinerary", "ITINERARY_GENERATION"),
+  ("organize my shortlist into days", "ITINERARY_GENERATION"),
+  ("create a plan for each day", "ITINERARY_GENERATION"),
+  ("schedule the visits", "ITINERARY_GENERATION"),
+  ("plan the trip with these places", "ITINERARY_GENERATION"),
+  ("make me a travel plan", "ITINERARY_GENERATION"),
+  ("give me a timetable for my trip", "ITINERARY_GENERATION"),
+  ("generate a route for tomorrow", "ITINERARY_GENERATION"),
+  ("i need an itinerary for 5 days", "ITINERARY_GENERATION"),
+  ("how should i split these over two days", "ITINERARY_GENERATION"),
+
+  # GENERAL_QUERY
+  ("what are the visa requirements for france", "GENERAL_QUERY"),
+  ("what's the weather like in october", "GENERAL_QUERY"),
+  ("which currency do they use", "GENERAL_QUERY"),
+  ("is it safe to travel there at night", "GENERAL_QUERY"),
+  ("how do i get from the airport to the city", "GENERAL_QUERY"),
+  ("do i need a power adapter", "GENERAL_QUERY"),
+  ("what language do they speak", "GENERAL_QUERY"),
+  ("is tipping expected", "GENERAL_QUERY"),
+  ("how much does the metro cost", "GENERAL_QUERY"),
+  ("when is the best time to visit", "GENERAL_QUERY"),
+  ("are museums free on sundays", "GENERAL_QUERY"),
+  ("what is the time difference", "GENERAL_QUERY"),
+  ("can i pay by card everywhere", "GENERAL_QUERY"),
+  ("what should i pack", "GENERAL_QUERY"),
+  ("is the tap water drinkable", "GENERAL_QUERY"),
+  ("tell me about the history of the louvre", "GENERAL_QUERY"),
+  ("how long is the flight from london", "GENERAL_QUERY"),
+  ("what is the emergency number", "GENERAL_QUERY"),
+
+  # MODIFY_PLAN
+  ("actually i want to go to rome instead", "MODIFY_PLAN"),
+  ("change the destination to tokyo", "MODIFY_PLAN"),
+  ("we are now traveling in december", "MODIFY_PLAN"),
+  ("the dates changed to next month", "MODIFY_PLAN"),
+  ("i'll travel with my kids now, not alone", "MODIFY_PLAN"),
+  ("let's do a beach holiday instead of a city trip", "MODIFY_PLAN"),
+  ("switch to barcelona", "MODIFY_PLAN"),
+  ("make it a winter trip", "MODIFY_PLAN"),
+  ("we only have two days now", "MODIFY_PLAN"),
+  ("i no longer like museums, prefer outdoor activities", "MODIFY_PLAN"),
+  ("change of plans, we go to the mountains", "MODIFY_PLAN"),
+  ("instead of paris let's visit lyon", "MODIFY_PLAN"),
+  ("move the trip to summer", "MODIFY_PLAN"),
+  ("forget italy, plan for spain", "MODIFY_PLAN"),
+  ("my budget is much lower now", "MODIFY_PLAN"),
+  ("it's a business trip now, not vacation", "MODIFY_PLAN"),
+
+  # FINALIZE_TRIP
+  ("finalize the trip with hotels", "FINALIZE_TRIP"),
+  ("add hotels and transport to the plan", "FINALIZE_TRIP"),
+  ("give me the final itinerary with restaurants", "FINALIZE_TRIP"),
+  ("include where to stay and how to get there", "FINALIZE_TRIP"),
+  ("complete the plan with accommodation", "FINALIZE_TRIP"),
+  ("book suggestions for hotels near these places", "FINALIZE_TRIP"),
+  ("final version with transport details", "FINALIZE_TRIP"),
+  ("add lunch and dinner spots to the itinerary", "FINALIZE_TRIP"),
+  ("finish the trip plan with flights and hotels", "FINALIZE_TRIP"),
+  ("make the final trip", "FINALIZE_TRIP"),
+  ("wrap it up with hotel recommendations", "FINALIZE_TRIP"),
+  ("complete itinerary including restaurants and transfers", "FINALIZE_TRIP"),
+  ("now add accommodation options", "FINALIZE_TRIP"),
+  ("finalize everything", "FINALIZE_TRIP"),
+
+  # OTHER
+  ("hello", "OTHER"),
+  ("hi there", "OTHER"),
+  ("thanks", "OTHER"),
+  ("thank you so much", "OTHER"),
+  ("who are you", "OTHER"),
+  ("lol", "OTHER"),
+  ("tell me a joke", "OTHER"),
+  ("what's 2 plus 2", "OTHER"),
+  ("write me a poem", "OTHER"),
+  ("good morning", "OTHER"),
+  ("bye", "OTHER"),
+  ("what can you do", "OTHER"),
+  ("help me with my homework", "OTHER"),
+  ("asdfgh", "OTHER"),
+]
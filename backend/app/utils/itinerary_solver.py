@@ -0,0 +1,265 @@
+import re
+from typing import Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+from app.utils.geo import haversine_km
+
+MINUTES_PER_DAY = 24 * 60
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+# Straight-line distance times this is the distance on the street
+DETOUR_FACTOR = 1.3
+WALK_KMH = 4.5
+TRANSIT_KMH = 18.0
+# Walking to the stop and waiting
+TRANSIT_OVERHEAD_MIN = 8.0
+# Legs up to this long are walked
+WALK_MAX_KM = 1.5
+# Waiting counts less than travelling, a place that cannot be scheduled costs more than any route
+WAIT_WEIGHT = 0.2
+UNSCHEDULED_PENALTY = 10000.0
+
+Window = Tuple[int, int]
+
+_TIME = r"(\d{1,2})(?::(\d{2}))?\s*([AaPp]\.?[Mm]\.?)?"
+_RANGE = re.compile(_TIME + r"\s*[–—-]\s*" + _TIME)
+
+def _minutes(hour: str, minute: Optional[str], meridiem: Optional[str]) -> int:
+  h = int(hour) % 12 if meridiem else int(hour)
+  if meridiem and meridiem[0].lower() == "p":
+    h += 12
+  return h * 60 + int(minute or 0)
+
+# Google weekday_text ("Monday: 9:00 AM – 5:00 PM", "Tuesday: Closed", "Sunday: Open 24 hours")
+# as opening windows in minutes per weekday, Monday first. None when nothing could be read,
+# the place is then treated as always open.
+def parse_opening_hours(weekday_text: Optional[Sequence[str]]) -> Optional[List[List[Window]]]:
+  if not weekday_text:
+    return None
+  windows: List[Optional[List[Window]]] = [None] * 7
+  for line in weekday_text:
+    day, _, hours = line.replace("\u202f", " ").replace("\u2009", " ").partition(":")
+    day = day.strip().lower()
+    if day not in WEEKDAYS:
+      continue
+    hours = hours.strip().lower()
+    if "closed" in hours:
+      windows[WEEKDAYS.index(day)] = []
+      continue
+    if "24 hours" in hours:
+      windows[WEEKDAYS.index(day)] = [(0, MINUTES_PER_DAY)]
+      continue
+    day_windows = []
+    for match in _RANGE.finditer(hours):
+      h1, m1, mer1, h2, m2, mer2 = match.groups()
+      # "2:00 – 6:00 PM": the start shares the meridiem of the end, unless that makes it later
+      if mer1 is None and mer2 is not None:
+        start = _minutes(h1, m1, mer2)
+        mer1 = mer2 if start <= _minutes(h2, m2, mer2) else ("am" if mer2[0].lower() == "p" else "pm")
+      opens, closes = _minutes(h1, m1, mer1), _minutes(h2, m2, mer2)
+      # Past midnight
+      if closes <= opens:
+        closes += MINUTES_PER_DAY
+      day_windows.append((opens, closes))
+    windows[WEEKDAYS.index(day)] = day_windows
+  if all(w is None for w in windows):
+    return None
+  # A weekday missing from the text is assumed open all day
+  return [w if w is not None else [(0, MINUTES_PER_DAY)] for w in windows]
+
+# Estimated door-to-door minutes between every pair of places: walking for short legs, transit beyond
+def travel_minutes(lats: Sequence[float], lngs: Sequence[float]) -> np.ndarray:
+  lats, lngs = np.asarray(lats, dtype=np.float64), np.asarray(lngs, dtype=np.float64)
+  km = haversine_km(lats[:, None], lngs[:, None], lats[None, :], lngs[None, :]) * DETOUR_FACTOR
+  minutes = np.where(km <= WALK_MAX_KM * DETOUR_FACTOR, km / WALK_KMH * 60, TRANSIT_OVERHEAD_MIN + km / TRANSIT_KMH * 60)
+  np.fill_diagonal(minutes, 0.0)
+  return minutes
+
+class SolverPlace:
+  def __init__(self, key: Hashable, duration: int, windows: Optional[List[List[Window]]] = None):
+    self.key = key
+    self.duration = duration
+    self.windows = windows
+
+class Visit:
+  def __init__(self, key: Hashable, arrive: int, start: int, end: int, travel: float):
+    self.key = key
+    self.arrive = arrive
+    self.start = start
+    self.end = end
+    self.travel = travel # Minutes from the previous visit of the day
+
+class Plan:
+  def __init__(self, days: List[List[Visit]], unscheduled: List[Hashable], cost: float):
+    self.days = days
+    self.unscheduled = unscheduled
+    self.cost = cost
+
+# Day-by-day visit orders within opening hours and the day's hours.
+# Days are seeded with places far apart, the other places are added by cheapest insertion,
+# then 2-opt within a day and or-opt moves of 1 to 3 places within and across days improve
+# the plan until no move lowers the travel time.
+class ItinerarySolver:
+  def __init__(
+    self,
+    places: List[SolverPlace],
+    travel: np.ndarray,
+    days: int,
+    first_weekday: int = 0,
+    day_start: int = 9 * 60,
+    day_end: int = 20 * 60,
+    max_rounds: int = 50,
+  ):
+    self.places = places
+    self.travel = np.asarray(travel, dtype=np.float64).tolist()
+    self.days = days
+    self.first_weekday = first_weekday
+    self.day_start = day_start
+    self.day_end = day_end
+    self.max_rounds = max_rounds
+
+  def solve(self) -> Plan:
+    routes = [[] for _ in range(self.days)]
+    costs = [0.0] * self.days
+    unscheduled = self._construct(routes, costs)
+    for _ in range(self.max_rounds):
+      improved = self._two_opt(routes, costs)
+      improved = self._or_opt(routes, costs) or improved
+      improved = self._insert_unscheduled(routes, costs, unscheduled) or improved
+      if not improved:
+        break
+    days = [self._visits(route, day) for day, route in enumerate(routes)]
+    return Plan(days, [self.places[p].key for p in unscheduled], sum(costs) + UNSCHEDULED_PENALTY * len(unscheduled))
+
+  # Earliest start at or after t within an opening window on that day, None if the visit does not fit
+  def _start(self, place: int, day: int, t: float) -> Optional[float]:
+    duration = self.places[place].duration
+    windows = self.places[place].windows
+    if windows is None:
+      return t if t + duration <= self.day_end else None
+    for opens, closes in windows[(self.first_weekday + day) % 7]:
+      start = max(t, opens)
+      if start + duration <= min(closes, self.day_end):
+        return start
+    return None
+
+  # Travel plus weighted waiting of the route, None if it breaks a time window
+  def _cost(self, route: List[int], day: int) -> Optional[float]:
+    cost, t, prev = 0.0, float(self.day_start), None
+    for place in route:
+      leg = self.travel[prev][place] if prev is not None else 0.0
+      start = self._start(place, day, t + leg)
+      if start is None:
+        return None
+      # The day begins at the first visit, waiting for it to open is free
+      if prev is not None:
+        cost += leg + WAIT_WEIGHT * (start - t - leg)
+      t, prev = start + self.places[place].duration, place
+    return cost
+
+  def _visits(self, route: List[int], day: int) -> List[Visit]:
+    visits, t, prev = [], float(self.day_start), None
+    for place in route:
+      leg = self.travel[prev][place] if prev is not None else 0.0
+      start = self._start(place, day, t + leg)
+      end = start + self.places[place].duration
+      visits.append(Visit(self.places[place].key, round(t + leg), round(start), round(end), leg))
+      t, prev = end, place
+    return visits
+
+  def _feasible_days(self, place: int) -> int:
+    return sum(self._start(place, day, self.day_start) is not None for day in range(self.days))
+
+  def _construct(self, routes: List[List[int]], costs: List[float]) -> List[int]:
+    pending = list(range(len(self.places)))
+    # Places open on fewer days go first
+    pending.sort(key=self._feasible_days)
+    # Seed every day with a place far from the seeds so far
+    seeds: List[int] = []
+    for day in range(self.days):
+      candidates = [p for p in pending if p not in seeds and self._start(p, day, self.day_start) is not None]
+      if not candidates:
+        continue
+      seed = max(candidates, key=lambda p: min((self.travel[s][p] for s in seeds), default=0.0)) if seeds else candidates[0]
+      seeds.append(seed)
+      routes[day].append(seed)
+      costs[day] = 0.0
+    unscheduled = []
+    for place in pending:
+      if place in seeds:
+        continue
+      if not self._insert(routes, costs, place):
+        unscheduled.append(place)
+    return unscheduled
+
+  # Cheapest feasible (day, position) for the place, returns whether it was inserted
+  def _insert(self, routes: List[List[int]], costs: List[float], place: int) -> bool:
+    best = None
+    for day, route in enumerate(routes):
+      for pos in range(len(route) + 1):
+        candidate = route[:pos] + [place] + route[pos:]
+        cost = self._cost(candidate, day)
+        if cost is not None and (best is None or cost - costs[day] < best[0]):
+          best = (cost - costs[day], day, candidate, cost)
+    if best is None:
+      return False
+    _, day, routes[day], costs[day] = best
+    return True
+
+  def _insert_unscheduled(self, routes: List[List[int]], costs: List[float], unscheduled: List[int]) -> bool:
+    inserted = [p for p in unscheduled if self._insert(routes, costs, p)]
+    for place in inserted:
+      unscheduled.remove(place)
+    return bool(inserted)
+
+  # Reverse a segment of one day
+  def _two_opt(self, routes: List[List[int]], costs: List[float]) -> bool:
+    improved = False
+    for day, route in enumerate(routes):
+      found = True
+      while found:
+        found = False
+        for i in range(len(route) - 1):
+          for j in range(i + 1, len(route)):
+            candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+            cost = self._cost(candidate, day)
+            if cost is not None and cost < costs[day] - 1e-9:
+              route[:], costs[day] = candidate, cost
+              found = improved = True
+              break
+          if found:
+            break
+    return improved
+
+  # Move 1 to 3 consecutive places to another position of the same or another day
+  def _or_opt(self, routes: List[List[int]], costs: List[float]) -> bool:
+    improved = False
+    for length in (1, 2, 3):
+      for src in range(len(routes)):
+        i = 0
+        while i + length <= len(routes[src]):
+          segment = routes[src][i:i + length]
+          rest = routes[src][:i] + routes[src][i + length:]
+          rest_cost = self._cost(rest, src)
+          moved = False
+          if rest_cost is not None:
+            for dst in range(len(routes)):
+              base = rest if dst == src else routes[dst]
+              for pos in range(len(base) + 1):
+                if dst == src and pos == i:
+                  continue
+                candidate = base[:pos] + segment + base[pos:]
+                cost = self._cost(candidate, dst)
+                if cost is None:
+                  continue
+                before = costs[src] + (costs[dst] if dst != src else 0.0)
+                after = cost + (rest_cost if dst != src else 0.0)
+                if after < before - 1e-9:
+                  if dst != src:
+                    routes[src], costs[src] = rest, rest_cost
+                  routes[dst], costs[dst] = candidate, cost
+                  moved = improved = True
+                  break
+              if moved:
+                break
+          if not moved:
+            i += 1
+    return improved
@@ -0,0 +1,86 @@
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator, Optional
+
+# In-process counters, gauges and latency samples, exposed through GET /metrics
+class Metrics:
+  def __init__(self, window: int = 2048):
+    self.window = window
+    self._counters: Dict[str, float] = defaultdict(float)
+    self._gauges: Dict[str, float] = {}
+    self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+
+  def incr(self, name: str, value: float = 1):
+    self._counters[name] += value
+
+  def set_gauge(self, name: str, value: float):
+    self._gauges[name] = value
+
+  def observe(self, name: str, value: float):
+    self._samples[name].append(value)
+
+  # Record the wall time of the block in milliseconds
+  @contextmanager
+  def timer(self, name: str):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(name, (time.perf_counter() - start) * 1000)
+
+  def counter(self, name: str) -> float:
+    return self._counters.get(name, 0)
+
+  def percentile(self, name: str, q: float) -> float:
+    samples = sorted(self._samples.get(name, ()))
+    if not samples:
+      return 0.0
+    idx = min(len(samples) - 1, max(0, round(q / 100 * (len(samples) - 1))))
+    return samples[idx]
+
+  def ratio(self, hits: str, misses: str) -> float:
+    total = self.counter(hits) + self.counter(misses)
+    return round(self.counter(hits) / total, 4) if total else 0.0
+
+  def snapshot(self) -> Dict:
+    return {
+      "counters": dict(self._counters),
+      "gauges": dict(self._gauges),
+      "timings_ms": {
+        name: {
+          "count": len(samples),
+          "p50": round(self.percentile(name, 50), 2),
+          "p95": round(self.percentile(name, 95), 2),
+          "p99": round(self.percentile(name, 99), 2),
+          "max": round(max(samples), 2) if samples else 0.0,
+        }
+        for name, samples in self._samples.items()
+      },
+    }
+
+  def reset(self):
+    self._counters.clear()
+    self._gauges.clear()
+    self._samples.clear()
+
+metrics = Metrics()
+
+# Counters of the current request, tasks spawned while handling it share the same dict
+_request_counts: ContextVar[Optional[Dict[str, int]]] = ContextVar("request_counts", default=None)
+
+@contextmanager
+def request_scope() -> Iterator[Dict[str, int]]:
+  counts: Dict[str, int] = {}
+  token = _request_counts.set(counts)
+  try:
+    yield counts
+  finally:
+    _request_counts.reset(token)
+
+# No-op outside of a request, e.g. in background flushes
+def count_in_request(name: str, value: int = 1):
+  counts = _request_counts.get()
+  if counts is not None:
+    counts[name] = counts.get(name, 0) + value
@@ -0,0 +1,49 @@
+import re
+from typing import Dict, Iterable, List, Set
+import numpy as np
+from app.models.recommend import ShortTermProfile
+from app.models.shortlist import ShortlistItem
+
+# Weight of a tag the user wants to avoid
+AVOID_WEIGHT = -1.0
+
+# "Art_Galleries" and "art gallery" are one tag, each word also counts on its own
+def tag_terms(tag: str) -> Set[str]:
+  words = [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in re.findall(r"[a-z]+", tag.lower())]
+  terms = set(words)
+  if len(words) > 1:
+    terms.add(" ".join(words))
+  return terms
+
+def _profile_weights(profile: ShortTermProfile) -> Dict[str, float]:
+  weights: Dict[str, float] = {}
+  for tag, tw in profile.preferences.items():
+    for term in tag_terms(tag):
+      weights[term] = max(weights.get(term, 0.0), tw.weight)
+  for tag in profile.avoids:
+    for term in tag_terms(tag):
+      weights[term] = AVOID_WEIGHT
+  return weights
+
+# Places ordered by the dot product of their tags with the session's preference weights,
+# without an LLM call. Ties keep the incoming order.
+def rank_places(places: List[ShortlistItem], profile: ShortTermProfile) -> List[ShortlistItem]:
+  scores = score_places(places, profile)
+  order = np.argsort(-scores, kind="stable")
+  return [places[i] for i in order]
+
+def score_places(places: Iterable[ShortlistItem], profile: ShortTermProfile) -> np.ndarray:
+  places = list(places)
+  weights = _profile_weights(profile)
+  if not places or not weights:
+    return np.zeros(len(places))
+
+  vocab = {term: i for i, term in enumerate(weights)}
+  tags = np.zeros((len(places), len(vocab)), dtype=np.float32)
+  for row, place in enumerate(places):
+    for tag in place.tags or []:
+      for term in tag_terms(tag):
+        col = vocab.get(term)
+        if col is not None:
+          tags[row, col] = 1.0
+  return tags @ np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
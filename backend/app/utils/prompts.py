@@ -176,8 +176,9 @@ CREATE_ITINERARY_PROMPT = ChatPromptTemplate([
   3.  **Places user chose (`place_names`):** (May be empty)
       * If is not empty, `place_names` contains the names of the places and their opening hours, you must arrange itinerary based on these places and their opening hours.
       * If is empty, you must suggest several popular places and generate the itinerary according to `user_input` and `history`. The suggested places should not be at the city level or above; they should be detailed down to scenic spots, restaurants, etc
-  4.  **You must also suggest a reasonable transportation method (e.g., WALK, TRANSIT, BICYCLE, DRIVE) between places, calculate possible commute time, and show in your itinerary.**
-  5.  **You Must arrange itinerary based on the possible duration of user's visit to each place, and the possible time and resturants for lunch or dinner.
+  4.  **Known places nearby (`nearby_places`):** (May be empty) Places close to the chosen ones. When you add restaurants or extra stops, prefer these places.
+  5.  **You must also suggest a reasonable transportation method (e.g., WALK, TRANSIT, BICYCLE, DRIVE) between places, calculate possible commute time, and show in your itinerary.**
+  6.  **You Must arrange itinerary based on the possible duration of user's visit to each place, and the possible time and resturants for lunch or dinner.
   
   **Output Format:**
   Always return a JSON object with two keys:
@@ -191,7 +192,25 @@ CREATE_ITINERARY_PROMPT = ChatPromptTemplate([
         * `commute_mode` (only for commute): If `type` is commute, this string is the selected mode of transportation (e.g., WALK, TRANSIT, BICYCLE, DRIVE). If not remain null.
   ```
   """),
-  ("human", "User input: {user_input}\n history: {history} \nShortlist places: {place_names}\n\n")
+  ("human", "User input: {user_input}\n history: {history} \nShortlist places: {place_names}\nNearby places: {nearby_places}\n\n")
+])
+
+# The itinerary is already planned, only the text around it is written
+ITINERARY_NARRATIVE_PROMPT = ChatPromptTemplate([
+  ("system", """You are a highly skilled travel planning AI. The day-by-day itinerary below has already been planned from the places the user chose, their opening hours and the travel times between them. Do not change it.
+
+  1.  **User Input (`user_input`):** There may be other information in the `user_input`, you must answer to this information.
+  2.  **Current Session Context (`history`):** Use it to match the tone and the kind of trip the user wants.
+  3.  **Itinerary (`itinerary`):** The planned visits of each day with their times and the way to get from one place to the next.
+  4.  **Places left out (`unscheduled`):** (May be empty) Places that did not fit into the days or their opening hours, mention them briefly.
+
+  Introduce the itinerary: summarize each day in one or two sentences, and give useful tips such as where to have lunch or what to book in advance.
+
+  **Output Format:**
+  Always return a JSON object with one key:
+    1.  `content`: A string with your introduction, summary and tips. This should be natural conversational text.
+  """),
+  ("human", "User input: {user_input}\n history: {history} \nItinerary: {itinerary}\nPlaces left out: {unscheduled}\n\n")
 ])
 
 PLACE_DETAIL_ENRICH_PROMPT = ChatPromptTemplate([
@@ -0,0 +1,108 @@
+import os
+from typing import Any, Callable, Dict, Generic, Iterable, List, Optional, Type, TypeVar
+from dotenv import load_dotenv
+from pydantic import BaseModel
+from app.models.session import History
+from app.models.shortlist import ShortlistItem
+
+load_dotenv()
+# JSON encoder of models written to Redis: pydantic | orjson | msgspec
+SERIALIZER = os.getenv("SERIALIZER", "orjson")
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+try:
+  import msgspec
+except ImportError:
+  msgspec = None
+
+try:
+  import ormsgpack
+except ImportError:
+  ormsgpack = None
+
+M = TypeVar("M", bound=BaseModel)
+
+# Models here have no aliases or custom serializers, their __dict__ holds exactly the fields
+def _model_dict(obj: Any) -> Dict[str, Any]:
+  if isinstance(obj, BaseModel):
+    return obj.__dict__
+  raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def _pydantic_dumps(obj: BaseModel) -> str:
+  return obj.model_dump_json()
+
+def _orjson_dumps(obj: BaseModel) -> str:
+  return orjson.dumps(obj, default=_model_dict).decode("utf-8")
+
+def _msgspec_dumps(obj: BaseModel) -> str:
+  return msgspec.json.encode(obj, enc_hook=_model_dict).decode("utf-8")
+
+def _json_loads(raw: Any) -> Any:
+  if orjson is not None:
+    return orjson.loads(raw)
+  if msgspec is not None:
+    return msgspec.json.decode(raw)
+  import json
+  return json.loads(raw)
+
+def _backend_dumps(name: str) -> Callable[[BaseModel], str]:
+  if name == "orjson" and orjson is not None:
+    return _orjson_dumps
+  if name == "msgspec" and msgspec is not None:
+    return _msgspec_dumps
+  if name != "pydantic":
+    print(f"Serializer {name} not available, using pydantic")
+  return _pydantic_dumps
+
+# Encodes and decodes one model type for Redis and MongoDB.
+# Decoding always goes through pydantic-core's JSON validator, which is faster than any
+# parse-then-validate combination, so the backends only differ on the encoding side.
+class ModelCodec(Generic[M]):
+  def __init__(self, model: Type[M], backend: str = SERIALIZER, compact: Optional[Callable[[M], M]] = None):
+    self.model = model
+    self.backend = backend
+    self._dumps = _backend_dumps(backend)
+    # Applied before encoding, e.g. to store places as references
+    self._compact = compact
+
+  # JSON text for a Redis value
+  def dumps(self, obj: M) -> str:
+    return self._dumps(self._compact(obj) if self._compact else obj)
+
+  def loads(self, raw: Any) -> M:
+    return self.model.model_validate_json(raw)
+
+  def loads_many(self, raws: Iterable[Any]) -> List[M]:
+    validate = self.model.model_validate_json
+    return [validate(raw) for raw in raws]
+
+  # MongoDB document of a validated model
+  def to_document(self, obj: M) -> Dict[str, Any]:
+    return obj.model_dump()
+
+  # Trusted fast path: values this service wrote to Redis itself go to MongoDB as parsed JSON,
+  # without building and dumping the models again. Nested datetimes stay ISO strings,
+  # pydantic turns them back into datetimes when the document is loaded.
+  def raw_documents(self, raws: Iterable[Any]) -> List[Dict[str, Any]]:
+    return [_json_loads(raw) for raw in raws]
+
+  # MessagePack form, for binary stores. Redis values stay JSON: the client decodes
+  # responses as UTF-8 and session fields are assembled as JSON on read.
+  def pack(self, obj: M) -> bytes:
+    if ormsgpack is None:
+      raise RuntimeError("ormsgpack is not installed")
+    return ormsgpack.packb(obj, option=ormsgpack.OPT_SERIALIZE_PYDANTIC)
+
+  def unpack(self, raw: bytes) -> M:
+    if ormsgpack is None:
+      raise RuntimeError("ormsgpack is not installed")
+    return self.model.model_validate(ormsgpack.unpackb(raw))
+
+# History and shortlist hold place references, place_codec is for the full places of the place store
+history_codec = ModelCodec(History, compact=History.compact)
+shortlist_codec = ModelCodec(ShortlistItem, compact=ShortlistItem.to_ref)
+place_codec = ModelCodec(ShortlistItem)
@@ -0,0 +1,179 @@
+import asyncio
+import contextvars
+import os
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from pydantic import TypeAdapter
+from redis.exceptions import RedisError
+from app.services.redis_service import redis_service
+from app.utils.metrics import metrics
+
+load_dotenv()
+# How long a finished result stays readable for callers that were waiting on it
+SINGLE_FLIGHT_RESULT_TTL = int(os.getenv("SINGLE_FLIGHT_RESULT_TTL", "15"))
+
+CHANNEL_PREFIX = "singleflight:"
+
+# Only the owner of the lock may release it
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# One pattern subscription per process, completions of every flight are dispatched from it
+class FlightNotifier:
+  def __init__(self):
+    self._waiters: Dict[str, List[asyncio.Future]] = {}
+    self._pubsub = None
+    self._task: Optional[asyncio.Task] = None
+    self._lock: Optional[asyncio.Lock] = None
+
+  async def _ensure_started(self):
+    if self._task is not None and not self._task.done():
+      return
+    if self._lock is None:
+      self._lock = asyncio.Lock()
+    async with self._lock:
+      if self._task is not None and not self._task.done():
+        return
+      self._pubsub = redis_service.get_redis_client().pubsub(ignore_subscribe_messages=True)
+      await self._pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+      # Not tied to the request that happened to start it
+      self._task = contextvars.Context().run(asyncio.create_task, self._listen())
+
+  async def _listen(self):
+    try:
+      async for message in self._pubsub.listen():
+        if message.get("type") != "pmessage":
+          continue
+        for future in self._waiters.pop(message["channel"], []):
+          if not future.done():
+            future.set_result(message["data"])
+    except asyncio.CancelledError:
+      raise
+    except Exception as e:
+      print(f"Single-flight listener stopped: {e}")
+
+  # Wait for a notification on channel. is_done is checked after subscribing, so a result
+  # published just before cannot be missed. Returns False on timeout.
+  async def wait(self, channel: str, is_done: Callable[[], Awaitable[bool]], timeout: float) -> bool:
+    await self._ensure_started()
+    future = asyncio.get_running_loop().create_future()
+    self._waiters.setdefault(channel, []).append(future)
+    try:
+      if await is_done():
+        return True
+      await asyncio.wait_for(future, timeout)
+      return True
+    except asyncio.TimeoutError:
+      return False
+    finally:
+      waiters = self._waiters.get(channel)
+      if waiters and future in waiters:
+        waiters.remove(future)
+        if not waiters:
+          self._waiters.pop(channel, None)
+
+  async def close(self):
+    if self._task is not None:
+      self._task.cancel()
+      try:
+        await self._task
+      except asyncio.CancelledError:
+        pass
+      self._task = None
+    if self._pubsub is not None:
+      await self._pubsub.aclose()
+      self._pubsub = None
+
+flight_notifier = FlightNotifier()
+
+# Concurrent calls for the same key run func once, in this process and across workers.
+# Callers in this process share a future; other workers find the Redis lock taken
+# (SET NX PX) and wait for the owner's result, published on singleflight:{name}:{key}.
+class SingleFlight:
+  def __init__(self, name: str, adapter: TypeAdapter, lock_ttl: float = 30):
+    self.name = name
+    self.adapter = adapter
+    self.lock_ttl_ms = int(lock_ttl * 1000)
+    self._inflight: Dict[str, asyncio.Future] = {}
+    self._release_script = None
+
+  def _key(self, key: str, suffix: str) -> str:
+    return f"singleflight:{self.name}:{key}:{suffix}"
+
+  async def do(self, key: str, func: Callable[[], Awaitable]):
+    future = self._inflight.get(key)
+    if future is not None:
+      metrics.incr(f"single_flight.{self.name}.shared.local")
+      return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    self._inflight[key] = future
+    try:
+      result = await self._run(key, func)
+      future.set_result(result)
+      return result
+    except asyncio.CancelledError:
+      future.cancel()
+      raise
+    except Exception as e:
+      future.set_exception(e)
+      # Retrieved here so a flight nobody else joined does not log "exception never retrieved"
+      future.exception()
+      raise
+    finally:
+      self._inflight.pop(key, None)
+
+  async def _run(self, key: str, func: Callable[[], Awaitable]):
+    client = redis_service.get_redis_client()
+    lock_key, result_key, channel = self._key(key, "lock"), self._key(key, "result"), self._key(key, "done")
+
+    while True:
+      try:
+        raw = await client.get(result_key)
+        if raw is not None:
+          metrics.incr(f"single_flight.{self.name}.shared.remote")
+          return self.adapter.validate_json(raw)
+        token = uuid.uuid4().hex
+        acquired = await client.set(lock_key, token, nx=True, px=self.lock_ttl_ms)
+      except RedisError as e:
+        # Without Redis there is nothing to coordinate with, do the work here
+        print(f"Single-flight {self.name} unavailable for {key}: {e}")
+        return await func()
+
+      if acquired:
+        metrics.incr(f"single_flight.{self.name}.leader")
+        return await self._lead(client, key, func, lock_key, result_key, channel, token)
+
+      # Another worker has it, wait for its result or for the lock to expire
+      done = await flight_notifier.wait(channel, lambda: client.exists(result_key), self.lock_ttl_ms / 1000)
+      if not done:
+        metrics.incr(f"single_flight.{self.name}.timeout")
+
+  async def _lead(self, client, key: str, func: Callable[[], Awaitable], lock_key: str, result_key: str, channel: str, token: str):
+    published = False
+    try:
+      result = await func()
+      try:
+        async with client.pipeline(transaction=False) as pipe:
+          pipe.set(result_key, self.adapter.dump_json(result).decode("utf-8"), ex=SINGLE_FLIGHT_RESULT_TTL)
+          pipe.publish(channel, "done")
+          await pipe.execute()
+        published = True
+      except RedisError as e:
+        print(f"Single-flight {self.name} could not publish {key}: {e}")
+      return result
+    finally:
+      try:
+        # Waiters of a failed flight wake up and one of them takes the lock
+        if not published:
+          await client.publish(channel, "error")
+        if self._release_script is None:
+          self._release_script = client.register_script(RELEASE_LOCK_SCRIPT)
+        await self._release_script(keys=[lock_key], args=[token])
+      except RedisError as e:
+        print(f"Single-flight {self.name} could not release {key}: {e}")
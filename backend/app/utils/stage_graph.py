@@ -0,0 +1,111 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from app.utils.metrics import metrics
+
+Results = Dict[str, Any]
+
+# Stage statuses
+DONE = "done"
+SKIPPED = "skipped"
+CANCELLED = "cancelled"
+
+class Stage:
+  def __init__(
+    self,
+    name: str,
+    func: Callable[[Results], Awaitable[Any]],
+    deps: Iterable[str] = (),
+    when: Optional[Callable[[Results], bool]] = None,
+    keep_if: Optional[Tuple[str, Callable[[Results], bool]]] = None,
+  ):
+    self.name = name
+    self.func = func
+    self.deps = tuple(deps)
+    # Checked once the deps are done, the stage is skipped if it returns False
+    self.when = when
+    # Speculative: (stage, predicate), cancelled as soon as that stage is done and the predicate is False
+    self.keep_if = keep_if
+
+# Small dependency graph of async stages: a stage starts as soon as its deps are done,
+# independent stages run concurrently. Each stage gets the results of the stages before it.
+# A failing stage cancels the rest and its exception is raised from run().
+class StageGraph:
+  def __init__(self, name: str):
+    self.name = name
+    self.stages: Dict[str, Stage] = {}
+    self.results: Results = {}
+    self.status: Dict[str, str] = {}
+    self.timings: Dict[str, float] = {}
+
+  def add(self, name: str, func: Callable[[Results], Awaitable[Any]], deps: Iterable[str] = (), when: Optional[Callable[[Results], bool]] = None, keep_if: Optional[Tuple[str, Callable[[Results], bool]]] = None) -> "StageGraph":
+    for dep in deps:
+      if dep not in self.stages:
+        raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+    self.stages[name] = Stage(name, func, deps, when, keep_if)
+    return self
+
+  async def run(self) -> Results:
+    pending = dict(self.stages)
+    tasks: Dict[str, asyncio.Task] = {}
+    start = time.perf_counter()
+    try:
+      self._start_ready(pending, tasks)
+      while tasks:
+        done, _ = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_COMPLETED)
+        for name in [n for n, t in tasks.items() if t in done]:
+          task = tasks.pop(name)
+          if task.cancelled():
+            self._finish(name, CANCELLED)
+            continue
+          if task.exception() is not None:
+            raise task.exception()
+          self._finish(name, DONE, task.result())
+          self._cancel_unneeded(name, pending, tasks)
+        self._start_ready(pending, tasks)
+    finally:
+      for task in tasks.values():
+        task.cancel()
+      await asyncio.gather(*tasks.values(), return_exceptions=True)
+      self.timings["total"] = (time.perf_counter() - start) * 1000
+      metrics.observe(f"{self.name}.total", self.timings["total"])
+    return self.results
+
+  def _start_ready(self, pending: Dict[str, Stage], tasks: Dict[str, asyncio.Task]):
+    # Skipping a stage can make others ready, so repeat until nothing changes
+    changed = True
+    while changed:
+      changed = False
+      for name, stage in list(pending.items()):
+        if not all(dep in self.status for dep in stage.deps):
+          continue
+        del pending[name]
+        changed = True
+        if stage.when is not None and not stage.when(self.results):
+          self._finish(name, SKIPPED)
+        else:
+          tasks[name] = asyncio.create_task(self._run_stage(stage))
+
+  def _cancel_unneeded(self, finished: str, pending: Dict[str, Stage], tasks: Dict[str, asyncio.Task]):
+    for name, stage in list(self.stages.items()):
+      if stage.keep_if is None or stage.keep_if[0] != finished or stage.keep_if[1](self.results):
+        continue
+      if name in tasks:
+        tasks[name].cancel()
+      elif name in pending:
+        del pending[name]
+        self._finish(name, CANCELLED)
+
+  async def _run_stage(self, stage: Stage):
+    start = time.perf_counter()
+    try:
+      return await stage.func(self.results)
+    finally:
+      self.timings[stage.name] = (time.perf_counter() - start) * 1000
+      metrics.observe(f"{self.name}.{stage.name}", self.timings[stage.name])
+
+  def _finish(self, name: str, status: str, result: Any = None):
+    self.status[name] = status
+    self.results[name] = result
+    if status != DONE:
+      metrics.incr(f"{self.name}.{name}.{status}")
@@ -0,0 +1,72 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from fastapi.encoders import jsonable_encoder
+from langchain_core.runnables import Runnable
+
+_CLOSED = object()
+
+def format_sse(event: str, data: Any) -> str:
+  return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+# Queue of server-sent events produced while a chat turn is running.
+# Events: token {text}, card {kind, place_id, item}, done {role, message, short_term_profile}, error {detail}.
+# Cards arrive as places resolve, identified by place_id. Their final order is the one in the done frame.
+class EventStream:
+  def __init__(self):
+    self._queue: asyncio.Queue = asyncio.Queue()
+
+  async def emit(self, event: str, data: Any):
+    await self._queue.put(format_sse(event, data))
+
+  async def token(self, text: str):
+    if text:
+      await self.emit("token", {"text": text})
+
+  async def card(self, kind: str, item: Any):
+    if item:
+      await self.emit("card", {"kind": kind, "place_id": item.place_id, "item": item})
+
+  # Callback for bounded_gather, emits each resolved place card. The input position is not sent,
+  # cards that do not resolve are dropped and the rest re-ranked before the done frame.
+  def card_emitter(self, kind: str) -> Callable[[int, Any], Awaitable[None]]:
+    async def emit_card(idx: int, item: Any):
+      await self.card(kind, item)
+    return emit_card
+
+  async def close(self):
+    await self._queue.put(_CLOSED)
+
+  async def events(self) -> AsyncIterator[str]:
+    while True:
+      item = await self._queue.get()
+      if item is _CLOSED:
+        break
+      yield item
+
+# Run a StrOutputParser chain, forwarding chunks as tokens
+async def stream_text(chain: Runnable, inputs: Dict[str, Any], stream: Optional[EventStream]) -> str:
+  if stream is None:
+    return await chain.ainvoke(inputs)
+
+  chunks = []
+  async for chunk in chain.astream(inputs):
+    chunks.append(chunk)
+    await stream.token(chunk)
+  return "".join(chunks)
+
+# Run a JsonOutputParser chain, forwarding the growing text of one field as tokens.
+# The final parsed object is returned, it is what gets stored in history and sent in the done frame.
+async def stream_json_field(chain: Runnable, inputs: Dict[str, Any], stream: Optional[EventStream], field: str = "content") -> Any:
+  if stream is None:
+    return await chain.ainvoke(inputs)
+
+  result = None
+  sent = ""
+  async for partial in chain.astream(inputs):
+    result = partial
+    text = partial.get(field) if isinstance(partial, dict) else None
+    if isinstance(text, str) and text.startswith(sent) and len(text) > len(sent):
+      await stream.token(text[len(sent):])
+      sent = text
+  return result
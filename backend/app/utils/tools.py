@@ -1,15 +1,13 @@
 from datetime import datetime
-import json
 from typing import List, Literal, Optional, Tuple
 from langchain.tools import tool
 from pydantic import BaseModel, Field, field_validator
 from enum import Enum
-from dotenv import load_dotenv
 import os
-from app.db.mongodb import get_database
-import requests
 from app.models.session import RouteStep
-from app.models.place_info import PlaceInfo
+from app.services.google_maps_service import google_maps_service
+from app.services.route_cache_service import route_cache_service
+from app.services.place_store_service import place_store_service
 
 class TravelMode(str, Enum):
   driving = "driving"
@@ -33,8 +31,8 @@ class RouteInput(BaseModel):
     return v
 
 
-load_dotenv()
-key = os.getenv("GOOGLE_API")
+ROUTE_FIELD_MASK = "routes.duration,routes.legs"
+ROUTE_TIMEOUT = float(os.getenv("GOOGLE_ROUTES_TIMEOUT", "8"))
 
 # Should be out of a class
 # @tool
@@ -49,24 +47,29 @@ async def get_route_info(origin: str, destination: str, mode: Literal["WALK", "T
     - arrival_time (Optional[str]): Arrival time in RFC 3339 format (e.g., '2024-05-20T14:30:00Z'). Only used if mode is 'transit'.
   """
 
-  url = f"https://routes.googleapis.com/directions/v2:computeRoutes"
+  origin_id = (await place_store_service.lookup(origin))[0].place_id
+  destination_id = (await place_store_service.lookup(destination))[0].place_id
 
-  headers = {
-    "Content-Type": "application/json",
-    "X-Goog-Api-Key": key,
-    "X-Goog-FieldMask": "routes.duration,routes.legs"
-  }
+  cached = await route_cache_service.get_route(origin_id, destination_id, mode, arrival_time)
+  if cached:
+    return cached
+
+  duration, resolved_mode, route_steps = await _compute_route(origin_id, destination_id, mode, arrival_time)
+  if duration:
+    await route_cache_service.save_route(origin_id, destination_id, mode, arrival_time, (duration, resolved_mode, route_steps))
+  return duration, resolved_mode, route_steps
 
-  db = get_database()
-  origin_id = (await PlaceInfo(db).get_place(origin)).place_id
-  destination_id = (await PlaceInfo(db).get_place(destination)).place_id
+# Call Google Routes, falling back to walking when there is no route and to driving when the walk is over an hour
+async def _compute_route(origin_id: str, destination_id: str, mode: str, arrival_time: Optional[str]) -> Optional[Tuple[str, str, List[RouteStep]]]:
   body = {
     "origin": { "placeId": origin_id },
     "destination": { "placeId": destination_id },
     "travelMode": mode.upper(),
     "arrivalTime": arrival_time
   }
-  response = requests.post(url, headers=headers, data=json.dumps(body))
+  response = await google_maps_service.compute_routes(body, ROUTE_FIELD_MASK, timeout=ROUTE_TIMEOUT)
+  if response is None:
+    return None, None, None
   if response.status_code == 200:
     data = response.json()
     if not data and mode.upper() != 'WALK':
@@ -76,8 +79,8 @@ async def get_route_info(origin: str, destination: str, mode: Literal["WALK", "T
         "travelMode": 'WALK',
       }
       print("turn to walk")
-      response = requests.post(url, headers=headers, data=json.dumps(new_body))
-      data = response.json()
+      response = await google_maps_service.compute_routes(new_body, ROUTE_FIELD_MASK, timeout=ROUTE_TIMEOUT)
+      data = response.json() if response is not None else None
       mode = 'WALK'
     if data and mode.upper() == 'WALK': 
       duration = float(data["routes"][0]["duration"][:-1])
@@ -89,11 +92,11 @@ async def get_route_info(origin: str, destination: str, mode: Literal["WALK", "T
           "arrivalTime": arrival_time
         }
         print("turn to drive")
-        response = requests.post(url, headers=headers, data=json.dumps(new_body))
-        data = response.json()
+        response = await google_maps_service.compute_routes(new_body, ROUTE_FIELD_MASK, timeout=ROUTE_TIMEOUT)
+        data = response.json() if response is not None else None
         mode = 'DRIVE'
     if not data:
-      print("Error:", response.status_code, response.text)
+      print(f"Error: no route found from {origin_id} to {destination_id}")
       return None, None, None
     duration = data["routes"][0]["duration"]
     steps = data["routes"][0]["legs"][0]["steps"]
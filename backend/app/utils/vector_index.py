@@ -0,0 +1,152 @@
+import re
+import zlib
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+import numpy as np
+
+EMBEDDING_DIM = 1 << 10
+
+# Plural "s" dropped so "museums" and "museum" are one token
+def tokenize(text: str) -> List[str]:
+  return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in re.findall(r"[a-z0-9]+", (text or "").lower())]
+
+# Signed hashing of unigrams and bigrams into a unit vector, crc32 so vectors do not change
+# between processes. Texts sharing words get a positive dot product, no model is needed.
+def embed_text(text: str, weight: float = 1.0, dim: int = EMBEDDING_DIM, out: Optional[np.ndarray] = None) -> np.ndarray:
+  vector = np.zeros(dim, dtype=np.float32) if out is None else out
+  tokens = tokenize(text)
+  for gram in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+    h = zlib.crc32(gram.encode("utf-8"))
+    vector[h % dim] += weight if h & 0x80000000 else -weight
+  return vector
+
+def normalize(vector: np.ndarray) -> np.ndarray:
+  norm = np.linalg.norm(vector)
+  return vector / norm if norm > 0 else vector
+
+# k-means on unit vectors, sqrt(n) clusters. Pure function of its input, runs in a thread.
+# Returns the centroids and the cluster of every vector.
+def kmeans(vectors: np.ndarray, iterations: int = 10, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+  count = len(vectors)
+  clusters = max(1, int(np.sqrt(count)))
+  rng = np.random.default_rng(seed)
+  centroids = vectors[rng.choice(count, clusters, replace=False)].copy()
+  for _ in range(iterations):
+    assign = np.argmax(vectors @ centroids.T, axis=1)
+    sums = np.zeros_like(centroids)
+    np.add.at(sums, assign, vectors)
+    sizes = np.bincount(assign, minlength=clusters)
+    # An empty cluster keeps its centroid
+    filled = sizes > 0
+    centroids[filled] = sums[filled] / np.linalg.norm(sums[filled], axis=1, keepdims=True).clip(1e-12)
+  return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+# In-memory index of unit vectors searched by dot product.
+# "flat" scores every vector; "ivf" scores the vectors of the nprobe clusters closest to the query.
+# Clusters are trained with k-means once the index holds ivf_min vectors and retrained when it doubles.
+# Training does not happen in upsert: the owner checks needs_training, runs kmeans on
+# begin_training() off the event loop and swaps the result in with install().
+class VectorIndex:
+  def __init__(self, dim: int = EMBEDDING_DIM, mode: str = "flat", nprobe: int = 8, ivf_min: int = 2000):
+    if mode not in ("flat", "ivf"):
+      raise ValueError(f"Unknown vector index mode {mode}")
+    self.dim = dim
+    self.mode = mode
+    self.nprobe = nprobe
+    self.ivf_min = ivf_min
+    self.keys: List[Hashable] = []
+    self.positions: Dict[Hashable, int] = {}
+    self._vectors = np.zeros((0, dim), dtype=np.float32)
+    self._centroids: Optional[np.ndarray] = None
+    self._assign = np.zeros(0, dtype=np.int64)
+    self._lists: List[List[int]] = []
+    self._trained_size = 0
+    # Positions written while a training runs, their clusters are recomputed on install
+    self._changed: Optional[Set[int]] = None
+
+  def __len__(self) -> int:
+    return len(self.keys)
+
+  @property
+  def vectors(self) -> np.ndarray:
+    return self._vectors[:len(self.keys)]
+
+  # Adds the vector or replaces the one stored under key, returns its position.
+  # Once clusters are trained the vector is assigned to the closest one.
+  def upsert(self, key: Hashable, vector: np.ndarray) -> int:
+    vector = normalize(np.asarray(vector, dtype=np.float32))
+    pos = self.positions.get(key)
+    if pos is None:
+      pos = len(self.keys)
+      if pos == len(self._vectors):
+        # A new array, a training still reads the old one
+        grown = np.zeros((max(64, 2 * pos), self.dim), dtype=np.float32)
+        grown[:pos] = self._vectors[:pos]
+        self._vectors = grown
+        self._assign = np.resize(self._assign, len(grown))
+      self.keys.append(key)
+      self.positions[key] = pos
+    elif self._centroids is not None:
+      self._lists[self._assign[pos]].remove(pos)
+    self._vectors[pos] = vector
+    if self._changed is not None:
+      self._changed.add(pos)
+
+    if self._centroids is not None:
+      cluster = int(np.argmax(self._centroids @ vector))
+      self._assign[pos] = cluster
+      self._lists[cluster].append(pos)
+    return pos
+
+  def needs_training(self) -> bool:
+    if self.mode != "ivf":
+      return False
+    if self._centroids is None:
+      return len(self.keys) >= self.ivf_min
+    return len(self.keys) >= 2 * self._trained_size
+
+  # Vectors to train on, a view that later upserts do not move
+  def begin_training(self) -> np.ndarray:
+    self._changed = set()
+    return self.vectors
+
+  # Swaps in clusters trained on the first len(assign) vectors,
+  # vectors added or replaced since are assigned to the new centroids here
+  def install(self, centroids: np.ndarray, assign: np.ndarray):
+    count = len(assign)
+    changed = self._changed or set()
+    self._changed = None
+    self._assign[:count] = assign
+    stale = np.fromiter(sorted(changed | set(range(count, len(self.keys)))), dtype=np.int64)
+    if len(stale):
+      self._assign[stale] = np.argmax(self._vectors[stale] @ centroids.T, axis=1)
+    self._centroids = centroids
+    self._lists = [[] for _ in range(len(centroids))]
+    for pos, cluster in enumerate(self._assign[:len(self.keys)].tolist()):
+      self._lists[cluster].append(pos)
+    self._trained_size = count
+
+  # Trains in place, for callers without an event loop
+  def train(self, iterations: int = 10, seed: int = 0):
+    if not self.keys:
+      return
+    self.install(*kmeans(self.begin_training(), iterations, seed))
+
+  # Top k (key, score) by dot product. mask: boolean array over positions, False excludes the vector
+  def search(self, query: np.ndarray, k: int, mask: Optional[np.ndarray] = None) -> List[Tuple[Hashable, float]]:
+    if not self.keys or k <= 0:
+      return []
+    query = normalize(np.asarray(query, dtype=np.float32))
+    if self._centroids is not None:
+      probes = np.argsort(-(self._centroids @ query))[:self.nprobe]
+      candidates = np.fromiter((pos for c in probes for pos in self._lists[c]), dtype=np.int64)
+    else:
+      candidates = np.arange(len(self.keys))
+    if mask is not None:
+      candidates = candidates[mask[candidates]]
+    if len(candidates) == 0:
+      return []
+
+    scores = self._vectors[candidates] @ query
+    top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(self.keys[candidates[i]], float(scores[i])) for i in top]
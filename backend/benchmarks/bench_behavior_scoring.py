@@ -0,0 +1,76 @@
+# Behavior aggregation of update_short_term_profile, per-place rescans vs one grouped NumPy pass,
+# and the local re-ranking of candidate places. Runs offline, run from backend/:
+# python -m benchmarks.bench_behavior_scoring
+import argparse
+import math
+import random
+import time
+from app.models.recommend import UserBehavior, ShortTermProfile, TagWeight
+from app.models.shortlist import ShortlistItem
+from app.utils.behavior_scoring import aggregate_behaviors
+from app.utils.place_ranking import rank_places
+
+EVENTS = ["click", "view", "shortlist", "unshortlist"]
+TAGS = ["museum", "park", "art_gallery", "church", "zoo", "aquarium", "night_club", "restaurant", "cafe", "shopping_mall", "castle", "beach"]
+SIGMOID_SCALE = 0.5
+
+def make_behaviors(places: int, events: int):
+  rng = random.Random(places * 31 + events)
+  return [
+    UserBehavior(place_name=f"Place {rng.randrange(places)}", event_type=rng.choice(EVENTS), duration_sec=rng.choice([None, rng.uniform(1, 120)]))
+    for _ in range(events)
+  ]
+
+# Previous implementation: one scan of every event per place, scored event by event
+def rescan(behaviors, place_names):
+  def raw(b):
+    return (
+      0.5 * (b.event_type == "click") +
+      1.0 * (b.event_type == "view") +
+      3.0 * (b.event_type == "shortlist") -
+      3.0 * (b.event_type == "unshortlist") +
+      0.1 * (b.duration_sec / 10 if b.duration_sec else 0)
+    )
+  return {
+    name: 1 / (1 + math.exp(-SIGMOID_SCALE * sum(raw(b) for b in behaviors if b.place_name == name)))
+    for name in place_names
+  }
+
+def best_of(func, repeat: int) -> float:
+  best = float("inf")
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    best = min(best, time.perf_counter() - start)
+  return best * 1000
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--events", type=int, nargs="+", default=[50, 500, 5000])
+  parser.add_argument("--places", type=int, default=40)
+  parser.add_argument("--candidates", type=int, nargs="+", default=[10, 100, 1000])
+  parser.add_argument("--repeat", type=int, default=20)
+  args = parser.parse_args()
+
+  print(f"{'events':>6} {'places':>6} {'rescan ms':>10} {'numpy ms':>9} {'speedup':>8}")
+  for events in args.events:
+    behaviors = make_behaviors(args.places, events)
+    names = {b.place_name for b in behaviors}
+    old, new = rescan(behaviors, names), aggregate_behaviors(behaviors, SIGMOID_SCALE)
+    assert all(abs(old[n] - new[n]) < 1e-9 for n in names)
+    old_ms = best_of(lambda: rescan(behaviors, names), args.repeat)
+    new_ms = best_of(lambda: aggregate_behaviors(behaviors, SIGMOID_SCALE), args.repeat)
+    print(f"{events:>6} {len(names):>6} {old_ms:>10.3f} {new_ms:>9.3f} {old_ms / new_ms:>7.1f}x")
+
+  rng = random.Random(7)
+  profile = ShortTermProfile(
+    preferences={tag: TagWeight(tag=tag, weight=rng.random()) for tag in ["Museums", "Art galleries", "Parks", "Beaches", "Cafes"]},
+    avoids=["nightlife"],
+  )
+  print(f"\n{'candidates':>10} {'rank ms':>8}")
+  for count in args.candidates:
+    places = [ShortlistItem(name=f"Place {i}", tags=rng.sample(TAGS, 3)) for i in range(count)]
+    print(f"{count:>10} {best_of(lambda: rank_places(places, profile), args.repeat):>8.3f}")
+
+if __name__ == "__main__":
+  main()
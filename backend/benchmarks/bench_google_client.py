@@ -0,0 +1,58 @@
+# Latency of resolving a batch of places with blocking requests versus the shared async GoogleMapsService.
+# Starts benchmarks.fake_google on a local port, run from backend/: python -m benchmarks.bench_google_client
+import argparse
+import asyncio
+import threading
+import time
+import requests
+import uvicorn
+from app.services.google_maps_service import GoogleMapsService
+from benchmarks.fake_google import app
+
+FIELDS = ["place_id", "name"]
+
+def start_fake_server(port: int) -> uvicorn.Server:
+  server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+  threading.Thread(target=server.run, daemon=True).start()
+  while not server.started:
+    time.sleep(0.05)
+  return server
+
+# Old pattern: one blocking call after another, a new connection each time
+def blocking_lookup(base_url: str, names: list[str]):
+  for name in names:
+    requests.get(f"{base_url}/findplacefromtext/json", params={"input": name, "inputtype": "textquery", "fields": ",".join(FIELDS)})
+
+async def pooled_lookup(client: GoogleMapsService, names: list[str]):
+  await asyncio.gather(*(client.find_place(name, FIELDS) for name in names))
+
+async def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--places", type=int, default=10)
+  parser.add_argument("--rounds", type=int, default=5)
+  parser.add_argument("--port", type=int, default=8010)
+  args = parser.parse_args()
+
+  server = start_fake_server(args.port)
+  places_url = f"http://127.0.0.1:{args.port}/maps/api/place"
+  client = GoogleMapsService(api_key="fake", places_url=places_url)
+  names = [f"Attraction {i}" for i in range(args.places)]
+
+  start = time.perf_counter()
+  for _ in range(args.rounds):
+    blocking_lookup(places_url, names)
+  blocking = (time.perf_counter() - start) / args.rounds
+
+  start = time.perf_counter()
+  for _ in range(args.rounds):
+    await pooled_lookup(client, names)
+  pooled = (time.perf_counter() - start) / args.rounds
+
+  print(f"blocking {blocking * 1000:8.1f} ms per {args.places} lookups")
+  print(f"pooled   {pooled * 1000:8.1f} ms per {args.places} lookups")
+
+  await client.close()
+  server.should_exit = True
+
+if __name__ == "__main__":
+  asyncio.run(main())
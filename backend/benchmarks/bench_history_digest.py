@@ -0,0 +1,71 @@
+# Prompt history size and build time over a long session, full history text vs rolling digest.
+# Runs without Redis, run from backend/: python -m benchmarks.bench_history_digest
+# With --llm the basic chat chain is also timed on both histories (needs GENIMI_API).
+import argparse
+import asyncio
+import time
+from app.models.session import SessionState, History, Message, DailyItinerary
+from app.models.shortlist import ShortlistItem
+from app.services.redis_service import format_history
+from app.services.session_context import SessionContext
+from app.utils.history_digest import estimate_tokens
+
+def make_turn(i: int) -> History:
+  if i % 2 == 0:
+    return History(role="user", message=Message(content=f"Turn {i}: I would like more quiet places near the old town, ideally museums or gardens, we travel with two kids."))
+  message = Message(
+    content=f"Here are some ideas for turn {i}. These places match your interest in calm, family friendly spots with some history and space to walk around.",
+    recommendations=[ShortlistItem(name=f"Recommended place {i}-{j}") for j in range(5)],
+    populars=[ShortlistItem(name=f"Popular place {i}-{j}") for j in range(3)],
+  )
+  if i % 10 == 9:
+    message.itinerary = [
+      DailyItinerary(date=d, type="visit", place_name=f"Stop {i}-{d}-{k}", start_time=f"{9 + 2 * k}:00", end_time=f"{10 + 2 * k}:30")
+      for d in range(1, 4) for k in range(4)
+    ]
+  return History(role="ai", message=message)
+
+async def time_llm(history: str) -> float:
+  from app.services.chat_service import chat_service
+  start = time.perf_counter()
+  await chat_service.basic_chain.ainvoke({"user_input": "Anything else we should see?", "history": history})
+  return (time.perf_counter() - start) * 1000
+
+async def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--turns", type=int, default=50)
+  parser.add_argument("--every", type=int, default=10)
+  parser.add_argument("--llm", action="store_true")
+  args = parser.parse_args()
+
+  ctx = SessionContext(SessionState(user_id="bench-user", session_id="bench-digest", title="Bench"), [], [])
+  full_build = digest_build = 0.0
+  full_tokens = digest_tokens = 0
+
+  print(f"{'turn':>5} {'full tok':>9} {'digest tok':>11} {'full ms':>8} {'digest ms':>10}" + (f" {'full llm':>9} {'digest llm':>11}" if args.llm else ""))
+  for i in range(args.turns):
+    ctx.append_history(make_turn(i))
+
+    start = time.perf_counter()
+    full = format_history(ctx.history)
+    full_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    digest = ctx.get_simplified_history()
+    digest_ms = (time.perf_counter() - start) * 1000
+
+    full_build += full_ms
+    digest_build += digest_ms
+    full_tokens += estimate_tokens(full)
+    digest_tokens += estimate_tokens(digest)
+
+    if (i + 1) % args.every == 0:
+      row = f"{i + 1:>5} {estimate_tokens(full):>9} {estimate_tokens(digest):>11} {full_ms:>8.3f} {digest_ms:>10.3f}"
+      if args.llm:
+        row += f" {await time_llm(full):>9.0f} {await time_llm(digest):>11.0f}"
+      print(row)
+
+  print(f"total prompt history tokens over {args.turns} turns: full {full_tokens}, digest {digest_tokens} ({digest_tokens / full_tokens:.1%})")
+  print(f"total build time: full {full_build:.2f} ms, digest {digest_build:.2f} ms")
+
+if __name__ == "__main__":
+  asyncio.run(main())
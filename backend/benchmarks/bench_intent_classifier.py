@@ -0,0 +1,121 @@
+# Accuracy, coverage and latency of the local intent classifier on inputs it was not trained on.
+# Runs without the LLM, run from backend/: python -m benchmarks.bench_intent_classifier
+# With --llm the intent chain is also timed and scored on the same inputs (needs GENIMI_API),
+# otherwise --llm-ms is used as the LLM round trip a local answer saves.
+import argparse
+import asyncio
+import time
+from collections import Counter
+from app.utils.intent_classifier import IntentClassifier, INTENTS
+
+HELD_OUT = [
+  ("next please", "ADVANCE_STEP"),
+  ("ok continue", "ADVANCE_STEP"),
+  ("looks great, move on to the next step", "ADVANCE_STEP"),
+  ("i'm happy with the shortlist, let's go on", "ADVANCE_STEP"),
+  ("done here, what's next", "ADVANCE_STEP"),
+  ("proceed", "ADVANCE_STEP"),
+  ("ADVANCE_STEP", "ADVANCE_STEP"),
+  ("show more please", "MORE_RECOMMENDATIONS"),
+  ("give me more ideas", "MORE_RECOMMENDATIONS"),
+  ("any more museums", "MORE_RECOMMENDATIONS"),
+  ("can you recommend some places for shopping", "MORE_RECOMMENDATIONS"),
+  ("i'd like to see more outdoor places", "MORE_RECOMMENDATIONS"),
+  ("suggest some castles", "MORE_RECOMMENDATIONS"),
+  ("what else would you recommend for families", "MORE_RECOMMENDATIONS"),
+  ("MORE_RECOMMENDATIONS", "MORE_RECOMMENDATIONS"),
+  ("make me an itinerary", "ITINERARY_GENERATION"),
+  ("create the itinerary please", "ITINERARY_GENERATION"),
+  ("plan a 2 day schedule with these", "ITINERARY_GENERATION"),
+  ("arrange my shortlist into a daily plan", "ITINERARY_GENERATION"),
+  ("can you build a route for the trip", "ITINERARY_GENERATION"),
+  ("ITINERARY_GENERATION", "ITINERARY_GENERATION"),
+  ("do i need a visa for japan", "GENERAL_QUERY"),
+  ("how is the weather in march", "GENERAL_QUERY"),
+  ("what currency should i bring", "GENERAL_QUERY"),
+  ("is public transport cheap there", "GENERAL_QUERY"),
+  ("when do shops close on sunday", "GENERAL_QUERY"),
+  ("what is the best way to get around", "GENERAL_QUERY"),
+  ("let's go to lisbon instead", "MODIFY_PLAN"),
+  ("we changed our dates to april", "MODIFY_PLAN"),
+  ("switch the destination to vienna", "MODIFY_PLAN"),
+  ("we will travel with grandparents now", "MODIFY_PLAN"),
+  ("change it to a ski trip", "MODIFY_PLAN"),
+  ("add hotels to the final plan", "FINALIZE_TRIP"),
+  ("finalize it with restaurants and transport", "FINALIZE_TRIP"),
+  ("include accommodation in the final itinerary", "FINALIZE_TRIP"),
+  ("complete the trip with hotels and transfers", "FINALIZE_TRIP"),
+  ("hey", "OTHER"),
+  ("thanks a lot", "OTHER"),
+  ("who made you", "OTHER"),
+  ("tell me something funny", "OTHER"),
+]
+
+# Inputs with more than one intent, the single-label model must leave them to the LLM
+MULTI_INTENT = [
+  "next, and show me more museums",
+  "no more museums please",
+  "show me more but not churches",
+  "make the itinerary and add hotels",
+  "continue, but switch the destination to rome",
+]
+
+async def llm_classify(user_input: str):
+  from app.services.chat_service import chat_service
+  start = time.perf_counter()
+  intents = await chat_service.intent_classifier_chain.ainvoke({"user_input": user_input})
+  return intents, (time.perf_counter() - start) * 1000
+
+async def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--threshold", type=float, nargs="+", default=[0.5, 0.65, 0.75, 0.85])
+  parser.add_argument("--llm", action="store_true")
+  parser.add_argument("--llm-ms", type=float, default=900.0)
+  parser.add_argument("--repeat", type=int, default=200)
+  args = parser.parse_args()
+
+  llm_ms = args.llm_ms
+  if args.llm:
+    correct, latencies = 0, []
+    for text, expected in HELD_OUT:
+      intents, ms = await llm_classify(text)
+      correct += expected in intents
+      latencies.append(ms)
+    llm_ms = sum(latencies) / len(latencies)
+    print(f"llm: accuracy {correct / len(HELD_OUT):.1%}, mean latency {llm_ms:.0f} ms")
+
+  print(f"{'threshold':>9} {'local':>7} {'accuracy':>9} {'us/input':>9} {'saved ms/turn':>14}")
+  for threshold in args.threshold:
+    classifier = IntentClassifier(threshold=threshold)
+    classifier.warm()
+    sources, correct, answered = Counter(), 0, 0
+    for text, expected in HELD_OUT:
+      intents, source = classifier.explain(text)
+      sources[source or "llm"] += 1
+      if intents:
+        answered += 1
+        correct += expected in intents
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+      for text, _ in HELD_OUT:
+        classifier.explain(text)
+    us = (time.perf_counter() - start) / (args.repeat * len(HELD_OUT)) * 1e6
+
+    coverage = answered / len(HELD_OUT)
+    accuracy = correct / answered if answered else 0.0
+    print(f"{threshold:>9.2f} {coverage:>7.1%} {accuracy:>9.1%} {us:>9.1f} {coverage * llm_ms:>14.0f}   {dict(sources)}")
+
+  classifier = IntentClassifier()
+  misses = [(text, expected, classifier.explain(text)[0]) for text, expected in HELD_OUT]
+  misses = [m for m in misses if m[2] and m[1] not in m[2]]
+  multi = [text for text in MULTI_INTENT if classifier.explain(text)[0]]
+  print(f"\nmulti-intent inputs answered locally: {len(multi)} of {len(MULTI_INTENT)} {multi if multi else ''}")
+  if misses:
+    print("\nwrong local answers at the default threshold:")
+    for text, expected, got in misses:
+      print(f"  {text!r}: expected {expected}, got {got}")
+  print(f"\n{len(HELD_OUT)} inputs over {len(INTENTS)} intents")
+
+if __name__ == "__main__":
+  asyncio.run(main())
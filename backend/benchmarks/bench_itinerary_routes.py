@@ -0,0 +1,77 @@
+# Wall time of update_itinerary_time on a synthetic multi-day itinerary, sequential legs versus concurrent legs.
+# Google Routes is replaced by a fake with fixed latency, run from backend/: python -m benchmarks.bench_itinerary_routes
+import argparse
+import asyncio
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("API_KEY", "bench")
+os.environ.setdefault("GENIMI_API", "bench")
+
+import app.services.itinerary_service as itinerary_module
+from app.models.session import DailyItinerary, RouteStep
+from app.services.itinerary_service import itinerary_service
+
+MODES = ["walking", "transit", "driving", "WALK"]
+
+def build_itinerary(days: int, visits_per_day: int) -> list[DailyItinerary]:
+  items = []
+  for day in range(1, days + 1):
+    minute = 9 * 60
+    for v in range(visits_per_day):
+      items.append(DailyItinerary(date=day, type="visit", place_name=f"Place {day}-{v}",
+        start_time=f"{minute // 60:02d}:{minute % 60:02d}", end_time=f"{(minute + 90) // 60:02d}:{(minute + 90) % 60:02d}"))
+      minute += 90
+      if v < visits_per_day - 1:
+        items.append(DailyItinerary(date=day, type="commute", commute_mode=MODES[(day + v) % len(MODES)],
+          start_time=f"{minute // 60:02d}:{minute % 60:02d}", end_time=f"{(minute + 30) // 60:02d}:{(minute + 30) % 60:02d}"))
+        minute += 30
+  return items
+
+def fake_routes(latency_ms: float):
+  async def get_route_info(origin, destination, mode, arrival_time=None):
+    await asyncio.sleep(latency_ms / 1000)
+    seconds = 300 + int(hashlib.sha1(f"{origin}:{destination}:{mode}".encode()).hexdigest()[:4], 16) % 1800
+    steps = []
+    if mode == "TRANSIT":
+      arrival = datetime.fromisoformat(arrival_time.replace("Z", "+00:00"))
+      steps = [
+        RouteStep(step_mode="WALK", step_duration="5 Minutes"),
+        RouteStep(step_mode="TRANSIT", step_duration="20 Minutes",
+          departure_time=(arrival - timedelta(seconds=seconds)).isoformat().replace("+00:00", "Z"),
+          arrival_time=arrival_time),
+      ]
+    return f"{seconds}s", mode, steps
+  return get_route_info
+
+async def timed_update(itinerary: list[DailyItinerary], concurrency: int):
+  itinerary_module.ROUTE_LOOKUP_CONCURRENCY = concurrency
+  copy = [item.model_copy(deep=True) for item in itinerary]
+  start = time.perf_counter()
+  result = await itinerary_service.update_itinerary_time(copy)
+  return time.perf_counter() - start, [item.model_dump() for item in result]
+
+async def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--days", type=int, default=3)
+  parser.add_argument("--visits", type=int, default=6)
+  parser.add_argument("--latency-ms", type=float, default=150)
+  parser.add_argument("--concurrency", type=int, default=8)
+  args = parser.parse_args()
+
+  itinerary_module.get_route_info = fake_routes(args.latency_ms)
+  itinerary = build_itinerary(args.days, args.visits)
+  legs = sum(1 for item in itinerary if item.type == "commute")
+
+  sequential, expected = await timed_update(itinerary, 1)
+  concurrent, actual = await timed_update(itinerary, args.concurrency)
+
+  print(f"{args.days} days, {legs} commute legs, {args.latency_ms:.0f} ms per Routes call")
+  print(f"sequential      {sequential * 1000:8.1f} ms")
+  print(f"concurrent ({args.concurrency:>2}) {concurrent * 1000:8.1f} ms")
+  print(f"identical output: {expected == actual}")
+
+if __name__ == "__main__":
+  asyncio.run(main())
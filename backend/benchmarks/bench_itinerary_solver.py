@@ -0,0 +1,65 @@
+# Solve time and travel time of the local itinerary solver for 5 to 40 places, against the
+# shortlist order split evenly over the days (what an ordering that ignores geography costs)
+# and against the construction alone. Runs offline, run from backend/:
+# python -m benchmarks.bench_itinerary_solver
+import argparse
+import math
+import random
+import time
+import numpy as np
+from app.utils.itinerary_solver import ItinerarySolver, SolverPlace, travel_minutes
+
+DAY_START, DAY_END = 9 * 60, 20 * 60
+
+def make_instance(count: int, seed: int):
+  rng = random.Random(seed)
+  lats = [48.86 + rng.uniform(-0.04, 0.04) for _ in range(count)]
+  lngs = [2.35 + rng.uniform(-0.06, 0.06) for _ in range(count)]
+  places = []
+  for i in range(count):
+    windows = None
+    # Most places have opening hours and one closing day
+    if rng.random() < 0.6:
+      opens, closes = rng.choice([9, 10, 11]) * 60, rng.choice([17, 18, 19, 22]) * 60
+      windows = [[(opens, closes)] for _ in range(7)]
+      windows[rng.randrange(7)] = []
+    places.append(SolverPlace(i, rng.choice([45, 60, 90, 120]), windows))
+  days = max(1, math.ceil(sum(p.duration + 20 for p in places) / (DAY_END - DAY_START)))
+  return places, travel_minutes(lats, lngs), days
+
+# Travel minutes of the places in shortlist order, split evenly over the days
+def naive_travel(travel: np.ndarray, count: int, days: int) -> float:
+  per_day = math.ceil(count / days)
+  routes = [list(range(d * per_day, min(count, (d + 1) * per_day))) for d in range(days)]
+  return sum(travel[a][b] for route in routes for a, b in zip(route, route[1:]))
+
+def plan_travel(plan) -> float:
+  return sum(v.travel for day in plan.days for v in day)
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--places", type=int, nargs="+", default=[5, 10, 20, 30, 40])
+  parser.add_argument("--seeds", type=int, default=10)
+  args = parser.parse_args()
+
+  print(f"{'places':>6} {'days':>5} {'p50 ms':>7} {'max ms':>7} {'naive min':>10} {'greedy min':>11} {'solved min':>11} {'unscheduled':>12}")
+  for count in args.places:
+    times, naive, greedy, solved, unscheduled, days_used = [], [], [], [], [], []
+    for seed in range(args.seeds):
+      places, travel, days = make_instance(count, seed)
+      construction = ItinerarySolver(places, travel, days, first_weekday=seed % 7, day_start=DAY_START, day_end=DAY_END, max_rounds=0).solve()
+      start = time.perf_counter()
+      plan = ItinerarySolver(places, travel, days, first_weekday=seed % 7, day_start=DAY_START, day_end=DAY_END).solve()
+      times.append((time.perf_counter() - start) * 1000)
+      naive.append(naive_travel(travel, count, days))
+      greedy.append(plan_travel(construction))
+      solved.append(plan_travel(plan))
+      unscheduled.append(len(plan.unscheduled))
+      days_used.append(days)
+    print(
+      f"{count:>6} {np.mean(days_used):>5.1f} {np.percentile(times, 50):>7.2f} {max(times):>7.2f}"
+      f" {np.mean(naive):>10.1f} {np.mean(greedy):>11.1f} {np.mean(solved):>11.1f} {np.mean(unscheduled):>12.1f}"
+    )
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,105 @@
+# Latency of nearby-place queries at 100k places: geohash grid vs a full NumPy scan,
+# and with --mongo the 2dsphere $geoNear query on a scratch collection at MONGODB_URI.
+# Run from backend/: python -m benchmarks.bench_nearby
+import argparse
+import asyncio
+import os
+import time
+import numpy as np
+from app.utils.geo import GeoGrid, geohash_int, haversine_km
+
+# Places are spread around these cities, (lat, lng)
+CITIES = [(48.86, 2.35), (52.37, 4.90), (41.90, 12.50), (35.68, 139.69), (40.71, -74.01), (51.51, -0.13), (41.39, 2.17), (52.52, 13.40)]
+
+def make_places(count: int, seed: int = 0):
+  rng = np.random.default_rng(seed)
+  centers = np.array(CITIES)[rng.integers(len(CITIES), size=count)]
+  # Denser in the middle of each city
+  lats = centers[:, 0] + rng.normal(0, 0.05, count)
+  lngs = centers[:, 1] + rng.normal(0, 0.07, count)
+  return [f"bench-place-{i}" for i in range(count)], lats, lngs
+
+def percentiles(latencies):
+  return np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+def time_queries(func, queries):
+  latencies, results = [], []
+  for lat, lng in queries:
+    start = time.perf_counter()
+    results.append(func(lat, lng))
+    latencies.append((time.perf_counter() - start) * 1000)
+  return latencies, results
+
+# Latencies by radius of $geoNear on a scratch collection holding the same places
+async def time_mongo(ids, lats, lngs, queries, radii, limit: int):
+  from pymongo import AsyncMongoClient, IndexModel
+  client = AsyncMongoClient(os.getenv("MONGODB_URI"))
+  collection = client[os.getenv("MONGODB_BENCH_DB", "bench")]["bench_nearby"]
+  await collection.drop()
+  docs = [{"place_id": i, "location": {"type": "Point", "coordinates": [float(lng), float(lat)]}} for i, lat, lng in zip(ids, lats, lngs)]
+  for start in range(0, len(docs), 10000):
+    await collection.insert_many(docs[start:start + 10000])
+  await collection.create_indexes([IndexModel([("location", "2dsphere")])])
+
+  by_radius = {}
+  for radius_km in radii:
+    latencies = []
+    for lat, lng in queries:
+      start = time.perf_counter()
+      pipeline = [
+        {"$geoNear": {"near": {"type": "Point", "coordinates": [lng, lat]}, "distanceField": "distance", "maxDistance": radius_km * 1000, "spherical": True}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "place_id": 1, "distance": 1}},
+      ]
+      _ = [doc async for doc in await collection.aggregate(pipeline)]
+      latencies.append((time.perf_counter() - start) * 1000)
+    by_radius[radius_km] = latencies
+  await collection.drop()
+  await client.close()
+  return by_radius
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--places", type=int, default=100000)
+  parser.add_argument("--queries", type=int, default=500)
+  parser.add_argument("--radius", type=float, nargs="+", default=[0.5, 2.0, 10.0])
+  parser.add_argument("--limit", type=int, default=20)
+  parser.add_argument("--mongo", action="store_true")
+  args = parser.parse_args()
+
+  ids, lats, lngs = make_places(args.places)
+  grid = GeoGrid()
+  start = time.perf_counter()
+  codes = geohash_int(lats, lngs, grid.area_precision)
+  areas = np.unique(codes)
+  for area in areas.tolist():
+    rows = np.flatnonzero(codes == area)
+    grid.load_area(area, [ids[i] for i in rows], lats[rows], lngs[rows])
+  print(f"{args.places} places in {len(areas)} areas, grid built in {time.perf_counter() - start:.2f} s\n")
+
+  rng = np.random.default_rng(1)
+  picks = rng.integers(args.places, size=args.queries)
+  queries = list(zip(lats[picks].tolist(), lngs[picks].tolist()))
+
+  def scan(lat, lng, radius_km):
+    km = haversine_km(lat, lng, lats, lngs)
+    close = np.flatnonzero(km <= radius_km)
+    order = close[np.argsort(km[close], kind="stable")][:args.limit]
+    return [ids[i] for i in order]
+
+  mongo_ms = asyncio.run(time_mongo(ids, lats, lngs, queries, args.radius, args.limit)) if args.mongo else {}
+  print(f"{'radius km':>9} {'grid p50':>9} {'grid p95':>9} {'scan p50':>9} {'scan p95':>9} {'mongo p50':>10} {'mongo p95':>10} {'found':>6} {'same':>5}")
+  for radius in args.radius:
+    grid_ms, grid_found = time_queries(lambda lat, lng: [k for k, _ in grid.query(lat, lng, radius, args.limit)], queries)
+    scan_ms, scan_found = time_queries(lambda lat, lng: scan(lat, lng, radius), queries)
+    same = np.mean([set(a) == set(b) for a, b in zip(grid_found, scan_found)])
+    found = np.mean([len(f) for f in grid_found])
+    row = f"{radius:>9.1f} {percentiles(grid_ms)[0]:>9.3f} {percentiles(grid_ms)[1]:>9.3f} {percentiles(scan_ms)[0]:>9.3f} {percentiles(scan_ms)[1]:>9.3f}"
+    if args.mongo:
+      row += f" {percentiles(mongo_ms[radius])[0]:>10.3f} {percentiles(mongo_ms[radius])[1]:>10.3f}"
+    else:
+      row += f" {'-':>10} {'-':>10}"
+    print(f"{row} {found:>6.1f} {same:>5.0%}")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,69 @@
+# Build time, search latency and recall of the local place index, flat vs IVF, on synthetic places.
+# Runs offline, run from backend/: python -m benchmarks.bench_place_index
+import argparse
+import random
+import time
+import numpy as np
+from app.models.recommend import ShortTermProfile, TagWeight
+from app.models.shortlist import ShortlistItem, PlaceGeo, PlaceDetail
+from app.services.place_index_service import PlaceIndexService
+
+TAGS = ["museum", "park", "art_gallery", "church", "zoo", "aquarium", "night_club", "restaurant", "cafe", "shopping_mall", "castle", "beach", "library", "stadium", "market"]
+WORDS = ["historic", "modern", "quiet", "family", "view", "garden", "collection", "local", "food", "river", "old", "town", "famous", "hidden", "sunset", "walk", "music", "design", "science", "kids"]
+# Cities the places are spread around, (lat, lng)
+CITIES = [(48.86, 2.35), (52.37, 4.90), (41.90, 12.50), (35.68, 139.69), (40.71, -74.01), (51.51, -0.13), (41.39, 2.17), (52.52, 13.40)]
+
+def make_place(i: int, rng: random.Random) -> ShortlistItem:
+  lat, lng = rng.choice(CITIES)
+  tags = rng.sample(TAGS, 2)
+  return ShortlistItem(
+    name=f"Place {i}",
+    place_id=f"bench-place-{i}",
+    type="attraction",
+    description=" ".join(rng.choices(WORDS, k=12)) + " " + " ".join(t.replace("_", " ") for t in tags),
+    tags=tags,
+    geometry=PlaceGeo(location=[lat + rng.uniform(-0.1, 0.1), lng + rng.uniform(-0.1, 0.1)], viewport=[[0, 0], [0, 0]]),
+    info=PlaceDetail(rating=round(rng.uniform(3, 5), 1), total_ratings=rng.randrange(10, 50000), pros=rng.choices(WORDS, k=3)),
+  )
+
+def make_profile(rng: random.Random) -> ShortTermProfile:
+  tags = rng.sample(TAGS, 3)
+  return ShortTermProfile(preferences={t: TagWeight(tag=t, weight=rng.uniform(0.5, 1.0)) for t in tags}, avoids=[rng.choice(TAGS)])
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--places", type=int, nargs="+", default=[1000, 10000, 50000])
+  parser.add_argument("--queries", type=int, default=100)
+  parser.add_argument("--nprobe", type=int, default=8)
+  args = parser.parse_args()
+
+  print(f"{'places':>7} {'mode':>5} {'build s':>8} {'p50 ms':>7} {'p95 ms':>7} {'recall@6':>9}")
+  for count in args.places:
+    rng = random.Random(count)
+    places = [make_place(i, rng) for i in range(count)]
+    queries = [(make_profile(rng), [rng.choice(places).place_id]) for _ in range(args.queries)]
+
+    baseline = None
+    for mode in ("flat", "ivf"):
+      service = PlaceIndexService(mode)
+      service.index.nprobe = args.nprobe
+      start = time.perf_counter()
+      for place in places:
+        service.add(place)
+      # The service trains in a thread when a loop runs, here it is done once after the build
+      if service.index.needs_training():
+        service.index.train()
+      build = time.perf_counter() - start
+
+      latencies, results = [], []
+      for profile, anchors in queries:
+        start = time.perf_counter()
+        results.append({place_id for place_id, _ in service.search(profile, "", anchors, k=6)})
+        latencies.append((time.perf_counter() - start) * 1000)
+      if baseline is None:
+        baseline = results
+      recall = np.mean([len(r & b) / len(b) for r, b in zip(results, baseline) if b])
+      print(f"{count:>7} {mode:>5} {build:>8.2f} {np.percentile(latencies, 50):>7.2f} {np.percentile(latencies, 95):>7.2f} {recall:>9.1%}")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,90 @@
+# Session size with places embedded in history and shortlist vs stored as place references.
+# Sizes are computed offline, run from backend/: python -m benchmarks.bench_place_refs
+# With --redis both forms are also written to Redis at REDIS_URL to read MEMORY USAGE,
+# and the bulk hydration of the reference form is timed.
+import argparse
+import asyncio
+import time
+import bson
+from app.models.session import SessionState, History
+from app.models.shortlist import ShortlistItem
+from app.utils.serialization import ModelCodec, history_codec, shortlist_codec, place_codec
+from benchmarks.bench_serialization import make_turn, make_place
+
+USER_ID = "bench-user"
+
+full_history_codec = ModelCodec(History)
+full_shortlist_codec = ModelCodec(ShortlistItem)
+
+def encode(history, shortlist, compact: bool):
+  h_codec, s_codec = (history_codec, shortlist_codec) if compact else (full_history_codec, full_shortlist_codec)
+  return [h_codec.dumps(h) for h in history], {s.name: s_codec.dumps(s) for s in shortlist}
+
+def mongo_size(state: SessionState, history_values, shortlist_values) -> int:
+  doc = state.model_dump(exclude={"history", "shortlist"})
+  doc["history"] = history_codec.raw_documents(history_values)
+  doc["shortlist"] = shortlist_codec.raw_documents(shortlist_values.values())
+  return len(bson.encode(doc))
+
+async def redis_usage(state: SessionState, history_values, shortlist_values, suffix: str) -> int:
+  from app.services.redis_service import redis_service
+  client = redis_service.get_redis_client()
+  history_key, shortlist_key = f"{state.history_key}:{suffix}", f"{state.shortlist_key}:{suffix}"
+  async with client.pipeline(transaction=False) as pipe:
+    pipe.delete(history_key, shortlist_key)
+    pipe.rpush(history_key, *history_values)
+    pipe.hset(shortlist_key, mapping=shortlist_values)
+    pipe.memory_usage(history_key, samples=0)
+    pipe.memory_usage(shortlist_key, samples=0)
+    pipe.delete(history_key, shortlist_key)
+    results = await pipe.execute()
+  return (results[3] or 0) + (results[4] or 0)
+
+async def time_hydration(history, shortlist, repeat: int) -> float:
+  from app.services.place_store_service import place_store_service
+  places = {p.place_id: p for h in history for p in (h.message.recommendations or []) + (h.message.populars or [])}
+  places.update({s.place_id: s for s in shortlist})
+  for place in places.values():
+    await place_store_service.save(place)
+  refs = [History.model_validate_json(v) for v in encode(history, shortlist, True)[0]]
+  shortlist_refs = [s.to_ref() for s in shortlist]
+  best = float("inf")
+  for _ in range(repeat):
+    start = time.perf_counter()
+    await place_store_service.hydrate_session(refs, shortlist_refs)
+    best = min(best, time.perf_counter() - start)
+  return best * 1000
+
+async def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 200])
+  parser.add_argument("--shortlist", type=int, default=20)
+  parser.add_argument("--redis", action="store_true")
+  parser.add_argument("--repeat", type=int, default=10)
+  args = parser.parse_args()
+
+  header = f"{'turns':>5} {'redis full':>11} {'redis refs':>11} {'mongo full':>11} {'mongo refs':>11} {'store':>9}"
+  if args.redis:
+    header += f" {'mem full':>10} {'mem refs':>10} {'hydrate ms':>11}"
+  print(header)
+  for turns in args.turns:
+    state = SessionState(user_id=USER_ID, session_id=f"bench-refs-{turns}", title="Bench")
+    history = [make_turn(i) for i in range(turns)]
+    shortlist = [make_place(i) for i in range(args.shortlist)]
+
+    full = encode(history, shortlist, False)
+    refs = encode(history, shortlist, True)
+    redis_bytes = lambda values: sum(len(v) for v in values[0]) + sum(len(v) for v in values[1].values())
+    # Each distinct place is stored once in the place store, shared by every session that mentions it
+    distinct = {p.place_id: p for h in history for p in (h.message.recommendations or []) + (h.message.populars or [])}
+    distinct.update({s.place_id: s for s in shortlist})
+    store_bytes = sum(len(place_codec.dumps(p)) for p in distinct.values())
+
+    row = f"{turns:>5} {redis_bytes(full):>11} {redis_bytes(refs):>11} {mongo_size(state, *full):>11} {mongo_size(state, *refs):>11} {store_bytes:>9}"
+    if args.redis:
+      row += f" {await redis_usage(state, *full, 'full'):>10} {await redis_usage(state, *refs, 'refs'):>10}"
+      row += f" {await time_hydration(history, shortlist, args.repeat):>11.2f}"
+    print(row)
+
+if __name__ == "__main__":
+  asyncio.run(main())
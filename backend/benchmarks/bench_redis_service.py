@@ -0,0 +1,82 @@
+# Requests/sec of a read-heavy chat turn against the legacy blocking client and the pooled asyncio RedisService.
+# Needs a running Redis at REDIS_URL, run from backend/: python -m benchmarks.bench_redis_service
+import argparse
+import asyncio
+import time
+import redis
+from app.models.session import SessionState, History, Message
+from app.models.shortlist import ShortlistItem
+from app.services.redis_service import redis_service, REDIS_URL
+
+USER_ID = "bench-user"
+
+def build_sessions(count: int, history_len: int, shortlist_len: int) -> list[SessionState]:
+  sessions = []
+  for i in range(count):
+    state = SessionState(user_id=USER_ID, session_id=f"bench-{i}", title=f"Bench trip {i}")
+    state.history = [
+      History(role="user" if j % 2 == 0 else "ai", message=Message(content=f"turn {j} " * 20))
+      for j in range(history_len)
+    ]
+    state.shortlist = [ShortlistItem(name=f"Place {i}-{j}", description="A place " * 10) for j in range(shortlist_len)]
+    sessions.append(state)
+  return sessions
+
+# Same calls the old RedisService made, the blocking client runs inside the event loop
+class LegacyRedis:
+  def __init__(self):
+    self.client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+  async def turn(self, state: SessionState):
+    SessionState.model_validate_json(self.client.get(state.get_redis_key()))
+    SessionState.model_validate_json(self.client.get(state.get_redis_key()))
+    history = self.client.lrange(state.history_key, 0, -1)
+    [History.model_validate_json(h) for h in history]
+    SessionState.model_validate_json(self.client.get(state.get_redis_key()))
+    items = self.client.hgetall(state.shortlist_key)
+    [ShortlistItem.model_validate_json(i) for i in items.values()]
+
+async def pooled_turn(state: SessionState):
+  await redis_service.load_session_state(state.user_id, state.session_id)
+  await redis_service.get_history(state.user_id, state.session_id)
+  await redis_service.get_shortlist(state.user_id, state.session_id)
+
+async def run(name: str, turn, sessions: list[SessionState], requests: int, concurrency: int, io_ms: float):
+  semaphore = asyncio.Semaphore(concurrency)
+
+  # Every request also waits on simulated LLM / network I/O, which a blocked loop cannot overlap
+  async def one(i: int):
+    async with semaphore:
+      await turn(sessions[i % len(sessions)])
+      await asyncio.sleep(io_ms / 1000)
+
+  start = time.perf_counter()
+  await asyncio.gather(*(one(i) for i in range(requests)))
+  elapsed = time.perf_counter() - start
+  print(f"{name:<8} {requests / elapsed:10.1f} req/s  ({elapsed:.2f}s for {requests} requests)")
+
+async def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--requests", type=int, default=2000)
+  parser.add_argument("--concurrency", type=int, default=100)
+  parser.add_argument("--sessions", type=int, default=50)
+  parser.add_argument("--history", type=int, default=30)
+  parser.add_argument("--shortlist", type=int, default=10)
+  parser.add_argument("--io-ms", type=float, default=5.0)
+  args = parser.parse_args()
+
+  await redis_service.connect()
+  sessions = build_sessions(args.sessions, args.history, args.shortlist)
+  for state in sessions:
+    await redis_service.save_from_db(state)
+
+  legacy = LegacyRedis()
+  await run("legacy", legacy.turn, sessions, args.requests, args.concurrency, args.io_ms)
+  await run("pooled", pooled_turn, sessions, args.requests, args.concurrency, args.io_ms)
+
+  for state in sessions:
+    await redis_service.get_redis_client().delete(state.get_redis_key(), state.history_key, state.shortlist_key)
+  await redis_service.close()
+
+if __name__ == "__main__":
+  asyncio.run(main())
@@ -0,0 +1,95 @@
+# Encode/decode cost of history and shortlist values per serializer, for realistic session sizes.
+# Runs without Redis, run from backend/: python -m benchmarks.bench_serialization
+import argparse
+import time
+from typing import Callable, List
+from app.models.session import History, Message, DailyItinerary
+from app.models.shortlist import ShortlistItem, PlaceDetail, PlaceGeo, PlaceReview
+from app.utils.serialization import ModelCodec, orjson, msgspec, ormsgpack
+
+def make_place(i: int) -> ShortlistItem:
+  return ShortlistItem(
+    name=f"Place {i}",
+    type="attraction",
+    place_id=f"ChIJ{i:020d}",
+    description="A well known place with a long history, gardens and a small museum.",
+    tags=["museum", "history", "garden"],
+    info=PlaceDetail(
+      recommend_reason="Matches your interest in quiet historic places.",
+      address=f"{i} Main Street",
+      weekday_text=[f"Day {d}: 9:00 AM - 5:00 PM" for d in range(7)],
+      rating=4.6,
+      reviews=[PlaceReview(review="Lovely and calm, worth half a day.", type=k % 4) for k in range(4)],
+      pros=["quiet", "cheap"],
+      cons=["far from the center"],
+      total_ratings=1200,
+    ),
+    geometry=PlaceGeo(location=[48.85, 2.35], viewport=[[48.86, 2.36], [48.84, 2.34]]),
+    status="ready",
+  )
+
+def make_turn(i: int) -> History:
+  if i % 2 == 0:
+    return History(role="user", message=Message(content=f"Turn {i}: more quiet places near the old town please."))
+  message = Message(
+    content=f"Here are some ideas for turn {i}, calm and family friendly spots with some history.",
+    recommendations=[make_place(i * 10 + j) for j in range(5)],
+    populars=[make_place(i * 10 + j) for j in range(5, 8)],
+  )
+  if i % 10 == 9:
+    message.itinerary = [
+      DailyItinerary(date=d, type="visit", place_name=f"Stop {d}-{k}", start_time=f"{9 + 2 * k}:00", end_time=f"{10 + 2 * k}:30")
+      for d in range(1, 4) for k in range(4)
+    ]
+  return History(role="ai", message=message)
+
+def timed(func: Callable, repeat: int) -> float:
+  best = float("inf")
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    best = min(best, time.perf_counter() - start)
+  return best * 1000
+
+def run(turns: int, shortlist_size: int, repeat: int):
+  history = [make_turn(i) for i in range(turns)]
+  shortlist = [make_place(i) for i in range(shortlist_size)]
+  backends = ["pydantic"] + (["orjson"] if orjson else []) + (["msgspec"] if msgspec else [])
+
+  print(f"\n{turns} turns, {shortlist_size} shortlist items (best of {repeat}, ms)")
+  print(f"{'':28} {'history':>9} {'shortlist':>10} {'bytes':>9}")
+  encoded: List[str] = []
+  for backend in backends:
+    history_codec, shortlist_codec = ModelCodec(History, backend), ModelCodec(ShortlistItem, backend)
+    h_ms = timed(lambda: [history_codec.dumps(h) for h in history], repeat)
+    s_ms = timed(lambda: [shortlist_codec.dumps(s) for s in shortlist], repeat)
+    encoded = [history_codec.dumps(h) for h in history]
+    print(f"{'encode ' + backend:28} {h_ms:>9.2f} {s_ms:>10.2f} {sum(len(e) for e in encoded):>9}")
+  if ormsgpack:
+    codec = ModelCodec(History)
+    h_ms = timed(lambda: [codec.pack(h) for h in history], repeat)
+    print(f"{'encode msgpack':28} {h_ms:>9.2f} {'':>10} {sum(len(codec.pack(h)) for h in history):>9}")
+
+  history_codec, shortlist_codec = ModelCodec(History), ModelCodec(ShortlistItem)
+  shortlist_raw = [shortlist_codec.dumps(s) for s in shortlist]
+  print(f"{'decode validated':28} {timed(lambda: history_codec.loads_many(encoded), repeat):>9.2f} {timed(lambda: shortlist_codec.loads_many(shortlist_raw), repeat):>10.2f}")
+  if ormsgpack:
+    packed = [history_codec.pack(h) for h in history]
+    print(f"{'decode msgpack':28} {timed(lambda: [history_codec.unpack(p) for p in packed], repeat):>9.2f}")
+
+  # What the write-behind flush does with the values it reads back from Redis
+  validated = lambda raws, codec: [codec.to_document(m) for m in codec.loads_many(raws)]
+  print(f"{'to mongo, validate + dump':28} {timed(lambda: validated(encoded, history_codec), repeat):>9.2f} {timed(lambda: validated(shortlist_raw, shortlist_codec), repeat):>10.2f}")
+  print(f"{'to mongo, trusted raw':28} {timed(lambda: history_codec.raw_documents(encoded), repeat):>9.2f} {timed(lambda: shortlist_codec.raw_documents(shortlist_raw), repeat):>10.2f}")
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 200])
+  parser.add_argument("--shortlist", type=int, default=20)
+  parser.add_argument("--repeat", type=int, default=20)
+  args = parser.parse_args()
+  for turns in args.turns:
+    run(turns, args.shortlist, args.repeat)
+
+if __name__ == "__main__":
+  main()
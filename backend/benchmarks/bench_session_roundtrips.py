@@ -0,0 +1,70 @@
+# Redis round trips and latency of the session I/O of one chat turn, per-call RedisService methods vs SessionContext.
+# Needs a running Redis at REDIS_URL and MongoDB for the write-behind flushes, run from backend/: python -m benchmarks.bench_session_roundtrips
+import argparse
+import asyncio
+import time
+from app.models.session import SessionState, History, Message
+from app.models.shortlist import ShortlistItem
+from app.services.redis_service import redis_service
+from app.services.session_context import SessionContext
+from app.utils.metrics import request_scope
+from benchmarks.bench_redis_service import build_sessions
+
+# Session calls a recommend turn made before SessionContext: load, user prompt, shortlist
+# behaviors, history for the prompt, answer, then the session saved twice
+async def per_call_turn(state: SessionState, shortlist_adds: int):
+  session_state = await redis_service.load_session_state(state.user_id, state.session_id)
+  await redis_service.append_history(session_state, History(role="user", message=Message(content="more museums")))
+  for i in range(shortlist_adds):
+    await redis_service.add_to_shortlist(session_state, ShortlistItem(name=f"Added {i}"))
+  await redis_service.get_simplified_history(session_state)
+  await redis_service.get_simplified_history(session_state)
+  session_state.todo_step = 1
+  await redis_service.append_history(session_state, History(role="ai", message=Message(content="Here you go")))
+  await redis_service.save_session_state(session_state)
+  await redis_service.save_session_state(session_state)
+
+async def context_turn(state: SessionState, shortlist_adds: int):
+  ctx = await SessionContext.load(state.user_id, state.session_id)
+  ctx.append_history(History(role="user", message=Message(content="more museums")))
+  for i in range(shortlist_adds):
+    ctx.add_to_shortlist(ShortlistItem(name=f"Added {i}"))
+  ctx.get_simplified_history()
+  ctx.get_simplified_history()
+  ctx.state.todo_step = 1
+  ctx.append_history(History(role="ai", message=Message(content="Here you go")))
+  await ctx.commit()
+
+async def run(name: str, turn, sessions: list[SessionState], turns: int, shortlist_adds: int):
+  roundtrips = 0
+  start = time.perf_counter()
+  for i in range(turns):
+    with request_scope() as counts:
+      await turn(sessions[i % len(sessions)], shortlist_adds)
+    roundtrips += counts.get("redis.roundtrips", 0)
+  elapsed = time.perf_counter() - start
+  print(f"{name:<9} {roundtrips / turns:6.1f} round trips/turn  {elapsed / turns * 1000:8.2f} ms/turn")
+
+async def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--turns", type=int, default=500)
+  parser.add_argument("--sessions", type=int, default=20)
+  parser.add_argument("--history", type=int, default=30)
+  parser.add_argument("--shortlist", type=int, default=10)
+  parser.add_argument("--shortlist-adds", type=int, default=2)
+  args = parser.parse_args()
+
+  await redis_service.connect()
+  sessions = build_sessions(args.sessions, args.history, args.shortlist)
+  for state in sessions:
+    await redis_service.save_from_db(state)
+
+  await run("per-call", per_call_turn, sessions, args.turns, args.shortlist_adds)
+  await run("context", context_turn, sessions, args.turns, args.shortlist_adds)
+
+  for state in sessions:
+    await redis_service.get_redis_client().delete(state.get_redis_key(), state.history_key, state.shortlist_key)
+  await redis_service.close()
+
+if __name__ == "__main__":
+  asyncio.run(main())
@@ -0,0 +1,82 @@
+# Local stand-in for the Google Places and Routes endpoints used by GoogleMapsService.
+# Run with: uvicorn benchmarks.fake_google:app --port 8010
+# then set GOOGLE_PLACES_URL=http://127.0.0.1:8010/maps/api/place and GOOGLE_ROUTES_URL=http://127.0.0.1:8010
+# It can also be mounted in-process with GoogleMapsService(transport=httpx.ASGITransport(app=app)).
+import asyncio
+import hashlib
+import os
+import random
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+LATENCY_MS = float(os.getenv("FAKE_GOOGLE_LATENCY_MS", "100"))
+FAIL_RATE = float(os.getenv("FAKE_GOOGLE_FAIL_RATE", "0"))
+
+app = FastAPI(title="Fake Google Maps")
+
+def _seed(text: str) -> int:
+  return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+
+def _location(place_id: str):
+  seed = _seed(place_id)
+  return 48.80 + (seed % 1000) / 5000, 2.25 + (seed // 1000 % 1000) / 5000
+
+async def _simulate():
+  await asyncio.sleep(LATENCY_MS / 1000)
+  if FAIL_RATE and random.random() < FAIL_RATE:
+    return JSONResponse({"error": "unavailable"}, status_code=503)
+  return None
+
+@app.get("/maps/api/place/findplacefromtext/json")
+async def find_place(input: str):
+  failure = await _simulate()
+  if failure:
+    return failure
+  place_id = f"fake-{_seed(input.lower()):08x}"
+  return {"candidates": [{"place_id": place_id, "name": input.strip().title()}], "status": "OK"}
+
+@app.get("/maps/api/place/details/json")
+async def place_details(place_id: str):
+  failure = await _simulate()
+  if failure:
+    return failure
+  lat, lng = _location(place_id)
+  return {
+    "result": {
+      "name": f"Place {place_id[-4:]}",
+      "place_id": place_id,
+      "types": ["tourist_attraction", "point_of_interest"],
+      "geometry": {
+        "location": {"lat": lat, "lng": lng},
+        "viewport": {
+          "northeast": {"lat": lat + 0.001, "lng": lng + 0.001},
+          "southwest": {"lat": lat - 0.001, "lng": lng - 0.001},
+        },
+      },
+      "rating": 4.5,
+      "user_ratings_total": 1000,
+      "website": "https://example.com",
+      "formatted_address": "1 Example Street",
+      "opening_hours": {"weekday_text": [f"{d}: 9:00 AM – 6:00 PM" for d in ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]]},
+      "reviews": [{"text": "Lovely place."}],
+      "photos": [{"photo_reference": f"photo-{place_id}"}],
+      "price_level": 2,
+    },
+    "status": "OK",
+  }
+
+@app.post("/directions/v2:computeRoutes")
+async def compute_routes(request: Request):
+  failure = await _simulate()
+  if failure:
+    return failure
+  body = await request.json()
+  origin = body.get("origin", {}).get("placeId", "")
+  destination = body.get("destination", {}).get("placeId", "")
+  mode = body.get("travelMode", "WALK")
+  seconds = 300 + _seed(f"{origin}:{destination}:{mode}") % 2400
+  step = {"staticDuration": f"{seconds}s", "travelMode": mode}
+  leg = {"steps": [step]}
+  if mode == "TRANSIT":
+    leg["stepsOverview"] = {"multiModalSegments": [{"travelMode": "WALK", "stepStartIndex": 0, "stepEndIndex": 0}]}
+  return {"routes": [{"duration": f"{seconds}s", "legs": [leg]}]}
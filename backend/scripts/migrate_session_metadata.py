@@ -0,0 +1,14 @@
+# Convert session metadata stored as JSON strings into Redis hashes.
+# Sessions are also converted lazily when they are read, this script clears the rest in one go.
+# Run from backend/: python -m scripts.migrate_session_metadata
+import asyncio
+from app.services.redis_service import redis_service
+
+async def main():
+  await redis_service.connect()
+  migrated = await redis_service.migrate_session_blobs()
+  print(f"Migrated {migrated} session metadata keys to hashes.")
+  await redis_service.close()
+
+if __name__ == "__main__":
+  asyncio.run(main())
@@ -15,6 +15,8 @@ export const useUserSessionsStore = defineStore('userSessions', {
   state: () => ({
     sessions: [] as SessionInfo[],
     currentSessionId: null as string | null,
+    nextCursor: null as string | null,
+    loadingMore: false,
   }),
   actions: {
     async initialize() {
@@ -34,12 +36,14 @@ export const useUserSessionsStore = defineStore('userSessions', {
         if (parsed?.currentSessionId) {
           this.currentSessionId = parsed.currentSessionId;
         }
+        this.nextCursor = parsed?.nextCursor ?? null;
       } catch (error) {
         console.error('Failed to parse sessions data:', error);
         this.clearStorage();
       }
     },
 
+    // First page only, older sessions are loaded with loadMoreSessions when the list is scrolled
     async getSessions() {
       if (this.sessions.length > 0) {
         return;
@@ -47,9 +51,9 @@ export const useUserSessionsStore = defineStore('userSessions', {
       const auth = useAuthStore();
       if (auth.isAuthenticated) {
         try {
-          const userId = auth.token;
-          const res = await axios.post("/chat/allSessions", { user_id: userId });
-          this.sessions = [...res.data];
+          const res = await axios.post("/chat/allSessions", { user_id: auth.token });
+          this.sessions = res.data;
+          this.nextCursor = res.headers["x-next-cursor"] ?? null;
           this.saveToStorage();
         } catch (error) {
           console.error("Failed to fetch sessions:", error);
@@ -57,6 +61,26 @@ export const useUserSessionsStore = defineStore('userSessions', {
       }
     },
 
+    async loadMoreSessions() {
+      const auth = useAuthStore();
+      if (!auth.isAuthenticated || !this.nextCursor || this.loadingMore) {
+        return;
+      }
+      this.loadingMore = true;
+      try {
+        const res = await axios.post("/chat/allSessions", { user_id: auth.token, cursor: this.nextCursor });
+        // A session updated since the last page may already be listed
+        const known = new Set(this.sessions.map(s => s.session_id));
+        this.sessions.push(...res.data.filter((s: SessionInfo) => !known.has(s.session_id)));
+        this.nextCursor = res.headers["x-next-cursor"] ?? null;
+        this.saveToStorage();
+      } catch (error) {
+        console.error("Failed to fetch sessions:", error);
+      } finally {
+        this.loadingMore = false;
+      }
+    },
+
     updateSession(session_id: string, title: string) {
       const index = this.sessions.findIndex(s => s.session_id === session_id);
       const now = new Date().toISOString();
@@ -129,6 +153,7 @@ export const useUserSessionsStore = defineStore('userSessions', {
       const data = {
         sessions: this.sessions,
         currentSessionId: this.currentSessionId,
+        nextCursor: this.nextCursor,
       };
 
       localStorage.setItem('user_sessions_data', JSON.stringify(data));
@@ -138,6 +163,7 @@ export const useUserSessionsStore = defineStore('userSessions', {
       if (typeof window === 'undefined') return;
       this.sessions = [];
       this.currentSessionId = null;
+      this.nextCursor = null;
       localStorage.removeItem('user_sessions_data');
     },
   },